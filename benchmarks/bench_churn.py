@@ -0,0 +1,105 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Check that adding and removing devices does not leak memory or timers.
+
+Devices are added and removed in a running event loop while a small window of
+them stays alive. If removal releases everything, then the memory, the number
+of timers in the loop and the size of the fleet stay flat.
+
+Run from the root of the repository with::
+
+    python -m benchmarks.bench_churn
+"""
+
+import argparse
+import asyncio
+from collections import deque
+import gc
+import os
+import resource
+from datetime import timedelta
+from openfmbsim.devices.fleet import DeviceFleet
+from openfmbsim.devices.single_phase_meter import SinglePhaseMeter
+from openfmbsim.scheduler import TickScheduler
+from openfmbsim.simulated_system import SimulatedSystem
+
+
+def rss_kb() -> int:
+    """Get the resident memory of this process in kilobytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        # This is the peak rather than the present size
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def churn(loop, cycles: int, window: int, checkpoints: int):
+    """Add and remove devices, printing the resources at each checkpoint.
+
+    :param loop: The running event loop.
+    :param cycles: The number of devices to add and remove.
+    :param window: The number of devices that are alive at any time.
+    :param checkpoints: The number of times to print the resources.
+    """
+    scheduler = TickScheduler(loop, tick=timedelta(milliseconds=10))
+    system = SimulatedSystem(scheduler=scheduler)
+    system.subscribe(lambda profile: None)
+    fleet = DeviceFleet()
+    alive = deque()
+
+    every = max(1, cycles // checkpoints)
+    for cycle in range(1, cycles + 1):
+        alive.append(system.add_model(SinglePhaseMeter(fleet=fleet)))
+        if len(alive) > window:
+            system.remove_model(alive.popleft())
+
+        if cycle % 100 == 0:
+            # Let the devices publish so that they hold timers and buffers
+            await asyncio.sleep(0)
+        if cycle % every == 0:
+            gc.collect()
+            print("cycle={0:7d}  rss={1:7d}kB  loop timers={2:3d}  "
+                  "scheduled={3:4d}  fleet={4:4d}  fleet capacity={5:5d}"
+                  .format(cycle, rss_kb(), len(loop._scheduled),
+                          len(scheduler), len(fleet), fleet.capacity))
+
+    while alive:
+        system.remove_model(alive.popleft())
+    system.dispose()
+    gc.collect()
+    print("after removing all devices: loop timers={0}  scheduled={1}  "
+          "fleet={2}  tick callbacks={3}"
+          .format(len(loop._scheduled), len(scheduler), len(fleet),
+                  len(scheduler._tick_callbacks)))
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=100000)
+    parser.add_argument("--window", type=int, default=100)
+    parser.add_argument("--checkpoints", type=int, default=10)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(
+        churn(loop, args.cycles, args.window, args.checkpoints))
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measure the time to route a control profile as the number of devices grows.
+
+Run from the root of the repository with::
+
+    python -m benchmarks.bench_control
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from openfmbsim.scheduler import TickScheduler
+from openfmbsim.simulated_system import SimulatedSystem
+import generationmodule_pb2 as gm
+
+
+class ControlledModel():
+    """A model that only counts the control profiles it receives."""
+
+    def __init__(self):
+        """Create the model with a new MRID."""
+        self.mrid = uuid.uuid4()
+        self.controls = 0
+
+    def to_profiles(self):
+        """Get all of the profiles that this generates."""
+        return []
+
+    def update_profile(self, profile):
+        """Count the control profile."""
+        self.controls += 1
+
+
+def linear_scan(system, device_mrid, profile):
+    """Route the profile by searching all devices, as we did before."""
+    mrid = uuid.UUID(device_mrid)
+    device = next((x for x in system.devices if x.device_mrid == mrid), None)
+    device.update_profile(profile)
+
+
+def measure(route, system, mrids: list, iterations: int) -> float:
+    """Measure the mean time to route a control profile.
+
+    :param route: The function that routes the profile.
+    :param system: The system with the devices.
+    :param mrids: The MRIDs of the equipment to send controls to.
+    :param iterations: The number of controls to send.
+    :return: The mean time in microseconds.
+    """
+    profile = gm.GenerationControlProfile()
+    targets = [random.choice(mrids) for _ in range(iterations)]
+    start = time.perf_counter()
+    for device_mrid in targets:
+        route(system, device_mrid, profile)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    for count in (100, 1000, 10000):
+        # The loop never runs, so the devices never publish
+        system = SimulatedSystem(scheduler=TickScheduler(loop))
+        mrids = []
+        for _ in range(count):
+            model = ControlledModel()
+            system.add_model(model)
+            mrids.append(str(model.mrid))
+
+        indexed = measure(lambda s, m, p: s.update_profile(m, p), system,
+                          mrids, args.iterations)
+        scanned = measure(linear_scan, system, mrids, args.iterations)
+        print("devices={0:6d}  index={1:8.2f}us  linear scan={2:9.2f}us"
+              .format(count, indexed, scanned))
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compare the cost of delivering a message with Rx subjects and directly.
+
+Before the dispatcher, each message went through the subject of the device,
+a closure in the system and then one subject per subscriber. Now the device
+hands each list of messages to the dispatcher of the system, which calls the
+sinks directly.
+
+Run from the root of the repository with::
+
+    python -m benchmarks.bench_dispatch
+"""
+
+import argparse
+import time
+import rx
+from openfmbsim.dispatcher import Dispatcher
+
+
+class RxRelay():
+    """The chain of subjects that we used to deliver messages."""
+
+    def __init__(self, sinks: list):
+        """Create the chain, with one subject per sink.
+
+        :param sinks: The functions to deliver to.
+        """
+        self.device_subject = rx.subjects.Subject()
+        self.subjects = []
+        for sink in sinks:
+            subject = rx.subjects.Subject()
+            subject.subscribe(sink)
+            self.subjects.append(subject)
+
+        def publish(message):
+            for subject in self.subjects:
+                subject.on_next(message)
+        self.device_subject.subscribe(publish)
+
+    def publish_batch(self, messages: list):
+        """Deliver the messages of one device publish."""
+        for message in messages:
+            self.device_subject.on_next(message)
+
+
+class DirectRelay():
+    """The dispatchers of the device and system, as they are now."""
+
+    def __init__(self, sinks: list):
+        """Create the dispatchers.
+
+        :param sinks: The functions to deliver to.
+        """
+        self.device = Dispatcher()
+        system = Dispatcher()
+        for sink in sinks:
+            system.subscribe(sink)
+        self.device.subscribe_batch(system.publish_batch)
+
+    def publish_batch(self, messages: list):
+        """Deliver the messages of one device publish."""
+        self.device.publish_batch(messages)
+
+
+def measure(relay, per_publish: int, iterations: int) -> float:
+    """Measure the mean time to deliver one message to all sinks.
+
+    :param relay: The relay to deliver with.
+    :param per_publish: The number of messages in each device publish.
+    :param iterations: The number of device publishes.
+    :return: The mean time in microseconds.
+    """
+    messages = [object() for _ in range(per_publish)]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        relay.publish_batch(messages)
+    return (time.perf_counter() - start) / (iterations * per_publish) * 1e6
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50000)
+    args = parser.parse_args()
+
+    for count in (1, 2, 4):
+        for per_publish in (1, 3):
+            sinks = [lambda message: None for _ in range(count)]
+            rx_time = measure(RxRelay(sinks), per_publish, args.iterations)
+            direct = measure(DirectRelay(sinks), per_publish,
+                             args.iterations)
+            print("sinks={0}  messages/publish={1}  rx={2:6.2f}us  "
+                  "dispatcher={3:6.2f}us  speedup={4:5.1f}x"
+                  .format(count, per_publish, rx_time, direct,
+                          rx_time / direct))
+
+
+if __name__ == "__main__":
+    main()
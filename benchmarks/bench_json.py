@@ -0,0 +1,62 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compare the JSON encoder with MessageToJson for each profile.
+
+Run from the root of the repository with::
+
+    python -m benchmarks.bench_json
+"""
+
+import argparse
+import time
+from google.protobuf.json_format import MessageToJson
+from openfmbsim.devices.device_types import DEVICE_TYPES
+from openfmbsim.json_encoder import JsonEncoder
+
+
+def measure(encode, profile, iterations: int) -> float:
+    """Measure how many times per second a profile is encoded.
+
+    :param encode: The function that encodes the profile.
+    :param profile: The profile to encode.
+    :param iterations: The number of times to encode the profile.
+    :return: The number of profiles per second.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encode(profile)
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    encoder = JsonEncoder()
+    for name, device_type in sorted(DEVICE_TYPES.items()):
+        for profile in device_type().to_profiles():
+            reflection = measure(MessageToJson, profile, args.iterations)
+            indented = measure(lambda p: encoder.encode(p, indent=2),
+                               profile, args.iterations)
+            compact = measure(encoder.encode, profile, args.iterations)
+            print("{0:24}  MessageToJson={1:7.0f}/s  indented={2:7.0f}/s"
+                  "  compact={3:7.0f}/s  speedup={4:5.2f}x".format(
+                      profile.DESCRIPTOR.name, reflection, indented,
+                      compact, compact / reflection))
+
+
+if __name__ == "__main__":
+    main()
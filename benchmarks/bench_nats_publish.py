@@ -0,0 +1,126 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compare publishing through the drain queue with a task per message.
+
+Run from the root of the repository with::
+
+    python -m benchmarks.bench_nats_publish
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from openfmbsim.devices.single_phase_breaker import SinglePhaseBreaker
+from openfmbsim.envelope import Envelope
+from openfmbsim.nats_server import NatsPublisher, profile_to_subject
+from openfmbsim.simulated_system import SimulatedSystem
+
+
+class CountingNats():
+    """A NATS client that only counts what is published."""
+
+    def __init__(self):
+        """Create the client with nothing published."""
+        self.count = 0
+
+    async def connect(self, servers, loop):
+        """Connect to the server."""
+
+    async def publish(self, subject, payload):
+        """Count the message."""
+        self.count += 1
+
+    async def flush(self):
+        """Flush the connection."""
+
+    async def close(self):
+        """Close the connection."""
+
+
+def publish_with_tasks(nats, envelope):
+    """Publish the way that we did before the drain queue."""
+    @asyncio.coroutine
+    def publish(device_mrid, profile):
+        subject = profile_to_subject(str(device_mrid), profile)
+        yield from nats.publish(subject, profile.SerializeToString())
+
+    def callback():
+        asyncio.ensure_future(publish(envelope[0], envelope[2]))
+    asyncio.get_event_loop().call_soon(callback)
+
+
+def measure(use_queue: bool, envelopes: list, count: int) -> float:
+    """Measure how many messages per second are published.
+
+    :param use_queue: If true, then publish through the NatsPublisher.
+    :param envelopes: The envelopes to publish in each tick.
+    :param count: The total number of messages to publish.
+    :return: The number of messages per second.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    nats = CountingNats()
+    publisher = NatsPublisher([], SimulatedSystem(), loop, nats,
+                              queue_size=count)
+    loop.run_until_complete(publisher.start())
+
+    async def run():
+        sent = 0
+        while sent < count:
+            # Much like a scheduler tick, many devices publish at once
+            for envelope in envelopes:
+                if use_queue:
+                    # A new envelope, so that the profile is encoded again
+                    publisher.publish_async(Envelope(*envelope))
+                else:
+                    publish_with_tasks(nats, envelope)
+            sent += len(envelopes)
+            await asyncio.sleep(0)
+        while nats.count < sent:
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    loop.run_until_complete(run())
+    elapsed = time.perf_counter() - start
+    loop.run_until_complete(publisher.close())
+    loop.close()
+    return nats.count / elapsed
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=100000)
+    args = parser.parse_args()
+
+    readings = []
+    statuses = []
+    for _ in range(args.devices):
+        reading, status = SinglePhaseBreaker().to_profiles()
+        readings.append(Envelope(uuid.uuid4(), None, reading))
+        statuses.append(Envelope(uuid.uuid4(), None, status))
+
+    # Encoding dominates for the large readings, while the small status
+    # profiles show the cost of the publishing itself.
+    for name, envelopes in (("readings", readings), ("status", statuses)):
+        tasks = measure(False, envelopes, args.messages)
+        queue = measure(True, envelopes, args.messages)
+        print("{0:8}  task per message={1:9.0f}/s  drain queue={2:9.0f}/s  "
+              "speedup={3:5.2f}x".format(name, tasks, queue, queue / tasks))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measure the cost of generating profiles from prebuilt templates.
+
+Run from the root of the repository with::
+
+    python -m benchmarks.bench_profiles
+"""
+
+import argparse
+import time
+from openfmbsim.devices.device_types import DEVICE_TYPES
+
+
+def measure(model, iterations: int, rebuild: bool) -> float:
+    """Measure how many profiles per second a model generates.
+
+    :param model: The model to generate profiles from.
+    :param iterations: The number of times to generate the profiles.
+    :param rebuild: If the templates should be built again for every call,
+                    which is how profiles were generated before templates.
+    :return: The number of profiles per second.
+    """
+    count = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if rebuild:
+            model._templates = None
+        for profile in model.to_profiles():
+            profile.SerializeToString()
+            count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    for name, device_type in sorted(DEVICE_TYPES.items()):
+        model = device_type()
+        rebuilt = measure(model, args.iterations, True)
+        reused = measure(model, args.iterations, False)
+        print("{0:10}  rebuilt={1:9.0f}/s  templates={2:9.0f}/s  "
+              "speedup={3:5.2f}x".format(name, rebuilt, reused,
+                                         reused / rebuilt))
+
+
+if __name__ == "__main__":
+    main()
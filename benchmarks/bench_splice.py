@@ -0,0 +1,78 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compare the splice encoder with serializing the whole profile.
+
+Run from the root of the repository with::
+
+    python -m benchmarks.bench_splice
+"""
+
+import argparse
+from datetime import datetime
+import time
+import uuid
+from openfmbsim.devices.device_types import DEVICE_TYPES
+from openfmbsim.simulated_device import write_ied_info, write_message_info
+from openfmbsim.splice_encoder import SpliceEncoder
+
+
+def measure(encode, profiles, iterations: int) -> float:
+    """Measure how many profiles per second are encoded.
+
+    :param encode: The function that encodes a profile.
+    :param profiles: The profiles to encode.
+    :param iterations: The number of times to encode the profiles.
+    :return: The number of profiles per second.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for profile in profiles:
+            encode(profile)
+    return iterations * len(profiles) / (time.perf_counter() - start)
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, device_type in sorted(DEVICE_TYPES.items()):
+        device_mrid = str(uuid.uuid4())
+        profiles = list(device_type().to_profiles())
+        for profile in profiles:
+            if hasattr(profile, "readingMessageInfo"):
+                write_message_info(profile.readingMessageInfo.messageInfo,
+                                   uuid.uuid4(), datetime.utcnow())
+                write_ied_info(profile.ied, device_mrid)
+
+        # Check that the results are the same before we time them
+        encoder = SpliceEncoder(check=True)
+        for profile in profiles:
+            encoder.encode(device_mrid, profile)
+            encoder.encode(device_mrid, profile)
+        assert encoder.mismatches == 0
+
+        encoder = SpliceEncoder()
+        serialized = measure(lambda p: p.SerializeToString(), profiles,
+                             args.iterations)
+        spliced = measure(lambda p: encoder.encode(device_mrid, p), profiles,
+                          args.iterations)
+        print("{0:10}  serialize={1:9.0f}/s  splice={2:9.0f}/s  "
+              "speedup={3:5.2f}x".format(name, serialized, spliced,
+                                         spliced / serialized))
+
+
+if __name__ == "__main__":
+    main()
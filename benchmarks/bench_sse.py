@@ -0,0 +1,127 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measure the bytes and chunks per second of the SSE stream for a fleet.
+
+The devices publish at one reading per second, spread over the second as
+the scheduler does. We compare one chunk per profile, as we used to send,
+with a chunk for everything waiting, a capped rate, a compressed stream and
+only the fields that changed.
+
+Run from the root of the repository with::
+
+    python -m benchmarks.bench_sse
+"""
+
+import argparse
+import asyncio
+from openfmbsim.delta import delta_item, DeltaEncoder
+from openfmbsim.devices.single_phase_generator import SinglePhaseGenerator
+from openfmbsim.envelope import Envelope
+from openfmbsim.sse_client import json_data, SseClient
+from openfmbsim.web_server import event_chunks, ServerSentEvent
+
+
+async def publish(client, models: list, ticks_per_second: int):
+    """Publish each model once per second until canceled.
+
+    :param client: The client to put the readings into.
+    :param models: The models to publish.
+    :param ticks_per_second: The number of batches each second.
+    """
+    loop = asyncio.get_event_loop()
+    per_tick = max(1, len(models) // ticks_per_second)
+    index = 0
+    while True:
+        started = loop.time()
+        for model in models[index:index + per_tick]:
+            for profile in model.to_profiles():
+                client.put(Envelope(model.mrid, None, profile))
+        index = (index + per_tick) % len(models)
+        next_tick = started + 1.0 / ticks_per_second
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+
+async def per_profile_chunks(client):
+    """Get one chunk per profile, as we did before batching."""
+    while True:
+        batch = await client.get_batch(1)
+        if not batch:
+            return
+        yield ServerSentEvent(batch[0]).encode()
+
+
+async def measure(models: list, duration: float, chunks,
+                  encode=json_data) -> tuple:
+    """Measure the stream of one client.
+
+    :param models: The models that publish.
+    :param duration: The number of seconds to measure for.
+    :param chunks: The function that gets the chunks for the client.
+    :param encode: The function that gets the data for the client.
+    :return: Tuple of the bytes, chunks and profiles per second.
+    """
+    client = SseClient(encode=encode)
+    producer = asyncio.ensure_future(publish(client, models, 20))
+    sent = 0
+    count = 0
+
+    async def consume():
+        nonlocal sent, count
+        async for chunk in chunks(client):
+            sent += len(chunk)
+            count += 1
+            # Let the producer run, as writing to the socket would
+            await asyncio.sleep(0)
+
+    consumer = asyncio.ensure_future(consume())
+    await asyncio.sleep(duration)
+    producer.cancel()
+    client.close()
+    await asyncio.gather(producer, consumer, return_exceptions=True)
+    return sent / duration, count / duration, client.sent / duration
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--duration", type=float, default=3.0)
+    args = parser.parse_args()
+
+    models = [SinglePhaseGenerator() for _ in range(args.devices)]
+    modes = [
+        ("one chunk per profile", per_profile_chunks),
+        ("chunk per batch", lambda c: event_chunks(c)),
+        ("maxHz=5", lambda c: event_chunks(c, interval=0.2)),
+        ("maxHz=5 gzip", lambda c: event_chunks(c, interval=0.2,
+                                                gzip=True)),
+        ("maxHz=5 delta", lambda c: event_chunks(c, interval=0.2,
+                                                 delta=DeltaEncoder()),
+         delta_item),
+        ("maxHz=5 delta gzip", lambda c: event_chunks(
+            c, interval=0.2, gzip=True, delta=DeltaEncoder()), delta_item),
+    ]
+
+    loop = asyncio.get_event_loop()
+    print("devices={0}".format(args.devices))
+    for name, chunks, *encode in modes:
+        rate, chunk_rate, profile_rate = loop.run_until_complete(
+            measure(models, args.duration, chunks, *encode))
+        print("{0:22s} {1:10.0f} bytes/s {2:8.1f} chunks/s "
+              "{3:8.0f} profiles/s"
+              .format(name, rate, chunk_rate, profile_rate))
+
+
+if __name__ == "__main__":
+    main()
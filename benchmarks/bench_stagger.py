@@ -0,0 +1,103 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measure the size of publish bursts with and without phase staggering.
+
+Run from the root of the repository with::
+
+    python -m benchmarks.bench_stagger
+"""
+
+import argparse
+import asyncio
+import uuid
+from openfmbsim.scheduler import TickScheduler
+from openfmbsim.simulated_system import SimulatedSystem
+
+
+class QuietModel():
+    """A model that does not generate any profiles."""
+
+    def __init__(self):
+        """Create the model with the MRID that the system indexes."""
+        self.mrid = uuid.uuid4()
+
+    def to_profiles(self):
+        """Get all of the profiles that this generates."""
+        return []
+
+
+class RecordingScheduler(TickScheduler):
+    """Scheduler that records the number of devices published per slot."""
+
+    def __init__(self, event_loop):
+        """Create the scheduler with an empty record."""
+        super().__init__(event_loop)
+        self.batches = []
+
+    def _run_slot(self, index):
+        """Run the slot and record the size of the batch."""
+        super()._run_slot(index)
+        self.batches.append(self.last_batch)
+
+
+def measure(count: int, stagger: bool, duration: float) -> dict:
+    """Measure the publish bursts for a number of devices.
+
+    :param count: The number of devices to create in one go.
+    :param stagger: If the system should stagger the first publish.
+    :param duration: How long in seconds to run for.
+    :return: The burst statistics.
+    """
+    loop = asyncio.new_event_loop()
+    scheduler = RecordingScheduler(loop)
+    system = SimulatedSystem(scheduler=scheduler, stagger=stagger)
+
+    async def run():
+        # Add the devices in small groups, much like a stream of requests
+        # to the web server would.
+        for i in range(count):
+            system.add_model(QuietModel())
+            if i % 50 == 0:
+                await asyncio.sleep(0)
+        await asyncio.sleep(duration)
+
+    loop.run_until_complete(run())
+    loop.close()
+
+    # Skip the first second while devices start
+    per_second = int(1 / scheduler.tick)
+    batches = scheduler.batches[per_second:]
+    return {
+        "max": max(batches),
+        "mean": sum(batches) / len(batches),
+        "busy": sum(1 for b in batches if b) / len(batches),
+    }
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--duration", type=float, default=4.0)
+    args = parser.parse_args()
+
+    for stagger in (False, True):
+        result = measure(args.devices, stagger, args.duration)
+        print("stagger={0!s:5}  max burst={1:6d}  mean per tick={2:8.1f}"
+              "  busy ticks={3:5.0%}".format(stagger, result["max"],
+                                             result["mean"], result["busy"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Pipeline that decodes and applies control profiles from controllers."""
+
+import asyncio
+import logging
+from google.protobuf.message import DecodeError
+from .outbound import OutboundQueue, OverflowPolicy
+
+LOGGER = logging.getLogger(__name__)
+
+
+def decode_batch(batch: list) -> list:
+    """Decode a batch of control messages.
+
+    This does not touch the system, so may run in another thread.
+
+    :param batch: List of tuples of the protobuf class, subject and data.
+    :return: List of tuples of the MRID of the conducting equipment and the
+             profile, which is none if the data could not be decoded.
+    """
+    decoded = []
+    for model, subject, data in batch:
+        # The last part of the subject is the MRID of the conducting
+        # equipment, so extract that value.
+        device_mrid = subject.split(".")[-1]
+        try:
+            profile = model()
+            profile.ParseFromString(data)
+        except (DecodeError, TypeError):
+            LOGGER.warning("Unable to decode '%s' on '%s'", model, subject)
+            profile = None
+        decoded.append((device_mrid, profile))
+    return decoded
+
+
+class ControlPipeline(object):
+    """Decodes and applies control profiles without blocking publishing.
+
+    Control messages are put into a bounded queue as they arrive, without
+    being decoded. A newer message for the same device and type of profile
+    replaces one that is waiting, since only the latest control matters. A
+    single drain task decodes the messages in batches, optionally in a
+    thread pool, and applies them to the system, yielding to the event loop
+    between batches so that a storm of controls cannot starve the devices.
+    """
+
+    def __init__(self, system, event_loop, capacity: int = 1000,
+                 executor=None, batch_size: int = 100, tracer=None):
+        """Create the pipeline.
+
+        :param system: The system that we apply the controls to.
+        :param event_loop: The event loop for the asyncio.
+        :param capacity: The maximum number of control messages waiting. When
+                         full, the oldest waiting message is dropped.
+        :param executor: If not none, the executor, such as a thread pool,
+                         that decodes the messages. Otherwise we decode on
+                         the event loop.
+        :param batch_size: The maximum number of messages to apply before we
+                           yield to the event loop.
+        :param tracer: If not none, the LatencyTracer that we tell when each
+                       control is applied or rejected.
+        """
+        self.system = system
+        self.event_loop = event_loop
+        self.executor = executor
+        self.batch_size = batch_size
+        self.tracer = tracer
+        self.queue = OutboundQueue(capacity, event_loop,
+                                   OverflowPolicy.CONFLATE)
+        self._drain_task = None
+
+        self.received = 0
+        self.applied = 0
+        self.rejected = 0
+
+        self.system.add_stats_source("control", self.stats)
+
+    def stats(self) -> dict:
+        """Get the counters that describe the load of controls."""
+        queue = self.queue
+        return {
+            "depth": len(queue),
+            "capacity": queue.capacity,
+            "highWater": queue.high_water,
+            "received": self.received,
+            "coalesced": queue.conflated,
+            "dropped": queue.dropped,
+            "applied": self.applied,
+            "rejected": self.rejected,
+        }
+
+    def submit(self, model, subject: str, data: bytes):
+        """Queue a control message to be decoded and applied.
+
+        :param model: Constructor for the protobuf object to decode the data.
+        :param subject: The subject that the message was received on, which
+                        identifies the device and type of profile.
+        :param data: The encoded profile.
+        """
+        self.received += 1
+        self.queue.put_nowait((model, subject, data), subject)
+
+    def start(self):
+        """Start applying the control messages."""
+        if self._drain_task is None:
+            self._drain_task = self.event_loop.create_task(self.drain())
+
+    def close(self):
+        """Stop applying control messages, dropping those that wait."""
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+            self._drain_task = None
+        self.queue.close()
+
+    async def drain(self):
+        """Decode and apply control messages until we are closed."""
+        while True:
+            batch = await self.queue.get_batch(self.batch_size)
+            if not batch:
+                return
+
+            if self.executor is None:
+                decoded = decode_batch(batch)
+            else:
+                decoded = await self.event_loop.run_in_executor(
+                    self.executor, decode_batch, batch)
+            self.apply(decoded)
+
+            # Let the devices publish between batches
+            await asyncio.sleep(0)
+
+    def apply(self, decoded: list):
+        """Apply decoded control profiles to the system.
+
+        :param decoded: List of tuples of the MRID of the conducting
+                        equipment and the profile, or none if the profile
+                        could not be decoded.
+        """
+        update_profile = self.system.update_profile
+        tracer = self.tracer
+        for device_mrid, profile in decoded:
+            if profile is not None and update_profile(device_mrid, profile):
+                self.applied += 1
+                if tracer is not None:
+                    tracer.applied(device_mrid)
+            else:
+                self.rejected += 1
+                if tracer is not None:
+                    tracer.rejected(device_mrid)
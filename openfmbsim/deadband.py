@@ -0,0 +1,119 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Report by exception, so that steady readings are not published."""
+
+from collections import namedtuple
+
+# The names of the measurements with a deadband, as in the MMXU values of
+# the models
+MEASUREMENTS = ("W", "V", "A", "Hz")
+
+
+class Deadband(namedtuple("Deadband", ["w", "v", "a", "hz"])):
+    """How far each measurement may move before the reading is published.
+
+    A reading is published when any measurement moves further than its
+    deadband from the value that was last published. A deadband of zero
+    publishes any change.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, w: float = 0.0, v: float = 0.0, a: float = 0.0,
+                hz: float = 0.0):
+        """Create the deadbands.
+
+        :param w: The deadband of the real power in watts.
+        :param v: The deadband of the phase voltage in volts.
+        :param a: The deadband of the current in amps.
+        :param hz: The deadband of the frequency in hertz.
+        """
+        return super().__new__(cls, w, v, a, hz)
+
+    @classmethod
+    def from_dict(cls, values: dict):
+        """Create the deadbands from a dict by the name of the measurement.
+
+        :param values: The deadband of each measurement in MEASUREMENTS.
+                       Measurements that are missing have a deadband of zero.
+        :return: The deadbands.
+        :raises ValueError: If a name is not known or a deadband is not a
+                            number that is not negative.
+        """
+        if not isinstance(values, dict):
+            raise ValueError("Deadband must be an object")
+        unknown = [name for name in values if name not in MEASUREMENTS]
+        if unknown:
+            raise ValueError("Unknown measurements {0}".format(
+                ", ".join(unknown)))
+
+        deadbands = []
+        for name in MEASUREMENTS:
+            value = values.get(name, 0.0)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError("Deadband of {0} must be a number"
+                                 .format(name))
+            if value < 0:
+                raise ValueError("Deadband of {0} must not be negative"
+                                 .format(name))
+            deadbands.append(float(value))
+        return cls(*deadbands)
+
+
+class ExceptionReporter(object):
+    """Decides whether a device publishes its reading.
+
+    Each device has its own reporter, which remembers the measurements that
+    were last published.
+    """
+
+    __slots__ = ("deadband", "integrity", "_last", "_next_integrity")
+
+    def __init__(self, deadband: Deadband, integrity: float = None):
+        """Create the reporter, which publishes the first reading.
+
+        :param deadband: The deadbands of the measurements.
+        :param integrity: If not none, the seconds after which we publish
+                          the reading even if nothing moved, so that the
+                          energy totals and timestamps stay fresh.
+        """
+        self.deadband = deadband
+        self.integrity = integrity
+        self._last = None
+        self._next_integrity = None
+
+    def due(self, values: dict, now: float) -> bool:
+        """Get whether the reading should be published.
+
+        If so, then the measurements are remembered as those published.
+
+        :param values: The present MMXU values of the model.
+        :param now: The present event loop time.
+        :return: True if the reading should be published.
+        """
+        current = tuple(values[name] for name in MEASUREMENTS)
+        last = self._last
+        if last is not None:
+            next_integrity = self._next_integrity
+            expired = next_integrity is not None and now >= next_integrity
+            moved = any(abs(value - previous) > deadband
+                        for value, previous, deadband
+                        in zip(current, last, self.deadband))
+            if not expired and not moved:
+                return False
+
+        self._last = current
+        if self.integrity is not None:
+            self._next_integrity = now + self.integrity
+        return True
@@ -0,0 +1,185 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Send only the fields of profiles that changed since they were sent."""
+
+import json
+
+_MISSING = object()
+
+
+def diff(old: dict, new: dict) -> dict:
+    """Get the fields that changed between two versions of a profile.
+
+    Nested objects are compared field by field. Lists that keep their length,
+    such as the readings of each phase of a breaker, are compared item by
+    item, and the changes are an object from the index of each item that
+    changed to its changes. A list that changed length is replaced in full.
+    A field that was removed is none, which is null in the JSON. Fields are
+    removed when they change to zero, since the JSON of a profile omits
+    fields that are zero.
+
+    :param old: The dict of the profile that was sent.
+    :param new: The dict of the profile to send.
+    :return: The changed fields, which are empty if nothing changed.
+    """
+    changes = {}
+    for name, value in new.items():
+        change = diff_value(old.get(name, _MISSING), value)
+        if change is not _MISSING:
+            changes[name] = change
+
+    for name in old:
+        if name not in new:
+            changes[name] = None
+    return changes
+
+
+def diff_value(previous, value):
+    """Get the change to one field or item of a list.
+
+    :param previous: The value that was sent, or _MISSING if there was none.
+    :param value: The value to send.
+    :return: The change, or _MISSING if the value did not change.
+    """
+    if isinstance(value, dict) and isinstance(previous, dict):
+        nested = diff(previous, value)
+    elif isinstance(value, list) and is_same_length(previous, value):
+        nested = diff_list(previous, value)
+    elif previous != value:
+        return value
+    else:
+        return _MISSING
+    return nested if nested else _MISSING
+
+
+def is_same_length(previous, value: list) -> bool:
+    """Check whether the value that was sent is a list of the same length."""
+    return isinstance(previous, list) and len(previous) == len(value)
+
+
+def diff_list(old: list, new: list) -> dict:
+    """Get the items that changed between two lists of the same length.
+
+    :param old: The list that was sent.
+    :param new: The list to send.
+    :return: The changes of each item that changed by its index as a string,
+             since the keys of a JSON object are strings.
+    """
+    changes = {}
+    for index, (previous, value) in enumerate(zip(old, new)):
+        change = diff_value(previous, value)
+        if change is not _MISSING:
+            changes[str(index)] = change
+    return changes
+
+
+def apply(base: dict, changes: dict) -> dict:
+    """Apply changes from diff to a copy of a profile.
+
+    This is what the browser does to keep the profiles up to date.
+
+    :param base: The dict of the profile that was sent before.
+    :param changes: The changes from diff.
+    :return: The dict of the profile with the changes.
+    """
+    result = dict(base)
+    for name, value in changes.items():
+        if value is None:
+            result.pop(name, None)
+        else:
+            result[name] = apply_value(result.get(name), value)
+    return result
+
+
+def apply_value(previous, value):
+    """Apply the change to one field or item of a list.
+
+    :param previous: The value that was sent before, or none.
+    :param value: The change from diff, which is not none.
+    :return: The new value.
+    """
+    if isinstance(value, dict) and isinstance(previous, dict):
+        return apply(previous, value)
+    if isinstance(value, dict) and isinstance(previous, list):
+        result = list(previous)
+        for index, change in value.items():
+            result[int(index)] = apply_value(result[int(index)], change)
+        return result
+    return value
+
+
+def delta_item(envelope) -> tuple:
+    """Get what a delta client holds for a profile until it is sent.
+
+    :param envelope: The envelope of the profile.
+    :return: Tuple of the MRID of the IED, the full name of the type of
+             profile and the dict of the profile.
+    """
+    return (envelope.device_mrid, envelope.profile.DESCRIPTOR.full_name,
+            envelope.data)
+
+
+class DeltaEncoder(object):
+    """The profiles that were last sent to one client.
+
+    The first profile of each type from a device is sent in full, and later
+    profiles only as the fields that changed. The messages are JSON objects
+    with the 'mode', which is 'full' or 'diff', the MRID of the 'ied', the
+    full name of the type of 'profile' and the 'data'.
+
+    We compare with what we last sent, rather than the last profile that
+    was published, so that profiles that were replaced before they were sent
+    do not leave the client out of date.
+    """
+
+    def __init__(self):
+        """Create the encoder, which has not sent anything yet."""
+        # The MRID of each IED to the last data sent for each type of profile
+        self._sent = {}
+
+    def __len__(self):
+        """Get the number of profiles that we remember."""
+        return sum(len(profiles) for profiles in self._sent.values())
+
+    def encode(self, item: tuple) -> str:
+        """Encode the message for a profile.
+
+        :param item: The tuple from delta_item.
+        :return: The JSON of the message, or none if nothing changed.
+        """
+        ied_mrid, profile_type, data = item
+        sent = self._sent.setdefault(ied_mrid, {})
+        previous = sent.get(profile_type)
+        sent[profile_type] = data
+
+        if previous is None:
+            mode, fields = "full", data
+        else:
+            mode, fields = "diff", diff(previous, data)
+            if not fields:
+                return None
+
+        return json.dumps({
+            "mode": mode,
+            "ied": str(ied_mrid),
+            "profile": profile_type,
+            "data": fields,
+        })
+
+    def forget(self, device_mrid):
+        """Release the profiles that were sent for a device.
+
+        :param device_mrid: The MRID of the device.
+        """
+        self._sent.pop(device_mrid, None)
@@ -40,7 +40,43 @@ class ConductingEquipment(object):
         self.last_update = datetime.utcnow()
         self.lock = threading.Lock()
 
+        self._templates = None
+
+        # Called without arguments when the status changes, such as when a
+        # breaker opens, so that the status can be published straight away
+        self.status_listener = None
+
     @property
     def device_mrid(self) -> uuid.UUID:
         """Get the ID of the underlying device."""
         return self.mrid
+
+    @property
+    def templates(self) -> tuple:
+        """Get the profile templates, creating them the first time.
+
+        The templates are the profiles that this equipment publishes with the
+        parts that never change already written. Each time we publish, we only
+        write the values that change into the same profiles.
+        """
+        if self._templates is None:
+            self._templates = self.create_templates()
+        return self._templates
+
+    def create_templates(self) -> tuple:
+        """Create the profile templates for this equipment."""
+        return ()
+
+    def status_changed(self):
+        """Tell the listener that the status of this equipment changed."""
+        listener = self.status_listener
+        if listener is not None:
+            listener()
+
+    def write_conducting_equipment(self, equipment):
+        """Write the identity of this equipment into the structure.
+
+        :param equipment: The conducting equipment structure of a profile.
+        """
+        equipment.mRID = str(self.mrid)
+        equipment.namedObject.name.value = self.name
@@ -0,0 +1,29 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Names of the types of device that can be created in the simulator."""
+
+from .single_phase_breaker import SinglePhaseBreaker
+from .single_phase_generator import SinglePhaseGenerator
+from .single_phase_meter import SinglePhaseMeter
+from .single_phase_recloser import SinglePhaseRecloser
+from .single_phase_solar import SinglePhaseSolar
+
+# The name that we use for each type, for example in the REST API.
+DEVICE_TYPES = {
+    "breaker": SinglePhaseBreaker,
+    "generator": SinglePhaseGenerator,
+    "meter": SinglePhaseMeter,
+    "recloser": SinglePhaseRecloser,
+    "solar": SinglePhaseSolar,
+}
@@ -0,0 +1,314 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Array backed state for a large number of simple devices."""
+
+from datetime import datetime
+import threading
+import uuid
+import weakref
+import numpy as np
+from .conducting_equipment import ConductingEquipment
+
+EPOCH = datetime(1970, 1, 1)
+
+_default_fleet = None
+
+
+def to_seconds(now: datetime) -> float:
+    """Convert the UTC time to seconds since the epoch."""
+    return (now - EPOCH).total_seconds()
+
+
+class DeviceFleet(object):
+    """Contiguous arrays with the electrical state of many devices.
+
+    Each device is a row in the arrays, so that we can integrate the energy
+    and calculate the current and complex power for all devices in one
+    vectorized step rather than one device at a time.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        """Create a new fleet.
+
+        :param capacity: The initial number of devices we have room for.
+        """
+        self.lock = threading.RLock()
+        self.size = 0
+        self._free = []
+        # The number of systems that call update once per tick. If there
+        # are none, then devices integrate their energy when it is read.
+        self.owners = 0
+
+        self.in_use = np.zeros(capacity, dtype=bool)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.ph_v = np.zeros(capacity)
+        self.w = np.zeros(capacity)
+        self.hz = np.zeros(capacity)
+        self.a = np.zeros(capacity)
+        self.va = np.zeros(capacity)
+        self.dmd_wh = np.zeros(capacity)
+        self.sup_wh = np.zeros(capacity)
+        self.last_update = np.zeros(capacity)
+
+    def __len__(self):
+        """Get the number of devices in the fleet."""
+        return self.size - len(self._free)
+
+    @property
+    def capacity(self) -> int:
+        """Get the number of devices we have room for without growing."""
+        return len(self.in_use)
+
+    def allocate(self) -> int:
+        """Allocate a row for a new device.
+
+        :return: The index of the row.
+        """
+        with self.lock:
+            if self._free:
+                index = self._free.pop()
+            else:
+                if self.size == self.capacity:
+                    self._grow()
+                index = self.size
+                self.size += 1
+
+            self.in_use[index] = True
+            self.active[index] = True
+            return index
+
+    def release(self, index: int):
+        """Release the row of a device that no longer exists.
+
+        :param index: The index of the row.
+        """
+        with self.lock:
+            self.in_use[index] = False
+            self.active[index] = False
+            for values in self._columns():
+                values[index] = 0
+            self._free.append(index)
+
+    def update(self, now: datetime = None):
+        """Integrate the energy for all devices up to the present time.
+
+        This runs once per scheduler tick and is what advances the energy of
+        the devices, which publish the values from the last update rather
+        than integrating one at a time.
+
+        :param now: The present time in UTC.
+        """
+        now_s = to_seconds(now if now is not None else datetime.utcnow())
+        with self.lock:
+            n = self.size
+            w = self.w[:n]
+            ph_v = self.ph_v[:n]
+
+            duration = now_s - self.last_update[:n]
+            net = w * duration / 3600.0
+            net[~self.active[:n]] = 0
+            self.dmd_wh[:n] += np.where(net > 0, net, 0)
+            self.sup_wh[:n] += np.where(net > 0, 0, net)
+            self.last_update[:n] = now_s
+
+            np.divide(w, ph_v, out=self.a[:n], where=ph_v != 0)
+            self.a[:n][ph_v == 0] = 0
+            np.abs(w, out=self.va[:n])
+
+    def update_one(self, index: int, now: datetime):
+        """Integrate the energy for one device up to the present time.
+
+        This is only needed when the power of the device is about to change,
+        so that the energy so far is integrated at the old power.
+
+        :param index: The index of the device.
+        :param now: The present time in UTC.
+        """
+        now_s = to_seconds(now)
+        if self.active[index]:
+            duration = now_s - float(self.last_update[index])
+            net = float(self.w[index]) * duration / 3600.0
+            if net > 0:
+                self.dmd_wh[index] += net
+            else:
+                self.sup_wh[index] += net
+
+        self.last_update[index] = now_s
+
+    def set_power(self, index: int, ph_v: float, w: float):
+        """Set the voltage and real power, and derive the current and VA.
+
+        :param index: The index of the device.
+        :param ph_v: The phase voltage.
+        :param w: The real power.
+        """
+        self.ph_v[index] = ph_v
+        self.w[index] = w
+        self.a[index] = w / ph_v if ph_v != 0 else 0
+        self.va[index] = abs(w)
+
+    def _columns(self):
+        """Get all of the numeric columns."""
+        return [self.ph_v, self.w, self.hz, self.a, self.va, self.dmd_wh,
+                self.sup_wh, self.last_update]
+
+    def _grow(self):
+        """Double the capacity of all arrays."""
+        for name in ("in_use", "active", "ph_v", "w", "hz", "a", "va",
+                     "dmd_wh", "sup_wh", "last_update"):
+            values = getattr(self, name)
+            grown = np.zeros(len(values) * 2, dtype=values.dtype)
+            grown[:len(values)] = values
+            setattr(self, name, grown)
+
+
+def default_fleet() -> DeviceFleet:
+    """Get the fleet that devices join unless they are given a fleet."""
+    global _default_fleet
+    if _default_fleet is None:
+        _default_fleet = DeviceFleet()
+    return _default_fleet
+
+
+class FleetEquipment(ConductingEquipment):
+    """Conducting equipment whose electrical state is a row in a fleet.
+
+    The attributes of the equipment are views into the arrays of the fleet,
+    so reading and writing them behaves as if they were plain attributes.
+    The energy is integrated for the whole fleet by DeviceFleet.update, which
+    the system calls once per scheduler tick, so the profiles have the
+    energy as of the last tick. Equipment in a fleet that no system updates
+    integrates its own energy when the energy is read.
+    """
+
+    def __init__(self, cond_equipment_mrid: uuid.UUID = None,
+                 cond_equipment_name: str = None,
+                 fleet: DeviceFleet = None):
+        """Construct a new instance of this equipment.
+
+        :param cond_equipment_mrid: The MRID of the conducting unit.
+        :param cond_equipment_name: The name of the conducting unit.
+        :param fleet: The fleet that holds the state. If none, then join the
+                      default fleet.
+        """
+        self.fleet = fleet if fleet is not None else default_fleet()
+        self.index = self.fleet.allocate()
+        # Release the row if we are dropped without being disposed
+        self._release = weakref.finalize(self, self.fleet.release, self.index)
+
+        super().__init__(cond_equipment_mrid, cond_equipment_name)
+
+        # Share the lock so that we never race the vectorized update
+        self.lock = self.fleet.lock
+
+    def dispose(self):
+        """Release the row in the fleet for this equipment."""
+        self._release()
+
+    @property
+    def ph_v(self):
+        """Get the phase voltage."""
+        return self.fleet.ph_v.item(self.index)
+
+    @ph_v.setter
+    def ph_v(self, value):
+        """Set the phase voltage."""
+        self.fleet.set_power(self.index, value, self.w)
+
+    @property
+    def hz(self):
+        """Get the frequency."""
+        return self.fleet.hz.item(self.index)
+
+    @hz.setter
+    def hz(self, value):
+        """Set the frequency."""
+        self.fleet.hz[self.index] = value
+
+    @property
+    def dmd_wh(self):
+        """Get the energy demand."""
+        self._integrate_if_not_owned()
+        return self.fleet.dmd_wh.item(self.index)
+
+    @dmd_wh.setter
+    def dmd_wh(self, value):
+        """Set the energy demand."""
+        self.fleet.dmd_wh[self.index] = value
+
+    @property
+    def sup_wh(self):
+        """Get the energy supply."""
+        self._integrate_if_not_owned()
+        return self.fleet.sup_wh.item(self.index)
+
+    @sup_wh.setter
+    def sup_wh(self, value):
+        """Set the energy supply."""
+        self.fleet.sup_wh[self.index] = value
+
+    @property
+    def last_update(self) -> datetime:
+        """Get the time that the energy was last integrated."""
+        return datetime.utcfromtimestamp(
+            self.fleet.last_update.item(self.index))
+
+    @last_update.setter
+    def last_update(self, value: datetime):
+        """Set the time that the energy was last integrated."""
+        self.fleet.last_update[self.index] = to_seconds(value)
+
+    @property
+    def active(self) -> bool:
+        """Get if energy is flowing so the energy is integrated."""
+        return self.fleet.active.item(self.index)
+
+    @active.setter
+    def active(self, value: bool):
+        """Set if energy is flowing so the energy is integrated."""
+        self.fleet.active[self.index] = value
+
+    def update_mmtr(self, now):
+        """Update the present net energy values."""
+        self.fleet.update_one(self.index, now)
+
+    def _integrate_if_not_owned(self):
+        """Integrate the energy up to now if no system updates the fleet."""
+        if self.fleet.owners == 0:
+            now = datetime.utcnow()
+            with self.lock:
+                if to_seconds(now) > self.fleet.last_update.item(self.index):
+                    self.update_mmtr(now)
+
+    @property
+    def i_mag(self):
+        """Get the magnitude of the current."""
+        return self.fleet.a.item(self.index)
+
+    @property
+    def va(self):
+        """Get the complex power output."""
+        return self.fleet.va.item(self.index)
+
+    @property
+    def w(self):
+        """Get the real power output."""
+        return self.fleet.w.item(self.index)
+
+    @w.setter
+    def w(self, value):
+        """Set the real power set-point."""
+        with self.lock:
+            self.update_mmtr(datetime.utcnow())
+            self.fleet.set_power(self.index, self.ph_v, value)
@@ -15,7 +15,32 @@
 
 import commonmodule_pb2 as cm
 from datetime import datetime
-from ..message import write_timestamp
+from ..message import split_timestamp, write_time_quality
+
+# The phase A measurements as the name in the MMXU structure, the key in the
+# dict of values and the unit symbol.
+PHASE_A_MMXU_CMVS = [
+    ("A", "A", "UnitSymbolKind_Amp"),
+    ("PF", "PF", "UnitSymbolKind_none"),
+    ("PhV", "V", "UnitSymbolKind_V"),
+    ("VA", "VA", "UnitSymbolKind_VA"),
+    ("VAr", "VAr", "UnitSymbolKind_VAr"),
+    ("W", "W", "UnitSymbolKind_W"),
+]
+
+# The MMTR counters as the name in the MMTR structure, which is also the key
+# in the dict of values, and the unit symbol.
+MMTR_BCRS = [
+    ("DmdWh", "UnitSymbolKind_Wh"),
+    ("DmdVArh", "UnitSymbolKind_VArh"),
+    ("DmdVAh", "UnitSymbolKind_VAh"),
+    ("SupWh", "UnitSymbolKind_Wh"),
+    ("SupVArh", "UnitSymbolKind_VArh"),
+    ("SupVAh", "UnitSymbolKind_VAh"),
+    ("TotWh", "UnitSymbolKind_Wh"),
+    ("TotVArh", "UnitSymbolKind_VArh"),
+    ("TotVAh", "UnitSymbolKind_VAh"),
+]
 
 
 def set_phase_a_mmxu(mmxu, mmxu_dict: dict, now: datetime):
@@ -25,64 +50,81 @@ def set_phase_a_mmxu(mmxu, mmxu_dict: dict, now: datetime):
     :param mmxu_dict: Dict of MMXU values.
     :param now: The timestamp for the value.
     """
+    init_phase_a_mmxu(mmxu)
+    write_phase_a_mmxu(mmxu, mmxu_dict, now)
+
+
+def init_phase_a_mmxu(mmxu):
+    """Set the parts of the MMXU structure that never change.
+
+    These are the units, angles and time quality, so that a template only
+    needs write_phase_a_mmxu for each new reading.
+
+    :param mmxu: The MMXU structure to populate.
+    """
     sk = cm.UnitSymbolKind
-    set_cmvs([mmxu.A.phsA, mmxu.A.net], mmxu_dict["A"], 0,
-             sk.UnitSymbolKind_Amp, now)
+    for name, _, unit in PHASE_A_MMXU_CMVS:
+        measurement = getattr(mmxu, name)
+        for cmv in (measurement.phsA, measurement.net):
+            cmv.cVal.ang.f.value = 0
+            cmv.units.SIUnit = getattr(sk, unit)
+            write_time_quality(cmv.t.tq)
 
-    mmxu.Hz.mag.f.value = mmxu_dict["Hz"]
     mmxu.Hz.units.SIUnit = sk.UnitSymbolKind_Hz
 
-    set_cmvs([mmxu.PF.phsA, mmxu.PF.net], mmxu_dict["PF"], 0,
-             sk.UnitSymbolKind_none, now)
 
-    mmxu.PFSign.setVal = mmxu_dict["PFSign"]
+def write_phase_a_mmxu(mmxu, mmxu_dict: dict, now: datetime):
+    """Write the values that change into the MMXU structure.
 
-    set_cmvs([mmxu.PhV.phsA, mmxu.PhV.net], mmxu_dict["V"], 0,
-             sk.UnitSymbolKind_V, now)
-    set_cmvs([mmxu.VA.phsA, mmxu.VA.net], mmxu_dict["VA"], 0,
-             sk.UnitSymbolKind_VA, now)
-    set_cmvs([mmxu.VAr.phsA, mmxu.VAr.net], mmxu_dict["VAr"], 0,
-             sk.UnitSymbolKind_VAr, now)
-    set_cmvs([mmxu.W.phsA, mmxu.W.net], mmxu_dict["W"], 0,
-             sk.UnitSymbolKind_W, now)
+    :param mmxu: The MMXU structure that init_phase_a_mmxu populated.
+    :param mmxu_dict: Dict of MMXU values.
+    :param now: The timestamp for the value.
+    """
+    seconds, fraction = split_timestamp(now)
+    for name, key, _ in PHASE_A_MMXU_CMVS:
+        mag = mmxu_dict[key]
+        measurement = getattr(mmxu, name)
+        for cmv in (measurement.phsA, measurement.net):
+            cmv.cVal.mag.f.value = mag
+            cmv.t.seconds = seconds
+            cmv.t.fraction = fraction
+
+    mmxu.Hz.mag.f.value = mmxu_dict["Hz"]
+    mmxu.PFSign.setVal = mmxu_dict["PFSign"]
 
 
-def set_cmvs(cmvs, mag, ang, unit, now: datetime):
-    """Set the values in the specified CMV structures.
+def set_mmtr(mmtr, mmtr_dict: dict, now: datetime):
+    """Set the values in the MMTR structure.
 
-    :param mag: The value's magnitude.
-    :param ang: The value's angle.
-    :param unit: The value's unit.
+    :param mmtr: The MMTR structure to populate.
+    :param mmtr_dict: Dict of MMTR values.
     :param now: The timestamp for the value.
     """
-    for cmv in cmvs:
-        cmv.cVal.mag.f.value = mag
-        cmv.cVal.ang.f.value = ang
-        cmv.units.SIUnit = unit
-        write_timestamp(cmv.t, now)
+    init_mmtr(mmtr)
+    write_mmtr(mmtr, mmtr_dict, now)
 
 
-def set_cmv(cmv, mag, ang, unit, now: datetime):
-    """Set the values in the specified CMV structure.
+def init_mmtr(mmtr):
+    """Set the parts of the MMTR structure that never change.
 
-    :param mag: The value's magnitude.
-    :param ang: The value's angle.
-    :param unit: The value's unit.
-    :param now: The timestamp for the value.
+    :param mmtr: The MMTR structure to populate.
     """
-    cmv.cVal.mag.f.value = mag
-    cmv.cVal.ang.f.value = ang
-    cmv.units.SIUnit = unit
-    write_timestamp(cmv.t, now)
+    for name, unit in MMTR_BCRS:
+        bcr = getattr(mmtr, name)
+        bcr.units.value = getattr(cm.UnitSymbolKind, unit)
+        write_time_quality(bcr.t.tq)
 
 
-def set_bcr(bcr, val, unit, now: datetime):
-    """Set the values in the specified BCR structure.
+def write_mmtr(mmtr, mmtr_dict: dict, now: datetime):
+    """Write the values that change into the MMTR structure.
 
-    :param val: The numeric value.
-    :param unit: The value's unit.
+    :param mmtr: The MMTR structure that init_mmtr populated.
+    :param mmtr_dict: Dict of MMTR values.
     :param now: The timestamp for the value.
     """
-    bcr.actVal = int(val)
-    bcr.units.value = unit
-    write_timestamp(bcr.t, now)
+    seconds, fraction = split_timestamp(now)
+    for name, _ in MMTR_BCRS:
+        bcr = getattr(mmtr, name)
+        bcr.actVal = int(mmtr_dict[name])
+        bcr.t.seconds = seconds
+        bcr.t.fraction = fraction
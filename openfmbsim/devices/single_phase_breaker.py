@@ -15,7 +15,7 @@
 
 from datetime import datetime
 import uuid
-from .message import set_phase_a_mmxu
+from .fleet import DeviceFleet
 from .single_phase_meter import SinglePhaseMeter
 import breakermodule_pb2 as bm
 
@@ -31,31 +31,46 @@ class SinglePhaseBreaker(SinglePhaseMeter):
     CLOSED = 1
 
     def __init__(self, cond_equip_mrid: uuid.UUID = None,
-                 cond_equip_name: str = None):
+                 cond_equip_name: str = None, fleet: DeviceFleet = None):
         """Construct a new instance of this breaker model.
 
         :param cond_equip_mrid: The MRID of the conducting unit.
         :param cond_equip_name: The name of the conducting unit.
+        :param fleet: The fleet that holds the state of the breaker.
         """
-        super().__init__(cond_equip_mrid, cond_equip_name)
+        super().__init__(cond_equip_mrid, cond_equip_name, fleet)
 
         self._position = SinglePhaseBreaker.CLOSED
 
-    def to_profiles(self):
-        """Get all of the profiles that this generates."""
+    def create_templates(self):
+        """Create the profile templates for this breaker."""
         brp = bm.BreakerReadingProfile()
-        equipment = brp.breaker.conductingEquipment
-        equipment.mRID = str(self.mrid)
-        equipment.namedObject.name.value = self.name
-        rr = brp.breakerReading.add()
-        rr.CopyFrom(self.to_reading())
-        yield brp
+        self.write_conducting_equipment(brp.breaker.conductingEquipment)
+        self.init_reading(brp.breakerReading.add())
 
         bsp = bm.BreakerStatusProfile()
-        equipment = bsp.breaker.conductingEquipment
-        equipment.mRID = str(self.mrid)
-        equipment.namedObject.name.value = self.name
+        self.write_conducting_equipment(bsp.breaker.conductingEquipment)
+        return (brp, bsp)
+
+    def to_profiles(self, status: bool = True):
+        """Get all of the profiles that this generates.
+
+        The profiles are templates that are reused by the next call, so the
+        caller must be done with them before calling this again.
+
+        :param status: If false, then only get the reading profile.
+        """
+        brp, _ = self.templates
+        with self.lock:
+            self.write_reading(brp.breakerReading[0])
+        yield brp
 
+        if status:
+            yield from self.to_status_profiles()
+
+    def to_status_profiles(self):
+        """Get the status profile, which only changes with the position."""
+        bsp = self.templates[1]
         position = 1 if self.is_closed else 2
         bsp.breakerStatus.statusAndEventXCBR.Pos.stVal = position
         yield bsp
@@ -71,13 +86,12 @@ class SinglePhaseBreaker(SinglePhaseMeter):
 
         return br
 
-    def to_mmxu(self, mmxu):
-        """Write the MMXU data into the specified structure."""
+    def mmxu_values(self) -> dict:
+        """Get the present MMXU values."""
         if (self.position == SinglePhaseBreaker.CLOSED):
-            super().to_mmxu(mmxu)
+            return super().mmxu_values()
         else:
-            now = datetime.now()
-            mmxu_dict = {
+            return {
                 "A": 0,
                 "Hz": 0,
                 "PF": 1,
@@ -87,17 +101,6 @@ class SinglePhaseBreaker(SinglePhaseMeter):
                 "VAr": 0,
                 "W": 0
             }
-            set_phase_a_mmxu(mmxu, mmxu_dict, now)
-
-    def update_mmtr(self, now):
-        """Update the present net energy values."""
-        if (self.position == SinglePhaseBreaker.CLOSED):
-            # We only actually update the values if the position is closed
-            super().update_mmtr(now)
-        else:
-            # Nevertheless, this is our last updated time, so that if we are
-            # later closed, we update from the last updated time
-            self.last_update = now
 
     def update_profile(self, control):
         """Update this device with the control request."""
@@ -118,14 +121,21 @@ class SinglePhaseBreaker(SinglePhaseMeter):
     @position.setter
     def position(self, value):
         """Set the recloser position."""
+        changed = value != self._position
         self._position = value
 
+        # We only integrate the energy while the position is closed
+        self.active = self.is_closed
+
         # We need to update this so that we start re-calculating the
         # the measurements according to this change in status. That is
         # if we just opened, then we cannot have any current or
         # power flowing.
         self.update_mmtr(datetime.utcnow())
 
+        if changed:
+            self.status_changed()
+
     @property
     def is_closed(self):
         """Get if this recloser is closed."""
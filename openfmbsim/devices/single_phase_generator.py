@@ -15,13 +15,13 @@
 
 from datetime import datetime
 import uuid
-from .message import set_bcr, set_phase_a_mmxu
-from .conducting_equipment import ConductingEquipment
-import commonmodule_pb2 as cm
+from .message import (init_mmtr, init_phase_a_mmxu, set_mmtr,
+                      set_phase_a_mmxu, write_mmtr, write_phase_a_mmxu)
+from .fleet import DeviceFleet, FleetEquipment
 import generationmodule_pb2 as gm
 
 
-class SinglePhaseGenerator(ConductingEquipment):
+class SinglePhaseGenerator(FleetEquipment):
     """A simulated single phase battery.
 
     This is intended to simulate a battery that might be installed in a split
@@ -33,29 +33,39 @@ class SinglePhaseGenerator(ConductingEquipment):
     """
 
     def __init__(self, cond_equip_mrid: uuid.UUID = None,
-                 cond_equip_name: str = None):
+                 cond_equip_name: str = None, fleet: DeviceFleet = None):
         """Construct a new instance of this meter model.
 
         :param cond_equip_mrid: The MRID of the conducting unit.
         :param cond_equip_name: The name of the conducting unit.
+        :param fleet: The fleet that holds the state of the generator.
         """
-        super().__init__(cond_equip_mrid, cond_equip_name)
+        super().__init__(cond_equip_mrid, cond_equip_name, fleet)
 
         self.ph_v = 120
-        self._w = 1000000
+        self.w = 1000000
         self.hz = 60
 
         self.last_update = datetime.utcnow()
         self.dmd_wh = 0
         self.sup_wh = 0
 
-    def to_profiles(self):
-        """Get all of the profiles that this generates."""
+    def create_templates(self):
+        """Create the profile templates for this generator."""
         gp = gm.GenerationReadingProfile()
-        equipment = gp.generatingUnit.conductingEquipment
-        equipment.mRID = str(self.mrid)
-        equipment.namedObject.name.value = self.name
-        gp.generationReading.CopyFrom(self.to_generation_reading())
+        self.write_conducting_equipment(gp.generatingUnit.conductingEquipment)
+        self.init_reading(gp.generationReading)
+        return (gp,)
+
+    def to_profiles(self):
+        """Get all of the profiles that this generates.
+
+        The profiles are templates that are reused by the next call, so the
+        caller must be done with them before calling this again.
+        """
+        gp, = self.templates
+        with self.lock:
+            self.write_reading(gp.generationReading)
         yield gp
 
     def to_generation_reading(self):
@@ -69,11 +79,33 @@ class SinglePhaseGenerator(ConductingEquipment):
 
         return gr
 
+    def init_reading(self, reading):
+        """Write the parts of a reading that never change.
+
+        :param reading: The reading structure of a profile template.
+        """
+        init_phase_a_mmxu(reading.readingMMXU)
+        init_mmtr(reading.readingMMTR)
+
+    def write_reading(self, reading):
+        """Write the present values into a reading from init_reading.
+
+        :param reading: The reading structure of a profile template.
+        """
+        now = datetime.now()
+        write_phase_a_mmxu(reading.readingMMXU, self.mmxu_values(), now)
+        write_mmtr(reading.readingMMTR, self.mmtr_values(), now)
+
     def to_mmxu(self, mmxu):
         """Write the MMXU data into the specified structure."""
         now = datetime.now()
+        set_phase_a_mmxu(mmxu, self.mmxu_values(), now)
+
+        return mmxu
 
-        mmxu_dict = {
+    def mmxu_values(self) -> dict:
+        """Get the present MMXU values."""
+        return {
             "A": self.i_mag,
             "Hz": self.hz,
             "PF": 1,
@@ -83,59 +115,27 @@ class SinglePhaseGenerator(ConductingEquipment):
             "VAr": 0,
             "W": self.w
         }
-        set_phase_a_mmxu(mmxu, mmxu_dict, now)
-
-        return mmxu
 
     def to_mmtr(self, mmtr):
         """Write the MMTR data into the specified structure."""
         now = datetime.now()
-        sk = cm.UnitSymbolKind
-        set_bcr(mmtr.DmdWh, self.dmd_wh, sk.UnitSymbolKind_Wh, now)
-        set_bcr(mmtr.DmdVArh, 0, sk.UnitSymbolKind_VArh, now)
-        set_bcr(mmtr.DmdVAh, self.dmd_wh, sk.UnitSymbolKind_VAh, now)
-
-        set_bcr(mmtr.SupWh, self.sup_wh, sk.UnitSymbolKind_Wh, now)
-        set_bcr(mmtr.SupVArh, 0, sk.UnitSymbolKind_VArh, now)
-        set_bcr(mmtr.SupVAh, self.sup_wh, sk.UnitSymbolKind_VAh, now)
-
-        total_wh = self.sup_wh - self.dmd_wh
-        set_bcr(mmtr.TotWh, total_wh, sk.UnitSymbolKind_Wh, now)
-        set_bcr(mmtr.TotVArh, 0, sk.UnitSymbolKind_VArh, now)
-        set_bcr(mmtr.TotVAh, total_wh, sk.UnitSymbolKind_VAh, now)
+        set_mmtr(mmtr, self.mmtr_values(), now)
 
         return mmtr
 
-    def update_mmtr(self, now):
-        """Update the present net energy values."""
-        duration = (now - self.last_update).total_seconds()
-
-        net = self.w * duration / 3600.0
-        if net > 0:
-            self.dmd_wh += net
-        else:
-            self.sup_wh += net
-
-        self.last_update = now
-
-    @property
-    def i_mag(self):
-        """Get the magnitude of the current."""
-        return self.w / self.ph_v if self.ph_v != 0 else 0
-
-    @property
-    def va(self):
-        """Get the complex power output."""
-        return abs(self.w)
-
-    @property
-    def w(self):
-        """Get the real power output."""
-        return self._w
-
-    @w.setter
-    def w(self, value):
-        """Set the real power set-point."""
-        with self.lock:
-            self.update_mmtr(datetime.utcnow())
-            self._w = value
+    def mmtr_values(self) -> dict:
+        """Get the present MMTR values."""
+        dmd_wh = self.dmd_wh
+        sup_wh = self.sup_wh
+        total_wh = sup_wh - dmd_wh
+        return {
+            "DmdWh": dmd_wh,
+            "DmdVArh": 0,
+            "DmdVAh": dmd_wh,
+            "SupWh": sup_wh,
+            "SupVArh": 0,
+            "SupVAh": sup_wh,
+            "TotWh": total_wh,
+            "TotVArh": 0,
+            "TotVAh": total_wh,
+        }
@@ -15,7 +15,7 @@
 
 from datetime import datetime
 import uuid
-from .message import set_phase_a_mmxu
+from .fleet import DeviceFleet
 from .single_phase_meter import SinglePhaseMeter
 import commonmodule_pb2 as cm
 import solarmodule_pb2 as sm
@@ -29,37 +29,53 @@ class SinglePhaseSolar(SinglePhaseMeter):
     """
 
     def __init__(self, cond_equip_mrid: uuid.UUID = None,
-                 cond_equip_name: str = None):
+                 cond_equip_name: str = None, fleet: DeviceFleet = None):
         """Construct a new instance of this breaker model.
 
         :param cond_equip_mrid: The MRID of the conducting unit.
         :param cond_equip_name: The name of the conducting unit.
+        :param fleet: The fleet that holds the state of the solar unit.
         """
-        super().__init__(cond_equip_mrid, cond_equip_name)
+        super().__init__(cond_equip_mrid, cond_equip_name, fleet)
 
         gcmk = cm.GridConnectModeKind
         self._connect_mode = gcmk.GridConnectModeKind_CSI
 
-    def to_profiles(self):
-        """Get all of the profiles that this generates."""
+    def create_templates(self):
+        """Create the profile templates for this solar unit."""
         srp = sm.SolarReadingProfile()
-        equipment = srp.solarInverter.conductingEquipment
-        equipment.mRID = str(self.mrid)
-        equipment.namedObject.name.value = self.name
-        srp.solarReading.CopyFrom(self.to_reading())
-        yield srp
+        self.write_conducting_equipment(srp.solarInverter.conductingEquipment)
+        self.init_reading(srp.solarReading)
 
         ssp = sm.SolarStatusProfile()
-        equipment = ssp.solarInverter.conductingEquipment
-        equipment.mRID = str(self.mrid)
-        equipment.namedObject.name.value = self.name
-
-        ssp.solarStatus.solarStatusZGEN.GriMod.setVal = self.connect_mode
+        self.write_conducting_equipment(ssp.solarInverter.conductingEquipment)
 
         zget = ssp.solarStatus.solarStatusZGEN.solarEventAndStatusZGEN
         zget.AuxPwrSt.stVal = True
         zget.DynamicTest.stVal = 0
         zget.EmgStop.stVal = False
+        return (srp, ssp)
+
+    def to_profiles(self, status: bool = True):
+        """Get all of the profiles that this generates.
+
+        The profiles are templates that are reused by the next call, so the
+        caller must be done with them before calling this again.
+
+        :param status: If false, then only get the reading profile.
+        """
+        srp, _ = self.templates
+        with self.lock:
+            self.write_reading(srp.solarReading)
+        yield srp
+
+        if status:
+            yield from self.to_status_profiles()
+
+    def to_status_profiles(self):
+        """Get the status profile, which only changes with the connect mode."""
+        ssp = self.templates[1]
+        ssp.solarStatus.solarStatusZGEN.GriMod.setVal = self.connect_mode
         yield ssp
 
     def to_reading(self):
@@ -73,14 +89,13 @@ class SinglePhaseSolar(SinglePhaseMeter):
 
         return sr
 
-    def to_mmxu(self, mmxu):
-        """Write the MMXU data into the specified structure."""
+    def mmxu_values(self) -> dict:
+        """Get the present MMXU values."""
         gcmk = cm.GridConnectModeKind
         if (self.connect_mode != gcmk.GridConnectModeKind_none):
-            super().to_mmxu(mmxu)
+            return super().mmxu_values()
         else:
-            now = datetime.now()
-            mmxu_dict = {
+            return {
                 "A": 0,
                 "Hz": 0,
                 "PF": 1,
@@ -90,18 +105,6 @@ class SinglePhaseSolar(SinglePhaseMeter):
                 "VAr": 0,
                 "W": 0
             }
-            set_phase_a_mmxu(mmxu, mmxu_dict, now)
-
-    def update_mmtr(self, now):
-        """Update the present net energy values."""
-        gcmk = cm.GridConnectModeKind
-        if (self.connect_mode != gcmk.GridConnectModeKind_none):
-            # We only actually update the values if the position is closed
-            super().update_mmtr(now)
-        else:
-            # Nevertheless, this is our last updated time, so that if we are
-            # later closed, we update from the last updated time
-            self.last_update = now
 
     def update_profile(self, control):
         """Update this device with the control request."""
@@ -118,10 +121,18 @@ class SinglePhaseSolar(SinglePhaseMeter):
     @connect_mode.setter
     def connect_mode(self, value):
         """Set the connect mode kind."""
+        changed = value != self._connect_mode
         self._connect_mode = value
 
+        # We only integrate the energy while we are connected
+        gcmk = cm.GridConnectModeKind
+        self.active = value != gcmk.GridConnectModeKind_none
+
         # We need to update this so that we start re-calculating the
         # the measurements according to this change in status. That is
         # if we just opened, then we cannot have any current or
         # power flowing.
         self.update_mmtr(datetime.utcnow())
+
+        if changed:
+            self.status_changed()
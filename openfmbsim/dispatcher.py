@@ -0,0 +1,224 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Deliver published messages directly to the sinks that want them."""
+
+from collections import namedtuple
+
+
+def _frozen(values):
+    """Get the values as a frozen set, or none if there are no values.
+
+    :param values: An iterable of values, or none.
+    :return: The frozen set, or none to match anything.
+    """
+    return frozenset(values) if values is not None else None
+
+
+class Filter(namedtuple("Filter", ["profile_types", "devices", "kinds"])):
+    """The messages that a sink is interested in.
+
+    Each part is a set, or none to match any value, and a message must match
+    all parts. The profile types are the full names of the protobuf
+    descriptors, such as openfmb.metermodule.MeterReadingProfile. The devices
+    are the MRIDs of the IEDs and the kinds are the classes of the models.
+    """
+
+    def __new__(cls, profile_types=None, devices=None, kinds=None):
+        """Create a new filter.
+
+        :param profile_types: The full names of the profile types to match.
+        :param devices: The MRIDs of the IEDs to match, as UUIDs or strings.
+        :param kinds: The classes of models to match. Subclasses are other
+                      kinds, so do not match.
+        """
+        if devices is not None:
+            devices = [str(d) for d in devices]
+        return super().__new__(cls, _frozen(profile_types), _frozen(devices),
+                               _frozen(kinds))
+
+    def matches(self, profile_type: str, device: str, kind) -> bool:
+        """Get if a message matches the filter.
+
+        :param profile_type: The full name of the type of profile.
+        :param device: The MRID of the IED as a string.
+        :param kind: The class of the model, or none if not known.
+        :return: True if the message matches, otherwise false.
+        """
+        if self.profile_types is not None:
+            if profile_type not in self.profile_types:
+                return False
+        if self.devices is not None and device not in self.devices:
+            return False
+        if self.kinds is not None and kind not in self.kinds:
+            return False
+        return True
+
+
+def _without(sinks: tuple, sink) -> tuple:
+    """Get the sinks without the first occurrence of the sink.
+
+    :param sinks: The tuple of sinks.
+    :param sink: The sink to remove.
+    :return: The new tuple of sinks.
+    """
+    for index, item in enumerate(sinks):
+        if item is sink:
+            return sinks[:index] + sinks[index + 1:]
+    return sinks
+
+
+class Dispatcher(object):
+    """Call the subscribed sinks with each message that is published.
+
+    The sinks are held in tuples that are replaced, rather than changed, when
+    a sink subscribes or unsubscribes. Publishing iterates the tuple that was
+    current when it started, so a sink may unsubscribe while a message is
+    being delivered, and publishing needs no lock or observer machinery.
+
+    Sinks take one message at a time. Batch sinks take the list of messages
+    that were published together, such as all profiles of one device publish.
+
+    Sinks with a filter only get the messages that match, which must be
+    envelopes. The sinks for each profile type, device and kind of model are
+    found once and kept in a routing table until the filtered sinks change.
+    """
+
+    # The most routes that we keep before starting the table again, so that
+    # devices that come and go do not grow the table forever.
+    max_routes = 65536
+
+    def __init__(self):
+        """Create the dispatcher without any sinks."""
+        self._sinks = ()
+        self._batch_sinks = ()
+        # Tuples of the sink and filter, and the routes to those sinks
+        self._filtered = ()
+        self._routes = {}
+
+    def __len__(self):
+        """Get the number of subscribed sinks."""
+        count = len(self._sinks) + len(self._batch_sinks)
+        return count + len(self._filtered)
+
+    def subscribe(self, sink, spec: Filter = None):
+        """Call the sink with each message that is published.
+
+        :param sink: The function to call with the message.
+        :param spec: If not none, only call the sink with the messages that
+                     match the filter.
+        :return: A function to unsubscribe the sink.
+        """
+        if spec is not None:
+            return self._subscribe_filtered(sink, spec)
+
+        self._sinks = self._sinks + (sink,)
+
+        def unsubscribe():
+            self._sinks = _without(self._sinks, sink)
+        return unsubscribe
+
+    def _subscribe_filtered(self, sink, spec: Filter):
+        """Call the sink with each message that matches the filter.
+
+        :param sink: The function to call with the message.
+        :param spec: The filter for the messages.
+        :return: A function to unsubscribe the sink.
+        """
+        entry = (sink, spec)
+        self._filtered = self._filtered + (entry,)
+        self._routes = {}
+
+        def unsubscribe():
+            self._filtered = _without(self._filtered, entry)
+            self._routes = {}
+        return unsubscribe
+
+    def subscribe_batch(self, sink):
+        """Call the sink with each list of messages that is published.
+
+        :param sink: The function to call with the list of messages. The sink
+                     must not change the list.
+        :return: A function to unsubscribe the sink.
+        """
+        self._batch_sinks = self._batch_sinks + (sink,)
+
+        def unsubscribe():
+            self._batch_sinks = _without(self._batch_sinks, sink)
+        return unsubscribe
+
+    def publish(self, message, kind=None):
+        """Deliver a message to all sinks.
+
+        :param message: The message to deliver.
+        :param kind: The class of the model that published the message.
+        """
+        for sink in self._sinks:
+            sink(message)
+
+        batch_sinks = self._batch_sinks
+        if batch_sinks:
+            batch = [message]
+            for sink in batch_sinks:
+                sink(batch)
+
+        if self._filtered:
+            for sink in self._route(message, kind):
+                sink(message)
+
+    def publish_batch(self, messages: list, kind=None):
+        """Deliver messages that were published together to all sinks.
+
+        :param messages: The list of messages to deliver.
+        :param kind: The class of the model that published the messages.
+        """
+        if not messages:
+            return
+
+        for sink in self._sinks:
+            for message in messages:
+                sink(message)
+
+        for sink in self._batch_sinks:
+            sink(messages)
+
+        if self._filtered:
+            for message in messages:
+                for sink in self._route(message, kind):
+                    sink(message)
+
+    def _route(self, message, kind) -> tuple:
+        """Get the filtered sinks that want the message.
+
+        :param message: The envelope of the message.
+        :param kind: The class of the model that published the message.
+        :return: The tuple of sinks.
+        """
+        key = (message.profile.DESCRIPTOR.full_name, message.device_mrid,
+               kind)
+        sinks = self._routes.get(key)
+        if sinks is None:
+            if len(self._routes) >= self.max_routes:
+                self._routes = {}
+            device = str(message.device_mrid)
+            sinks = tuple(sink for sink, f in self._filtered
+                          if f.matches(key[0], device, kind))
+            self._routes[key] = sinks
+        return sinks
+
+    def clear(self):
+        """Unsubscribe all sinks."""
+        self._sinks = ()
+        self._batch_sinks = ()
+        self._filtered = ()
+        self._routes = {}
@@ -0,0 +1,82 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Envelope for a published profile that is shared by all consumers."""
+
+from collections import namedtuple
+from .json_encoder import message_to_dict, message_to_json
+
+
+class Envelope(namedtuple("Envelope", ["device_mrid", "timestamp",
+                                       "profile"])):
+    """A profile published by a device along with the encodings of it.
+
+    Each of the encodings is created the first time that it is requested and
+    then reused, so that no matter how many consumers there are, we encode
+    a profile at most once per format.
+
+    Devices reuse the profile objects for the next publish, so consumers must
+    request the encodings they need before they yield to the event loop.
+
+    The envelope is a tuple of the device MRID, timestamp and profile, so it
+    can be used wherever those tuples were used.
+    """
+
+    def __new__(cls, device_mrid, timestamp, profile):
+        """Create a new envelope.
+
+        :param device_mrid: The MRID of the device that published.
+        :param timestamp: The datetime that the profile was published.
+        :param profile: The profile encoded as an OpenFMB protobuf object.
+        """
+        envelope = super().__new__(cls, device_mrid, timestamp, profile)
+        envelope._binary = None
+        envelope._json = None
+        envelope._data = None
+        return envelope
+
+    @property
+    def binary(self) -> bytes:
+        """Get the profile encoded in the protobuf binary format."""
+        if self._binary is None:
+            self._binary = self.profile.SerializeToString()
+        return self._binary
+
+    @property
+    def json(self) -> str:
+        """Get the profile encoded as JSON on a single line."""
+        if self._json is None:
+            self._json = message_to_json(self.profile)
+        return self._json
+
+    @property
+    def data(self) -> dict:
+        """Get the profile as a dict of the fields in the JSON.
+
+        The dict is shared by all consumers, so must not be changed.
+        """
+        if self._data is None:
+            self._data = message_to_dict(self.profile)
+        return self._data
+
+
+def as_envelope(item) -> Envelope:
+    """Get the item as an envelope.
+
+    :param item: An envelope, or a tuple of the device MRID, timestamp and
+                 profile.
+    :return: The envelope.
+    """
+    if isinstance(item, Envelope):
+        return item
+    return Envelope(*item)
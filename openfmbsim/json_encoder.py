@@ -0,0 +1,250 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Encoder that converts profiles to JSON without walking descriptors."""
+
+import base64
+import functools
+import json
+import math
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.internal import type_checkers
+from google.protobuf.json_format import MessageToDict
+
+_INT64_TYPES = frozenset([FieldDescriptor.CPPTYPE_INT64,
+                          FieldDescriptor.CPPTYPE_UINT64])
+
+# Older versions of protobuf write floats without rounding them.
+_to_shortest_float = getattr(type_checkers, "ToShortestFloat", float)
+
+
+def convert_float(value: float):
+    """Convert a 32 bit float the same way as MessageToJson.
+
+    :param value: The value of the field.
+    :return: The value to write in the JSON.
+    """
+    # Zero is equal to negative zero, so cannot share the cache
+    if value == 0.0:
+        return value
+    return _convert_nonzero_float(value)
+
+
+@functools.lru_cache(maxsize=4096)
+def _convert_nonzero_float(value: float):
+    """Convert a float that is not zero.
+
+    Finding the shortest representation is iterative, so we remember the
+    result for values that are seen often.
+    """
+    special = convert_double(value)
+    if special is not value:
+        return special
+    return _to_shortest_float(value)
+
+
+def convert_double(value: float):
+    """Convert a 64 bit float the same way as MessageToJson.
+
+    :param value: The value of the field.
+    :return: The value to write in the JSON.
+    """
+    if math.isinf(value):
+        return "-Infinity" if value < 0.0 else "Infinity"
+    if math.isnan(value):
+        return "NaN"
+    return value
+
+
+def convert_bytes(value: bytes) -> str:
+    """Convert a bytes field the same way as MessageToJson.
+
+    :param value: The value of the field.
+    :return: The value to write in the JSON.
+    """
+    return base64.b64encode(value).decode("utf-8")
+
+
+def is_wrapper(descriptor) -> bool:
+    """Get if the message type is one of the protobuf wrapper types.
+
+    :param descriptor: The descriptor of the message type.
+    """
+    return descriptor.file.name == "google/protobuf/wrappers.proto"
+
+
+def is_special(descriptor) -> bool:
+    """Get if the message type has a JSON format that we do not generate.
+
+    These are the other well known types, maps and extensions, which we leave
+    to MessageToDict.
+
+    :param descriptor: The descriptor of the message type.
+    """
+    if descriptor.full_name.startswith("google.protobuf."):
+        return True
+    if descriptor.extension_ranges:
+        return True
+    for field in descriptor.fields:
+        message_type = field.message_type
+        if message_type is not None and message_type.GetOptions().map_entry:
+            return True
+    return False
+
+
+class JsonEncoder(object):
+    """Convert profiles to JSON the same way as MessageToJson.
+
+    The first time that we see a type of message, we create a function for
+    the type that knows the JSON name and conversion of every field. Later
+    messages of that type only look up the fields that are set.
+    """
+
+    def __init__(self):
+        """Create a new encoder with no known message types."""
+        # Maps the full name of the message type to the conversion function
+        self._converters = {}
+
+    def encode(self, message, indent: int = None) -> str:
+        """Encode the message as JSON.
+
+        :param message: The protobuf message to encode.
+        :param indent: The indent, as for MessageToJson. If none, then the
+                       JSON is on a single line.
+        :return: The JSON.
+        """
+        return json.dumps(self.to_dict(message), indent=indent)
+
+    def to_dict(self, message) -> dict:
+        """Convert the message to a dict that can be written as JSON.
+
+        :param message: The protobuf message to convert.
+        :return: The dict, as from MessageToDict.
+        """
+        return self.converter_for(message.DESCRIPTOR)(message)
+
+    def converter_for(self, descriptor):
+        """Get the function that converts messages of a type.
+
+        :param descriptor: The descriptor of the message type.
+        :return: The function that takes the message.
+        """
+        converter = self._converters.get(descriptor.full_name)
+        if converter is None:
+            converter = self._create_converter(descriptor)
+        return converter
+
+    def _create_converter(self, descriptor):
+        """Create the function that converts messages of a type.
+
+        :param descriptor: The descriptor of the message type.
+        :return: The function that takes the message.
+        """
+        if is_wrapper(descriptor):
+            convert_value = self._value_converter(
+                descriptor.fields_by_name["value"])
+            if convert_value is None:
+                def converter(message):
+                    return message.value
+            else:
+                def converter(message):
+                    return convert_value(message.value)
+            self._converters[descriptor.full_name] = converter
+            return converter
+
+        if is_special(descriptor):
+            self._converters[descriptor.full_name] = MessageToDict
+            return MessageToDict
+
+        # Maps the field number to the name and the conversion. This is
+        # filled after we register the converter so that we can handle
+        # messages that contain themselves.
+        fields = {}
+
+        def converter(message):
+            result = {}
+            for field, value in message.ListFields():
+                name, convert = fields[field.number]
+                result[name] = value if convert is None else convert(value)
+            return result
+
+        self._converters[descriptor.full_name] = converter
+
+        for field in descriptor.fields:
+            convert = self._value_converter(field)
+            if field.label == FieldDescriptor.LABEL_REPEATED:
+                convert = _repeated(convert)
+            fields[field.number] = (field.json_name, convert)
+
+        return converter
+
+    def _value_converter(self, field):
+        """Get the function that converts a single value of a field.
+
+        :param field: The descriptor of the field.
+        :return: The function that takes the value, or none if the value is
+                 written as it is.
+        """
+        cpp_type = field.cpp_type
+        if cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+            return self.converter_for(field.message_type)
+        if cpp_type == FieldDescriptor.CPPTYPE_ENUM:
+            if field.enum_type.full_name == "google.protobuf.NullValue":
+                return lambda value: None
+            names = {v.number: v.name for v in field.enum_type.values}
+            return lambda value: names.get(value, value)
+        if field.type == FieldDescriptor.TYPE_BYTES:
+            return convert_bytes
+        if cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+            return bool
+        if cpp_type in _INT64_TYPES:
+            return str
+        if cpp_type == FieldDescriptor.CPPTYPE_FLOAT:
+            return convert_float
+        if cpp_type == FieldDescriptor.CPPTYPE_DOUBLE:
+            return convert_double
+        return None
+
+
+def _repeated(convert):
+    """Get the function that converts all values of a repeated field.
+
+    :param convert: The function that converts a single value, if any.
+    :return: The function that takes the repeated values.
+    """
+    if convert is None:
+        return list
+    return lambda values: [convert(v) for v in values]
+
+
+_default_encoder = JsonEncoder()
+
+
+def message_to_dict(message) -> dict:
+    """Convert the message to a dict with the shared encoder.
+
+    :param message: The protobuf message to convert.
+    :return: The dict, as from MessageToDict.
+    """
+    return _default_encoder.to_dict(message)
+
+
+def message_to_json(message, indent: int = None) -> str:
+    """Encode the message as JSON with the shared encoder.
+
+    :param message: The protobuf message to encode.
+    :param indent: The indent, as for MessageToJson. If none, then the JSON
+                   is on a single line.
+    :return: The JSON.
+    """
+    return _default_encoder.encode(message, indent=indent)
@@ -17,14 +17,27 @@ from datetime import datetime
 import commonmodule_pb2 as cm
 
 
-def write_timestamp(ts, now: datetime):
-    """Set fields for the given TimeStamp structure based on current time."""
+def split_timestamp(now: datetime):
+    """Split the time into the seconds and fraction of a TimeStamp.
+
+    :param now: The time to split.
+    :return: Tuple of the whole seconds and the fraction of a second.
+    """
     fractional_seconds = now.timestamp()
     seconds = int(fractional_seconds)
-    ts.fraction = int((fractional_seconds - seconds) * 4294967295)
-    ts.seconds = seconds
-    ts.tq.clockFailure = False
-    ts.tq.clockNotSynchronized = False
-    ts.tq.leapSecondsKnown = True
+    return (seconds, int((fractional_seconds - seconds) * 4294967295))
+
+
+def write_timestamp(ts, now: datetime):
+    """Set fields for the given TimeStamp structure based on current time."""
+    ts.seconds, ts.fraction = split_timestamp(now)
+    write_time_quality(ts.tq)
+
+
+def write_time_quality(tq):
+    """Set fields for the given TimeQuality structure of a TimeStamp."""
+    tq.clockFailure = False
+    tq.clockNotSynchronized = False
+    tq.leapSecondsKnown = True
 
-    ts.tq.timeAccuracy = cm.TimeAccuracyKind.TimeAccuracyKind_unspecified
+    tq.timeAccuracy = cm.TimeAccuracyKind.TimeAccuracyKind_unspecified
@@ -13,12 +13,17 @@
 # limitations under the License.
 """Message handler that subscribes and publishes on NATS."""
 
-import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 import functools
 import logging
 from nats.aio.client import Client as Nats
 import reclosermodule_pb2 as rm
 import generationmodule_pb2 as gm
+from .control import ControlPipeline
+from .envelope import as_envelope
+from .outbound import OutboundQueue, OverflowPolicy, PriorityLanes
+from .tracing import LatencyTracer
 
 LOGGER = logging.getLogger(__name__)
 
@@ -38,17 +43,59 @@ def profile_to_subject(device_mrid, profile):
     return ".".join(["openfmb", profile.DESCRIPTOR.full_name, device_mrid])
 
 
+@functools.lru_cache(maxsize=65536)
+def cached_subject(device_mrid, full_name: str) -> str:
+    """Get the topic for a type of profile from a device.
+
+    Every device publishes the same types of profile over and over, so we
+    remember the topics rather than build them for every publish.
+
+    :param device_mrid: The MRID of the device, as a UUID or string.
+    :param full_name: The full name of the type of profile.
+    """
+    return ".".join(["openfmb", full_name, str(device_mrid)])
+
+
+# The lanes of the publisher, with the highest priority first. Changes of
+# state must not wait behind the routine readings of thousands of devices.
+STATUS_LANE = "status"
+READING_LANE = "reading"
+
+# The ends of the names of the types of profile in the status lane
+STATUS_SUFFIXES = ("StatusProfile", "EventProfile")
+
+
+@functools.lru_cache(maxsize=1024)
+def lane_for(full_name: str) -> str:
+    """Get the lane of the publisher for a type of profile.
+
+    :param full_name: The full name of the type of profile.
+    :return: The name of the lane.
+    """
+    return STATUS_LANE if full_name.endswith(STATUS_SUFFIXES) else READING_LANE
+
+
 class NatsSubscriber():
-    """Subscriber for messages coming over NATS for devices in the system."""
+    """Subscriber for messages coming over NATS for devices in the system.
 
-    def __init__(self, servers, system, event_loop, nats=None):
+    Messages are handed to a control pipeline, which decodes and applies
+    them to the system, so the handler returns without decoding.
+    """
+
+    def __init__(self, servers, system, event_loop, nats=None,
+                 pipeline: ControlPipeline = None,
+                 tracer: LatencyTracer = None):
         """Initialize the subscriber.
 
-        :param subject: NATS subject name to subscribe to.
         :param servers: List of server URIs for connection.
         :param system: The system that we are simulating.
         :param event_loop: The event loop for the asyncio.
         :param nats: If not none, use as the NATS client.
+        :param pipeline: If not none, the pipeline that applies the controls.
+                         Otherwise we create one that decodes on the event
+                         loop.
+        :param tracer: If not none, the tracer that timestamps each control
+                       when it is received.
         :type servers: array of str
         """
         LOGGER.info("Starting NATS subscriber on %s", servers)
@@ -56,6 +103,10 @@ class NatsSubscriber():
         self.servers = servers
         self.system = system
         self.event_loop = event_loop
+        self.tracer = tracer
+        self.pipeline = (pipeline if pipeline is not None
+                         else ControlPipeline(system, event_loop,
+                                              tracer=tracer))
 
     async def event_handler(self, model, msg):
         """Handle messages received from NATS.
@@ -63,27 +114,18 @@ class NatsSubscriber():
         :param model: Constructor for the protobuf object to decode the data
         :param msg: The message received from NATS.
         """
-        try:
-            msg_data = msg.data
-            LOGGER.info("[Received '%s' on '%s']: %s", model, msg.subject,
-                        msg_data)
-
-            profile = model()
-            profile.ParseFromString(msg_data)
-
+        LOGGER.debug("[Received '%s' on '%s']: %s", model, msg.subject,
+                     msg.data)
+        if self.tracer is not None:
             # The last part of the subject is the MRID of the conducting
-            # equipment, so extract that value.
-            device_mrid = msg.subject.split(".")[-1]
-
-            LOGGER.debug("[Decoded profile '%s']: %s", msg.subject, profile)
-
-            self.system.update_profile(device_mrid, profile)
-        except TypeError:
-            LOGGER.exception("Error encountered")
+            # equipment.
+            self.tracer.received(msg.subject.split(".")[-1])
+        self.pipeline.submit(model, msg.subject, msg.data)
 
     async def start(self):
         """Start the subscriber by connecting to the cluster."""
         await self.nc.connect(servers=self.servers, loop=self.event_loop)
+        self.pipeline.start()
         for profile in SUBSCRIBE_PROFILES_TYPES:
             subject = profile_to_subject("*", profile)
             callback = functools.partial(self.event_handler, profile)
@@ -91,9 +133,20 @@ class NatsSubscriber():
 
 
 class NatsPublisher():
-    """Publisher to send information over NATS about devices in the system."""
+    """Publisher to send information over NATS about devices in the system.
 
-    def __init__(self, servers, system, event_loop, nats=None):
+    Profiles are encoded as they are published and put into bounded lanes,
+    with status and event profiles in a lane ahead of the readings. A single
+    drain task takes the profiles from the lanes in batches, status first,
+    and publishes them back to back.
+    """
+
+    def __init__(self, servers, system, event_loop, nats=None, encoder=None,
+                 queue_size: int = 10000, batch_size: int = 500,
+                 flush_interval: timedelta = timedelta(seconds=1),
+                 overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                 status_queue_size: int = 10000,
+                 status_overflow: OverflowPolicy = OverflowPolicy.CONFLATE):
         """Initialize the publisher.
 
         :param servers: List of server URIs for connection.
@@ -101,43 +154,184 @@ class NatsPublisher():
                        the stream from that system.
         :param event_loop: The event loop for the asyncio.
         :param nats: If not none, use as the NATS client.
+        :param encoder: If not none, the encoder that converts profiles to
+                        bytes, such as a SpliceEncoder. Otherwise we use
+                        SerializeToString.
+        :param queue_size: The maximum number of readings waiting to be
+                           published.
+        :param batch_size: The maximum number of profiles to publish before
+                           we yield to the event loop.
+        :param flush_interval: How often we ask the server to confirm that it
+                               received what we published. If none, then we
+                               never do.
+        :param overflow: What to do when the queue is full, for example if
+                         the connection to NATS is slow or lost. The block
+                         policy pauses the scheduler of the system.
+        :param status_queue_size: The maximum number of status and event
+                                  profiles waiting to be published.
+        :param status_overflow: What to do when the status lane is full. By
+                                default a newer status from a device
+                                replaces the one that is waiting.
         """
         LOGGER.info("Starting NATS publisher on %s", servers)
         self.nc = Nats() if nats is None else nats
         self.servers = servers
         self.system = system
         self.event_loop = event_loop
+        self.encoder = encoder
+        self.queue = PriorityLanes([
+            (STATUS_LANE, self._create_lane(status_queue_size,
+                                            status_overflow)),
+            (READING_LANE, self._create_lane(queue_size, overflow)),
+        ], event_loop)
+        self.batch_size = batch_size
+        self.flush_interval = (flush_interval.total_seconds()
+                               if flush_interval is not None else None)
+        self._drain_task = None
+
+        self.published = 0
+        self.batches = 0
+        self.flushes = 0
+        self.errors = 0
 
         # Subscribe to the stream of published profiles
         def publish(profiles):
             self.publish_async(profiles)
         self.system.subscribe(publish)
+        self.system.add_stats_source("nats", self.stats)
+
+        # Release what the encoder caches for devices that are removed
+        if hasattr(encoder, "forget"):
+            def forget(device):
+                encoder.forget(str(device.id))
+            self.system.add_remove_listener(forget)
+
+    def _create_lane(self, capacity: int,
+                     overflow: OverflowPolicy) -> OutboundQueue:
+        """Create the queue for a lane.
+
+        :param capacity: The maximum number of profiles in the lane.
+        :param overflow: What to do when the lane is full.
+        """
+        if overflow == OverflowPolicy.BLOCK:
+            return OutboundQueue(capacity, self.event_loop, overflow,
+                                 pause=self.system.scheduler.pause,
+                                 resume=self.system.scheduler.resume)
+        return OutboundQueue(capacity, self.event_loop, overflow)
 
     async def start(self):
         """Start the publisher."""
         await self.nc.connect(servers=self.servers, loop=self.event_loop)
+        if self._drain_task is None:
+            self._drain_task = self.event_loop.create_task(self.drain())
+
+    async def close(self):
+        """Publish what is waiting in the queue and close the connection."""
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+            self._drain_task = None
+        await self.publish_batch(self.queue.get_batch_nowait(len(self.queue)))
+        self.queue.task_done()
+        await self.nc.close()
+
+    def stats(self) -> dict:
+        """Get the counters that describe the load on the publisher."""
+        result = self.queue.stats()
+        result.update({
+            "published": self.published,
+            "batches": self.batches,
+            "flushes": self.flushes,
+            "errors": self.errors,
+        })
+        return result
 
     def publish_async(self, profile):
         """Handle subscriptions from the observable to send to the event loop.
 
-        This bridges the reactive and async worlds in this application.
+        This bridges the reactive and async worlds in this application. The
+        profile is encoded now, since the device reuses the profile for the
+        next publish, and is then queued for the drain task.
+        """
+        try:
+            envelope = as_envelope(profile)
+            full_name = envelope.profile.DESCRIPTOR.full_name
+            subject = cached_subject(envelope.device_mrid, full_name)
+            data = self.encode(envelope.device_mrid, envelope.profile,
+                               envelope)
+        except (TypeError, AttributeError):
+            LOGGER.exception("Unable to publish %s", profile)
+            return
+
+        # The subject identifies the device and type of profile, so is the
+        # key for conflating readings.
+        self.queue.put_nowait(lane_for(full_name), (subject, data), subject)
+
+    async def drain(self):
+        """Publish profiles from the queue until we are canceled."""
+        next_flush = None
+        if self.flush_interval is not None:
+            next_flush = self.event_loop.time() + self.flush_interval
+
+        while True:
+            batch = await self.queue.get_batch(self.batch_size)
+            await self.publish_batch(batch)
+            self.queue.task_done()
+
+            if next_flush is not None and self.event_loop.time() >= next_flush:
+                await self.flush()
+                next_flush = self.event_loop.time() + self.flush_interval
+
+    async def publish_batch(self, batch: list):
+        """Publish a batch of encoded profiles.
+
+        :param batch: List of tuples of the subject and data.
         """
-        def callback():
-            asyncio.ensure_future(self.publish(profile[0], profile[2]))
-        asyncio.get_event_loop().call_soon(callback)
+        if not batch:
+            return
+
+        publish = self.nc.publish
+        for subject, data in batch:
+            try:
+                await publish(subject, data)
+                self.published += 1
+            except Exception:
+                self.errors += 1
+                LOGGER.exception("Error publishing on %s", subject)
+        self.batches += 1
+
+    async def flush(self):
+        """Wait for the server to confirm what we published."""
+        try:
+            await self.nc.flush()
+            self.flushes += 1
+        except Exception:
+            self.errors += 1
+            LOGGER.exception("Error flushing the NATS connection")
 
-    @asyncio.coroutine
-    def publish(self, device_mrid, profile):
-        """Publish called from the asyncio thread to publish profiles.
+    def encode(self, device_mrid, profile, envelope=None) -> bytes:
+        """Encode the profile into the bytes that we publish.
 
         :param device_mrid: The MRID of the associated device.
         :param profile: The profile encoded as an OpenFMB protobuf object.
+        :param envelope: If not none, the envelope of the profile, which
+                         shares the encoding with other consumers.
+        :return: The encoded profile.
         """
-        subject = profile_to_subject(str(device_mrid), profile)
-        yield from self.nc.publish(subject, profile.SerializeToString())
-
-
-def create_server(servers, system, event_loop, nats=None):
+        if self.encoder is None:
+            if envelope is not None:
+                return envelope.binary
+            return profile.SerializeToString()
+        return self.encoder.encode(str(device_mrid), profile)
+
+
+def create_server(servers, system, event_loop, nats=None, encoder=None,
+                  flush_interval: timedelta = timedelta(seconds=1),
+                  queue_size: int = 10000,
+                  overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                  status_queue_size: int = 10000,
+                  status_overflow: OverflowPolicy = OverflowPolicy.CONFLATE,
+                  control_queue_size: int = 1000,
+                  control_threads: int = None):
     """Create a NATS server for the system.
 
     Starts the system, will do nothing until the event loop is set running.
@@ -146,20 +340,50 @@ def create_server(servers, system, event_loop, nats=None):
     :param system: The system that contains the nodes, publishes information.
     :param event_loop: The event loop for the asyncio.
     :param nats: If not none, use as the NATS client.
+    :param encoder: If not none, the encoder for published profiles.
+    :param flush_interval: How often the publisher flushes the connection.
+    :param queue_size: The maximum number of readings waiting to be
+                       published.
+    :param overflow: What the publisher does when the queue of readings is
+                     full.
+    :param status_queue_size: The maximum number of status and event
+                              profiles waiting to be published.
+    :param status_overflow: What the publisher does when the status lane is
+                            full.
+    :param control_queue_size: The maximum number of control profiles
+                               waiting to be applied.
+    :param control_threads: If not none, the number of threads that decode
+                            control profiles. Otherwise we decode on the
+                            event loop.
     :return: A function to shutdown the server.
     """
+    executor = None
+    if control_threads is not None:
+        executor = ThreadPoolExecutor(max_workers=control_threads,
+                                      thread_name_prefix="control")
+    tracer = LatencyTracer(system)
+    pipeline = ControlPipeline(system, event_loop,
+                               capacity=control_queue_size,
+                               executor=executor, tracer=tracer)
     subscriber = NatsSubscriber(servers=servers, system=system,
-                                event_loop=event_loop, nats=nats)
+                                event_loop=event_loop, nats=nats,
+                                pipeline=pipeline, tracer=tracer)
     event_loop.run_until_complete(subscriber.start())
 
     publisher = NatsPublisher(servers=servers, system=system,
-                              event_loop=event_loop, nats=nats)
+                              event_loop=event_loop, nats=nats,
+                              encoder=encoder, flush_interval=flush_interval,
+                              queue_size=queue_size, overflow=overflow,
+                              status_queue_size=status_queue_size,
+                              status_overflow=status_overflow)
     event_loop.run_until_complete(publisher.start())
 
     def canceler():
+        pipeline.close()
+        if executor is not None:
+            executor.shutdown(wait=False)
         system.dispose()
-        event_loop = asyncio.get_event_loop()
         event_loop.create_task(subscriber.nc.close())
-        event_loop.create_task(publisher.nc.close())
+        event_loop.create_task(publisher.close())
 
     return canceler
@@ -0,0 +1,304 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Bounded queue of messages waiting to be sent to a transport."""
+
+import asyncio
+from collections import deque, OrderedDict
+from enum import Enum
+from .tracing import Histogram
+
+
+class OverflowPolicy(Enum):
+    """What the queue does when it is full."""
+
+    # Pause the producers until the queue drains, so nothing is lost.
+    BLOCK = "block"
+    # Drop the oldest message to make room for the new message.
+    DROP_OLDEST = "drop-oldest"
+    # Replace a waiting message that has the same key, such as an older
+    # reading from the same device, and otherwise drop the oldest.
+    CONFLATE = "conflate"
+
+
+class OutboundQueue(object):
+    """A bounded queue that is drained in batches by a single consumer.
+
+    Producers put messages without waiting, from the event loop thread. The
+    consumer waits for messages and takes everything that is ready, up to a
+    batch size, so that it can send the messages back to back.
+
+    Producers do not wait, so the block policy asks them to stop through the
+    pause and resume callbacks. Messages that arrive after the pause are
+    still added, so the queue may exceed the capacity by the messages that
+    are produced before the producers stop.
+    """
+
+    def __init__(self, capacity: int = 10000, event_loop=None,
+                 policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                 pause=None, resume=None):
+        """Create a new queue.
+
+        :param capacity: The maximum number of messages in the queue.
+        :param event_loop: The event loop of the consumer. If none, then use
+                           the current event loop.
+        :param policy: What to do when the queue is full.
+        :param pause: For the block policy, the function to call without
+                      arguments when the queue is full.
+        :param resume: For the block policy, the function to call without
+                       arguments when the queue has drained to half of the
+                       capacity after a pause.
+        """
+        self.capacity = capacity
+        self.event_loop = (event_loop if event_loop is not None
+                           else asyncio.get_event_loop())
+        self.policy = policy
+        self._pause = pause
+        self._resume = resume
+        self.paused = False
+        self.closed = False
+        self._items = (OrderedDict() if policy == OverflowPolicy.CONFLATE
+                       else deque())
+        self._ready = asyncio.Event(loop=self.event_loop)
+        # Unique keys for messages that must not be conflated
+        self._sequence = 0
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.pauses = 0
+        self.high_water = 0
+
+    def __len__(self):
+        """Get the number of messages in the queue."""
+        return len(self._items)
+
+    def stats(self) -> dict:
+        """Get the counters that describe the load on the queue."""
+        return {
+            "policy": self.policy.value,
+            "depth": len(self._items),
+            "capacity": self.capacity,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "conflated": self.conflated,
+            "pauses": self.pauses,
+            "paused": self.paused,
+            "highWater": self.high_water,
+        }
+
+    def put_nowait(self, item, key=None) -> bool:
+        """Add a message to the end of the queue.
+
+        :param item: The message to add.
+        :param key: For the conflate policy, the key of the message. A new
+                    message replaces a waiting message with the same key. If
+                    none, then the message is never replaced.
+        :return: True if the message was added, or false if it replaced a
+                 waiting message.
+        """
+        items = self._items
+        self.enqueued += 1
+
+        if self.policy == OverflowPolicy.CONFLATE:
+            if key is None:
+                self._sequence += 1
+                key = (OutboundQueue, self._sequence)
+            elif key in items:
+                # Keep the place in the queue, but send the latest
+                items[key] = item
+                self.conflated += 1
+                return False
+            if len(items) >= self.capacity:
+                items.popitem(last=False)
+                self.dropped += 1
+            items[key] = item
+        else:
+            if len(items) >= self.capacity:
+                if self.policy == OverflowPolicy.DROP_OLDEST:
+                    items.popleft()
+                    self.dropped += 1
+                elif not self.paused:
+                    self._set_paused(True)
+            items.append(item)
+
+        self.high_water = max(self.high_water, len(items))
+        self._ready.set()
+        return True
+
+    def get_batch_nowait(self, max_items: int) -> list:
+        """Take the messages at the start of the queue without waiting.
+
+        :param max_items: The maximum number of messages to take.
+        :return: The messages, which may be empty.
+        """
+        items = self._items
+        count = min(max_items, len(items))
+        if self.policy == OverflowPolicy.CONFLATE:
+            batch = [items.popitem(last=False)[1] for _ in range(count)]
+        else:
+            batch = [items.popleft() for _ in range(count)]
+
+        if not items:
+            self._ready.clear()
+        if self.paused and len(items) <= self.capacity // 2:
+            self._set_paused(False)
+        return batch
+
+    async def get_batch(self, max_items: int) -> list:
+        """Wait for messages and take those at the start of the queue.
+
+        :param max_items: The maximum number of messages to take.
+        :return: The messages, of which there is at least one unless the
+                 queue is closed.
+        """
+        while not self._items and not self.closed:
+            await self._ready.wait()
+        return self.get_batch_nowait(max_items)
+
+    def close(self):
+        """Stop the consumer from waiting for more messages.
+
+        The consumer still gets the messages that are in the queue, and then
+        gets empty batches rather than waiting.
+        """
+        self.closed = True
+        self._ready.set()
+
+    def _set_paused(self, paused: bool):
+        """Ask the producers to pause or resume.
+
+        :param paused: True to pause the producers, otherwise false.
+        """
+        self.paused = paused
+        if paused:
+            self.pauses += 1
+            callback = self._pause
+        else:
+            callback = self._resume
+        if callback is not None:
+            callback()
+
+
+class PriorityLanes(object):
+    """Bounded queues, or lanes, that are drained in order of priority.
+
+    Each lane is an OutboundQueue with its own capacity and overflow policy.
+    The consumer takes from the first lane before the next, so messages in a
+    high priority lane never wait behind those in a low priority lane. Each
+    lane has a histogram of the seconds from when a message is put until the
+    consumer calls task_done after publishing it, so that it includes the
+    time spent publishing the batches ahead of it.
+    """
+
+    def __init__(self, lanes: list, event_loop=None):
+        """Create the lanes.
+
+        :param lanes: List of tuples of the name and the queue of each lane,
+                      with the highest priority first. The queues hold the
+                      time that each message was put with the message.
+        :param event_loop: The event loop of the consumer. If none, then use
+                           the current event loop.
+        """
+        self.event_loop = (event_loop if event_loop is not None
+                           else asyncio.get_event_loop())
+        self._lanes = [(name, queue, Histogram()) for name, queue in lanes]
+        self._queues = {name: queue for name, queue in lanes}
+        self._ready = asyncio.Event(loop=self.event_loop)
+        self.closed = False
+        # The histogram and put time of the messages that were taken but
+        # not yet published.
+        self._taken = []
+
+    def __len__(self):
+        """Get the number of messages in all lanes."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def lane(self, name: str) -> OutboundQueue:
+        """Get the queue of a lane.
+
+        :param name: The name of the lane.
+        """
+        return self._queues[name]
+
+    def stats(self) -> dict:
+        """Get the counters of all lanes together and of each lane."""
+        lanes = {}
+        for name, queue, latency in self._lanes:
+            lanes[name] = queue.stats()
+            lanes[name]["latency"] = latency.as_dict()
+
+        result = {key: sum(lane[key] for lane in lanes.values())
+                  for key in ("depth", "capacity", "enqueued", "dropped",
+                              "conflated", "pauses")}
+        result["paused"] = any(lane["paused"] for lane in lanes.values())
+        result["lanes"] = lanes
+        return result
+
+    def put_nowait(self, lane: str, item, key=None) -> bool:
+        """Add a message to the end of a lane.
+
+        :param lane: The name of the lane.
+        :param item: The message to add.
+        :param key: For the conflate policy, the key of the message.
+        :return: True if the message was added, or false if it replaced a
+                 waiting message.
+        """
+        added = self._queues[lane].put_nowait(
+            (self.event_loop.time(), item), key)
+        self._ready.set()
+        return added
+
+    def get_batch_nowait(self, max_items: int) -> list:
+        """Take the messages at the start of the lanes without waiting.
+
+        :param max_items: The maximum number of messages to take.
+        :return: The messages, highest priority first, which may be empty.
+        """
+        batch = []
+        for _, queue, latency in self._lanes:
+            if len(batch) >= max_items:
+                break
+            for put_at, item in queue.get_batch_nowait(max_items - len(batch)):
+                self._taken.append((latency, put_at))
+                batch.append(item)
+
+        if not len(self):
+            self._ready.clear()
+        return batch
+
+    async def get_batch(self, max_items: int) -> list:
+        """Wait for messages and take those at the start of the lanes.
+
+        :param max_items: The maximum number of messages to take.
+        :return: The messages, of which there is at least one unless the
+                 lanes are closed.
+        """
+        while not len(self) and not self.closed:
+            await self._ready.wait()
+        return self.get_batch_nowait(max_items)
+
+    def task_done(self):
+        """Record the latency of the messages taken since the last call.
+
+        The consumer calls this when it has published the messages.
+        """
+        now = self.event_loop.time()
+        for latency, put_at in self._taken:
+            latency.record(now - put_at)
+        self._taken.clear()
+
+    def close(self):
+        """Stop the consumer from waiting for more messages."""
+        self.closed = True
+        self._ready.set()
@@ -0,0 +1,300 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Central scheduler that drives the periodic publishing of devices."""
+
+import asyncio
+from datetime import timedelta
+import logging
+import math
+import weakref
+
+LOGGER = logging.getLogger(__name__)
+
+# One scheduler per event loop for devices that are not given a scheduler.
+_schedulers = weakref.WeakKeyDictionary()
+
+
+class TickScheduler(object):
+    """A hashed timer wheel that owns the publishing schedule of devices.
+
+    Rather than every device holding its own timer in the event loop, the
+    scheduler keeps a single timer that wakes once per tick. Each wake up
+    advances the wheel by one slot and runs every device that is due in that
+    slot as one batch. Devices are anything with a ``publish_profiles``
+    method, and they normally schedule themselves again from that method.
+    """
+
+    def __init__(self, event_loop=None,
+                 tick: timedelta = timedelta(milliseconds=50),
+                 slots: int = 512):
+        """Create a new scheduler.
+
+        :param event_loop: The event loop to run on. If none, then use the
+                           current event loop.
+        :param tick: The resolution of the wheel.
+        :param slots: The number of slots in the wheel.
+        """
+        self.event_loop = (event_loop if event_loop is not None
+                           else asyncio.get_event_loop())
+        self.tick = tick.total_seconds()
+
+        # Each slot maps the device to the number of remaining rotations of
+        # the wheel before the device is due.
+        self._slots = [dict() for _ in range(slots)]
+        self._slot_of = {}
+
+        # The last slot that we processed and the loop time of that slot.
+        # The time is only valid while there are devices on the wheel.
+        self._cursor = 0
+        self._cursor_time = None
+        self._handle = None
+        self._ticking = False
+        self._tick_callbacks = []
+        # The number of outstanding requests to pause
+        self._pauses = 0
+
+        self.wakeups = 0
+        self.last_batch = 0
+        self.max_batch = 0
+
+    def __len__(self):
+        """Get the number of devices on the wheel."""
+        return len(self._slot_of)
+
+    def __contains__(self, device):
+        """Get if the device is on the wheel."""
+        return device in self._slot_of
+
+    def stats(self) -> dict:
+        """Get the counters that describe the load on the scheduler."""
+        return {
+            "devices": len(self._slot_of),
+            "wakeups": self.wakeups,
+            "lastBatch": self.last_batch,
+            "maxBatch": self.max_batch,
+            "paused": self.paused,
+        }
+
+    @property
+    def paused(self) -> bool:
+        """Get if the scheduler is paused so that no device publishes."""
+        return self._pauses > 0
+
+    def pause(self):
+        """Stop publishing devices until resume is called.
+
+        This is how consumers that cannot keep up apply back pressure. Each
+        call must be matched by a call to resume.
+        """
+        self._pauses += 1
+        if self._pauses == 1 and self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def resume(self):
+        """Continue publishing devices after a call to pause.
+
+        The devices are delayed by the time that we were paused, rather than
+        all publishing together to catch up.
+        """
+        if self._pauses == 0:
+            return
+        self._pauses -= 1
+        if self._pauses == 0 and self._slot_of and not self._ticking:
+            self._cursor_time = self.event_loop.time()
+            self._handle = self.event_loop.call_at(
+                self._cursor_time + self.tick, self._on_tick)
+
+    def add_tick_callback(self, callback):
+        """Add a callback that runs at the start of each tick.
+
+        This is useful for work that is done for many devices at once, before
+        the devices in the tick publish.
+
+        :param callback: The function to call, without arguments.
+        """
+        if callback not in self._tick_callbacks:
+            self._tick_callbacks.append(callback)
+
+    def remove_tick_callback(self, callback):
+        """Remove a callback that was added with add_tick_callback.
+
+        :param callback: The function to remove.
+        """
+        if callback in self._tick_callbacks:
+            self._tick_callbacks.remove(callback)
+
+    def call_soon(self, device):
+        """Schedule the device to publish at the next tick.
+
+        :param device: The device to schedule.
+        """
+        self.call_later(0, device)
+
+    def call_later(self, delay: float, device):
+        """Schedule the device to publish after the delay.
+
+        :param delay: The delay in seconds.
+        :param device: The device to schedule.
+        """
+        self.call_at(self.event_loop.time() + delay, device)
+
+    def call_at(self, when: float, device):
+        """Schedule the device to publish at the given loop time.
+
+        The device publishes in the first tick at or after the given time. If
+        the device is already scheduled, then this replaces that schedule.
+
+        :param when: The event loop time to publish at.
+        :param device: The device to schedule.
+        """
+        self.remove(device)
+
+        if self._cursor_time is None:
+            self._cursor_time = self.event_loop.time()
+
+        # Allow for rounding in the times, so that a time that is a whole
+        # number of ticks away is not pushed to the next tick
+        elapsed = (when - self._cursor_time) / self.tick
+        ticks = max(1, math.ceil(elapsed - 1e-9))
+        num_slots = len(self._slots)
+        index = (self._cursor + ticks) % num_slots
+        self._slots[index][device] = (ticks - 1) // num_slots
+        self._slot_of[device] = index
+
+        if self._handle is None and not self._ticking and not self.paused:
+            self._handle = self.event_loop.call_at(
+                self._cursor_time + self.tick, self._on_tick)
+
+    def remove(self, device):
+        """Remove the device from the wheel so that it no longer publishes.
+
+        :param device: The device to remove.
+        :return: True if the device was scheduled, otherwise false.
+        """
+        index = self._slot_of.pop(device, None)
+        if index is None:
+            return False
+
+        del self._slots[index][device]
+        if not self._slot_of and not self._ticking:
+            self._stop()
+        return True
+
+    def _stop(self):
+        """Release the timer when there is nothing left to run."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._cursor_time = None
+
+    def _on_tick(self):
+        """Advance the wheel up to the present time."""
+        self._handle = None
+        self._ticking = True
+        self.wakeups += 1
+
+        # If the loop was late, then we catch up on each slot we missed so
+        # that devices are published in order.
+        now = self.event_loop.time()
+        try:
+            for callback in self._tick_callbacks:
+                try:
+                    callback()
+                except Exception:
+                    LOGGER.exception("Error in tick callback %s", callback)
+
+            while True:
+                self._cursor = (self._cursor + 1) % len(self._slots)
+                self._cursor_time += self.tick
+                self._run_slot(self._cursor)
+                if not self._slot_of or self._cursor_time + self.tick > now:
+                    break
+                if self.paused:
+                    break
+        finally:
+            self._ticking = False
+
+        if not self._slot_of:
+            self._stop()
+        elif not self.paused:
+            self._handle = self.event_loop.call_at(
+                self._cursor_time + self.tick, self._on_tick)
+
+    def _run_slot(self, index: int):
+        """Publish all devices that are due in the slot.
+
+        :param index: The index of the slot.
+        """
+        slot = self._slots[index]
+        due = []
+        for device, rounds in slot.items():
+            if rounds == 0:
+                due.append(device)
+            else:
+                slot[device] = rounds - 1
+
+        for device in due:
+            del slot[device]
+            del self._slot_of[device]
+
+        self.last_batch = len(due)
+        self.max_batch = max(self.max_batch, self.last_batch)
+
+        for device in due:
+            try:
+                device.publish_profiles()
+            except Exception:
+                LOGGER.exception("Error publishing profiles for %s", device)
+
+
+class PhaseStagger(object):
+    """Spread the first publish of devices across their publishing period.
+
+    Devices that are created together would otherwise publish in the same
+    tick for as long as they exist. The offsets follow the fractional parts of
+    multiples of the golden ratio, so that any number of consecutive devices
+    are spread evenly over the period and the offsets are deterministic.
+    """
+
+    GOLDEN_RATIO_FRACTION = 0.6180339887498949
+
+    def __init__(self):
+        """Initialize the sequence of offsets."""
+        self._count = 0
+
+    def next_phase(self, rate: timedelta) -> float:
+        """Get the offset for the next device.
+
+        :param rate: The publishing period of the device.
+        :return: The delay in seconds before the first publish.
+        """
+        fraction = (self._count * PhaseStagger.GOLDEN_RATIO_FRACTION) % 1.0
+        self._count += 1
+        return fraction * rate.total_seconds()
+
+
+def get_scheduler(event_loop=None) -> TickScheduler:
+    """Get the shared scheduler for the event loop.
+
+    :param event_loop: The event loop. If none, then use the current loop.
+    :return: The scheduler, created the first time it is requested.
+    """
+    event_loop = (event_loop if event_loop is not None
+                  else asyncio.get_event_loop())
+    scheduler = _schedulers.get(event_loop)
+    if scheduler is None:
+        scheduler = TickScheduler(event_loop)
+        _schedulers[event_loop] = scheduler
+    return scheduler
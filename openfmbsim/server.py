@@ -15,12 +15,18 @@
 
 import argparse
 import asyncio
+from datetime import timedelta
 import logging
 import os
 import sys
+from openfmbsim.deadband import Deadband
+from openfmbsim.devices.device_types import DEVICE_TYPES
 from openfmbsim.nats_server import create_server
+from openfmbsim.outbound import OverflowPolicy
 from openfmbsim.web_server import create_web_server
+from openfmbsim.simulated_device import CatchUpPolicy
 from openfmbsim.simulated_system import SimulatedSystem
+from openfmbsim.splice_encoder import SpliceEncoder
 
 LOGGER = logging.getLogger(__name__)
 
@@ -36,6 +42,56 @@ def listen_url(arg):
     return (fragments[0], port)
 
 
+def positive_seconds(arg):
+    try:
+        seconds = float(arg)
+    except ValueError:
+        raise argparse.ArgumentTypeError
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError
+    return timedelta(seconds=seconds)
+
+
+def optional_seconds(arg):
+    try:
+        seconds = float(arg)
+    except ValueError:
+        raise argparse.ArgumentTypeError
+    if seconds == 0:
+        return None
+    return positive_seconds(arg)
+
+
+def positive_int(arg):
+    try:
+        value = int(arg)
+    except ValueError:
+        raise argparse.ArgumentTypeError
+    if value <= 0:
+        raise argparse.ArgumentTypeError
+    return value
+
+
+def type_rate(arg):
+    fragments = arg.split("=")
+    if len(fragments) != 2 or fragments[0] not in DEVICE_TYPES:
+        raise argparse.ArgumentTypeError
+    return (DEVICE_TYPES[fragments[0]], positive_seconds(fragments[1]))
+
+
+def type_deadband(arg):
+    fragments = arg.split(":")
+    if len(fragments) != 2 or fragments[0] not in DEVICE_TYPES:
+        raise argparse.ArgumentTypeError
+    try:
+        values = dict(item.split("=") for item in fragments[1].split(","))
+        deadband = Deadband.from_dict({name: float(value)
+                                       for name, value in values.items()})
+    except ValueError:
+        raise argparse.ArgumentTypeError
+    return (DEVICE_TYPES[fragments[0]], deadband)
+
+
 def parse_arguments(cmd_line):
     """Parse command line arguments into the args structure.
 
@@ -58,6 +114,114 @@ def parse_arguments(cmd_line):
                         type=listen_url,
                         help="The server and port that the web service listens"
                              " on.")
+    parser.add_argument("--fixed-rate",
+                        action="store_true",
+                        default=env.get("ODS_FIXED_RATE", False),
+                        help="Publish against an absolute cadence rather than"
+                             " the rate after the last publish.")
+    parser.add_argument("--catch-up",
+                        choices=[p.value for p in CatchUpPolicy],
+                        default=env.get("ODS_CATCH_UP",
+                                        CatchUpPolicy.SKIP.value),
+                        help="How fixed rate devices recover from missed"
+                             " publishes.")
+    parser.add_argument("--rate",
+                        default=env.get("ODS_RATE", "1"),
+                        type=positive_seconds,
+                        help="The default number of seconds between publishes"
+                             " of each device.")
+    parser.add_argument("--type-rate",
+                        action="append",
+                        default=[],
+                        type=type_rate,
+                        help=("The number of seconds between publishes for a"
+                              " type of device, for example 'meter=0.5'."))
+    parser.add_argument("--no-stagger",
+                        action="store_true",
+                        default=env.get("ODS_NO_STAGGER", False),
+                        help="Do not spread the first publish of devices"
+                             " across their period.")
+    parser.add_argument("--status-heartbeat",
+                        default=env.get("ODS_STATUS_HEARTBEAT", "0"),
+                        type=optional_seconds,
+                        help="The number of seconds between publishes of the"
+                             " status of breakers, reclosers and solar when"
+                             " it does not change. A change is published"
+                             " straight away. If 0, the status is published"
+                             " with every reading.")
+    parser.add_argument("--deadband",
+                        action="append",
+                        default=[],
+                        type=type_deadband,
+                        help=("Only publish the readings of a type of device"
+                              " when a measurement moves beyond its"
+                              " deadband, for example 'meter:W=1000,V=1'."
+                              " The measurements are W, V, A and Hz."))
+    parser.add_argument("--integrity-period",
+                        default=env.get("ODS_INTEGRITY_PERIOD", "60"),
+                        type=positive_seconds,
+                        help="The number of seconds after which a device with"
+                             " a deadband publishes the reading even if it"
+                             " has not moved.")
+    parser.add_argument("--flush-interval",
+                        default=env.get("ODS_FLUSH_INTERVAL", "1"),
+                        type=positive_seconds,
+                        help="The number of seconds between NATS flushes that"
+                             " wait for the server to confirm delivery.")
+    parser.add_argument("--queue-size",
+                        default=env.get("ODS_QUEUE_SIZE", "10000"),
+                        type=positive_int,
+                        help="The maximum number of readings waiting to be"
+                             " published to NATS.")
+    parser.add_argument("--overflow",
+                        choices=[p.value for p in OverflowPolicy],
+                        default=env.get("ODS_OVERFLOW",
+                                        OverflowPolicy.DROP_OLDEST.value),
+                        help="What to do when the NATS queue is full: pause"
+                             " the devices, drop the oldest profile, or"
+                             " replace older readings from the same device.")
+    parser.add_argument("--status-queue-size",
+                        default=env.get("ODS_STATUS_QUEUE_SIZE", "10000"),
+                        type=positive_int,
+                        help="The maximum number of status and event profiles"
+                             " waiting to be published to NATS. These are"
+                             " published ahead of the readings.")
+    parser.add_argument("--status-overflow",
+                        choices=[p.value for p in OverflowPolicy],
+                        default=env.get("ODS_STATUS_OVERFLOW",
+                                        OverflowPolicy.CONFLATE.value),
+                        help="What to do when the NATS queue of status and"
+                             " event profiles is full.")
+    parser.add_argument("--sse-queue-size",
+                        default=env.get("ODS_SSE_QUEUE_SIZE", None),
+                        type=positive_int,
+                        help="The maximum number of profiles waiting to be"
+                             " sent to each browser. Newer readings replace"
+                             " older readings from the same device, so by"
+                             " default this is bounded by the devices.")
+    parser.add_argument("--sse-max-lag",
+                        default=env.get("ODS_SSE_MAX_LAG", "30"),
+                        type=positive_seconds,
+                        help="The number of seconds that a browser may fall"
+                             " behind before it is disconnected.")
+    parser.add_argument("--control-queue-size",
+                        default=env.get("ODS_CONTROL_QUEUE_SIZE", "1000"),
+                        type=positive_int,
+                        help="The maximum number of control profiles waiting"
+                             " to be applied. Newer controls replace older"
+                             " controls of the same type for the same"
+                             " device.")
+    parser.add_argument("--control-threads",
+                        default=env.get("ODS_CONTROL_THREADS", None),
+                        type=positive_int,
+                        help="The number of threads that decode control"
+                             " profiles. By default they are decoded on the"
+                             " event loop.")
+    parser.add_argument("--splice-encoder",
+                        action="store_true",
+                        default=env.get("ODS_SPLICE_ENCODER", False),
+                        help="Encode profiles by reusing the bytes of the"
+                             " fields that identify each device.")
     args = parser.parse_args(cmd_line)
 
     if len(args.servers) == 0:
@@ -81,17 +245,36 @@ def main(cmd_line):
 
     event_loop = asyncio.get_event_loop()
 
-    system = SimulatedSystem()
+    system = SimulatedSystem(fixed_rate=args.fixed_rate,
+                             catch_up=CatchUpPolicy(args.catch_up),
+                             rate=args.rate,
+                             type_rates=dict(args.type_rate),
+                             stagger=not args.no_stagger,
+                             status_heartbeat=args.status_heartbeat,
+                             deadbands=dict(args.deadband),
+                             integrity=args.integrity_period)
 
     # The web server really wants to own the event loop, so we first
     # create the NATS server.
-    nats_disposable = create_server(args.servers, system, event_loop)
+    encoder = SpliceEncoder() if args.splice_encoder else None
+    nats_disposable = create_server(args.servers, system, event_loop,
+                                    encoder=encoder,
+                                    flush_interval=args.flush_interval,
+                                    queue_size=args.queue_size,
+                                    overflow=OverflowPolicy(args.overflow),
+                                    status_queue_size=args.status_queue_size,
+                                    status_overflow=OverflowPolicy(
+                                        args.status_overflow),
+                                    control_queue_size=args.control_queue_size,
+                                    control_threads=args.control_threads)
 
     try:
         # Start the web server to visualize the system in an alternative way
         # The web server handles the termination detection
         # The server will initialize the system before it starts
-        create_web_server(args.listen[0], args.listen[1], event_loop, system)
+        create_web_server(args.listen[0], args.listen[1], event_loop, system,
+                          sse_capacity=args.sse_queue_size,
+                          sse_max_lag=args.sse_max_lag)
     finally:
         nats_disposable()
         event_loop.run_until_complete(event_loop.shutdown_asyncgens())
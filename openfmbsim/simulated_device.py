@@ -13,13 +13,17 @@
 # limitations under the License.
 """Wrapper for a simulated device to automatically publish information."""
 
-import asyncio
 from datetime import timedelta, datetime
+from enum import Enum
 import logging
 import rx
 import threading
 import uuid
+from .deadband import Deadband, ExceptionReporter
+from .dispatcher import Dispatcher
+from .envelope import Envelope
 from .message import write_timestamp
+from .scheduler import get_scheduler
 
 LOGGER = logging.getLogger(__name__)
 
@@ -47,41 +51,227 @@ def write_ied_info(ied, uuid):
     ied.identifiedObject.mRID.value = str(uuid)
 
 
+class CatchUpPolicy(Enum):
+    """How a fixed rate device recovers after it misses publishes."""
+
+    # Drop the publishes that were missed and continue on the cadence.
+    SKIP = "skip"
+    # Publish on each tick until we are back on the cadence.
+    BURST = "burst"
+
+
+class PublishStats(object):
+    """Counters describing how well a device keeps to its schedule."""
+
+    def __init__(self):
+        """Initialize the counters."""
+        self.published = 0
+        self.missed_ticks = 0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+        # The publishes where the reading had not moved beyond the deadband
+        self.suppressed = 0
+
+    def record(self, lateness: float):
+        """Record a publish that happened after the time it was due.
+
+        :param lateness: The number of seconds after the due time.
+        """
+        self.published += 1
+        self.last_lateness = lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        self.total_lateness += lateness
+
+    def as_dict(self) -> dict:
+        """Get the counters as a dictionary."""
+        return {
+            "published": self.published,
+            "missedTicks": self.missed_ticks,
+            "lastLateness": self.last_lateness,
+            "maxLateness": self.max_lateness,
+            "meanLateness": (self.total_lateness / self.published
+                             if self.published else 0.0),
+            "suppressed": self.suppressed,
+        }
+
+
 class SimulatedDevice(object):
     """Represents a device that periodically publishes profile information."""
 
+    # The most publishes that the burst policy makes up for. Beyond this, the
+    # publishes are skipped so that a saturated system cannot fall further
+    # and further behind.
+    max_burst = 10
+
     def __init__(self, ied_id: uuid.UUID, model,
-                 rate: timedelta = timedelta(seconds=1)):
+                 rate: timedelta = timedelta(seconds=1),
+                 scheduler=None, fixed_rate: bool = False,
+                 catch_up: CatchUpPolicy = CatchUpPolicy.SKIP,
+                 phase: float = 0.0, status_heartbeat: timedelta = None,
+                 deadband: Deadband = None, integrity: timedelta = None):
         """Create a new simulated device.
 
         :param ied_id: The MRID of the associated IED device.
         :param rate: The rate at which the device should publish updates.
+        :param scheduler: The scheduler that drives publishing. If none, then
+                          use the shared scheduler for the event loop.
+        :param fixed_rate: If true, then publish against an absolute cadence
+                           rather than the rate after the last publish.
+        :param catch_up: How a fixed rate device recovers from missed
+                         publishes.
+        :param phase: The delay in seconds before the first publish.
+        :param status_heartbeat: If not none, and the model has status
+                                 profiles, then publish the status as soon
+                                 as it changes and otherwise only this
+                                 often, rather than with every reading.
+        :param deadband: If not none, and the model has MMXU values, then
+                         only publish the reading when a measurement moves
+                         beyond its deadband from the last published value.
+        :param integrity: If not none, then with a deadband, also publish the
+                          reading when it has not been published for this
+                          long.
         """
         self.id = ied_id
-        self.subject = rx.subjects.Subject()
-        self.event_loop = asyncio.get_event_loop()
+        self.dispatcher = Dispatcher()
+        # Created only if someone asks for the observable
+        self._subject = None
+        self.scheduler = (scheduler if scheduler is not None
+                          else get_scheduler())
+        self.event_loop = self.scheduler.event_loop
         self.rate = rate
         self.model = model
+        self.fixed_rate = fixed_rate
+        self.catch_up = catch_up
+
+        # The event loop time that we were next due to publish, and how late
+        # we are relative to that time.
+        self.next_due = None
+        self.stats = PublishStats()
+
+        # The seconds between publishes of an unchanged status, and the event
+        # loop time that the status is next due. If none, then the status
+        # is published with every reading.
+        self.status_heartbeat = None
+        self.next_status = float("-inf")
+        self._status_scheduled = False
+        has_status = hasattr(model, "to_status_profiles")
+        if status_heartbeat is not None and has_status:
+            self.status_heartbeat = status_heartbeat.total_seconds()
+            model.status_listener = self.status_changed
+
+        # Decides whether to publish the reading, if we report by exception
+        self.reporter = None
+        if deadband is not None and hasattr(model, "mmxu_values"):
+            self.reporter = ExceptionReporter(
+                deadband,
+                integrity.total_seconds() if integrity is not None else None)
 
         self.lock = threading.Lock()
         self.done = False
 
         # The last thing we do is start publishing
-        self.event_loop.call_soon(self.publish_profiles, self)
+        self.scheduler.call_later(phase, self)
 
     @property
     def observable(self) -> rx.Observable:
-        """Get the observable for subscribing to updates."""
-        return self.subject
+        """Get the observable for subscribing to updates.
+
+        This is convenient for composing the updates with Rx operators, but
+        subscribe is faster when we only need to be called with each update.
+        """
+        if self._subject is None:
+            self._subject = rx.subjects.Subject()
+            self.dispatcher.subscribe(self._subject.on_next)
+            if self.done:
+                self._subject.on_completed()
+        return self._subject
+
+    def subscribe(self, sink):
+        """Call the sink with the envelope of each profile we publish.
+
+        :param sink: The function to call with the envelope.
+        :return: A function to unsubscribe the sink.
+        """
+        return self.dispatcher.subscribe(sink)
+
+    def subscribe_batch(self, sink):
+        """Call the sink with the list of envelopes of each publish.
+
+        :param sink: The function to call with the list of envelopes.
+        :return: A function to unsubscribe the sink.
+        """
+        return self.dispatcher.subscribe_batch(sink)
 
-    @staticmethod
     def publish_profiles(self):
-        """Publish updates to the subject and requeue itself."""
-        # This method is static so that it plays nicely with the event loop
-        # If not, then the event loop cannot call this.
+        """Publish updates to the subscribers and requeue itself."""
         LOGGER.debug("Publishing profiles for %s", self.id)
 
-        for profile in self.model.to_profiles():
+        started = self.event_loop.time()
+        if self.next_due is not None:
+            # This includes the resolution of the scheduler tick
+            self.stats.record(max(0.0, started - self.next_due))
+
+        envelopes = self._envelopes(self._select_profiles(started))
+        if envelopes:
+            self.dispatcher.publish_batch(envelopes)
+
+        with self.lock:
+            if not self.done:
+                self.next_due = self._next_run(started)
+                self.scheduler.call_at(self.next_due, self)
+
+    def _select_profiles(self, started: float):
+        """Get the profiles that are due to be published.
+
+        :param started: The event loop time that this publish started.
+        :return: The profiles, which may be empty.
+        """
+        reading = True
+        if self.reporter is not None:
+            reading = self.reporter.due(self.model.mmxu_values(), started)
+            if not reading:
+                self.stats.suppressed += 1
+
+        if self.status_heartbeat is None:
+            return self.model.to_profiles() if reading else ()
+
+        # Only include the status when the heartbeat is due
+        status = started >= self.next_status
+        if status:
+            self.next_status = started + self.status_heartbeat
+        if reading:
+            return self.model.to_profiles(status=status)
+        return self.model.to_status_profiles() if status else ()
+
+    def status_changed(self):
+        """Publish the status soon, since the model says that it changed.
+
+        We publish from the event loop after the current callback, so that
+        many changes at once result in one publish.
+        """
+        if not self._status_scheduled and not self.done:
+            self._status_scheduled = True
+            self.event_loop.call_soon(self.publish_status)
+
+    def publish_status(self):
+        """Publish only the status profiles to the subscribers."""
+        self._status_scheduled = False
+        if self.done:
+            return
+        LOGGER.debug("Publishing status for %s", self.id)
+        self.next_status = self.event_loop.time() + self.status_heartbeat
+        self.dispatcher.publish_batch(
+            self._envelopes(self.model.to_status_profiles()))
+
+    def _envelopes(self, profiles) -> list:
+        """Write the message information and wrap profiles in envelopes.
+
+        :param profiles: The profiles to publish.
+        :return: The list of envelopes.
+        """
+        envelopes = []
+        for profile in profiles:
             now = datetime.utcnow()
             if hasattr(profile, "readingMessageInfo"):
                 write_message_info(profile.readingMessageInfo.messageInfo,
@@ -89,17 +279,33 @@ class SimulatedDevice(object):
                                    now)
                 write_ied_info(profile.ied, self.id)
 
-            self.subject.on_next((self.id,
-                                  now,
-                                  profile))
+            envelopes.append(Envelope(self.id, now, profile))
+        return envelopes
 
-        with self.lock:
-            if not self.done:
-                # We always schedule at a first time in the future, and don't
-                # consider if we are actually called on time. This helps us
-                # degrade nicely by default if we are having trouble keeping up
-                next_run = self.event_loop.time() + self.rate.total_seconds()
-                self.event_loop.call_at(next_run, self.publish_profiles, self)
+    def _next_run(self, started: float) -> float:
+        """Get the event loop time of the next publish.
+
+        :param started: The event loop time that this publish started.
+        :return: The event loop time that we are next due.
+        """
+        rate = self.rate.total_seconds()
+        if not self.fixed_rate or self.next_due is None:
+            # We always schedule at a first time in the future, and don't
+            # consider if we are actually called on time. This helps us
+            # degrade nicely by default if we are having trouble keeping up
+            return self.event_loop.time() + rate
+
+        next_run = self.next_due + rate
+        now = self.event_loop.time()
+        if next_run > now:
+            return next_run
+
+        # We already missed the next publish, so decide how to recover
+        missed = int((now - next_run) // rate) + 1
+        if self.catch_up == CatchUpPolicy.BURST:
+            missed = max(0, missed - self.max_burst)
+        self.stats.missed_ticks += missed
+        return next_run + missed * rate
 
     def update_profile(self, profile):
         """Update this with the information from the control profile.
@@ -109,9 +315,25 @@ class SimulatedDevice(object):
         self.model.update_profile(profile)
 
     def dispose(self):
-        """Terminate the device so it stops publishing."""
+        """Terminate the device so it stops publishing.
+
+        The device is taken off the scheduler straight away, the subscribers
+        are released and the model releases what it holds.
+        """
         with self.lock:
+            if self.done:
+                return
             self.done = True
+            self.scheduler.remove(self)
+
+        if self.status_heartbeat is not None:
+            self.model.status_listener = None
+        self.dispatcher.clear()
+        if self._subject is not None:
+            self._subject.on_completed()
+        dispose_model = getattr(self.model, "dispose", None)
+        if dispose_model is not None:
+            dispose_model()
 
     @property
     def device_mrid(self) -> uuid.UUID:
@@ -13,10 +13,15 @@
 # limitations under the License.
 """Aggregates all items in the system to provide a simple interface."""
 
+from datetime import timedelta
+from functools import partial
 import logging
-import rx
 import uuid
-from .simulated_device import SimulatedDevice
+from .deadband import Deadband
+from .dispatcher import Dispatcher, Filter
+from .devices.fleet import DeviceFleet
+from .scheduler import PhaseStagger, get_scheduler
+from .simulated_device import CatchUpPolicy, SimulatedDevice
 
 
 LOGGER = logging.getLogger(__name__)
@@ -29,70 +34,285 @@ class SimulatedSystem(object):
     and acts as a single publisher for all events.
     """
 
-    def __init__(self):
-        """Initialize the system."""
-        self._devices = []
-        self.subjects = []
+    def __init__(self, scheduler=None, fixed_rate: bool = False,
+                 catch_up: CatchUpPolicy = CatchUpPolicy.SKIP,
+                 rate: timedelta = timedelta(seconds=1),
+                 type_rates: dict = None, stagger: bool = True,
+                 status_heartbeat: timedelta = None,
+                 deadbands: dict = None, integrity: timedelta = None):
+        """Initialize the system.
+
+        :param scheduler: The scheduler that drives publishing for all devices
+                          in the system. If none, then use the shared
+                          scheduler for the event loop.
+        :param fixed_rate: If true, then devices publish against an absolute
+                           cadence rather than the rate after the last
+                           publish.
+        :param catch_up: How fixed rate devices recover from missed
+                         publishes.
+        :param rate: The default rate at which devices publish.
+        :param type_rates: Dict of model type to the rate at which devices of
+                           that type publish. This overrides the default.
+        :param stagger: If true, then spread the first publish of devices
+                        across their period so they do not publish together.
+        :param status_heartbeat: If not none, then devices publish their
+                                 status as soon as it changes and otherwise
+                                 only this often. If none, then the status
+                                 is published with every reading.
+        :param deadbands: Dict of model type to the Deadband for devices of
+                          that type, which then only publish readings that
+                          move beyond the deadband.
+        :param integrity: How often devices with a deadband publish the
+                          reading even if it has not moved. If none, then
+                          only when it moves.
+        """
+        # Indexes of the devices by the MRID of the IED, the MRID of the
+        # conducting equipment and the type of model. The dicts keep the
+        # order in which devices were added.
+        self._devices = {}
+        self._by_equipment = {}
+        self._by_type = {}
+        self._scheduler = scheduler
+        self.fixed_rate = fixed_rate
+        self.catch_up = catch_up
+        self.rate = rate
+        self.type_rates = type_rates if type_rates is not None else {}
+        self.stagger = PhaseStagger() if stagger else None
+        self.status_heartbeat = status_heartbeat
+        self.deadbands = deadbands if deadbands is not None else {}
+        self.integrity = integrity
+        self.dispatcher = Dispatcher()
         self.subscriptions = {}
+        self.stats_sources = {}
+        self.remove_listeners = []
+        # The number of devices in each fleet that we update on each tick
+        self._fleets = {}
 
     def dispose(self):
-        """Stop the simulated system, shutting down all devices."""
-        LOGGER.debug("Unsubscribing by system from models")
-        for s in self.subscriptions.values():
-            s.dispose()
-        self.subscriptions = []
+        """Stop the simulated system, shutting down all devices.
+
+        Each device is removed as by remove_model, so the remove listeners
+        release what they hold for the devices.
+        """
+        LOGGER.debug("Removing all devices from the system")
+        for mrid in list(self._devices):
+            self._remove(mrid)
+
+        for unsubscribe in self.subscriptions.values():
+            unsubscribe()
+        self.subscriptions.clear()
 
-    def subscribe(self, cb):
-        """Get an observable for changes published by devices in the system.
+        for fleet in self._fleets:
+            fleet.owners -= 1
+            self.scheduler.remove_tick_callback(fleet.update)
+        self._fleets.clear()
 
-        :param cb: The subscription handler.
+    def subscribe(self, cb, spec: Filter = None):
+        """Subscribe to changes published by devices in the system.
+
+        :param cb: The subscription handler, called with each envelope.
+        :param spec: If not none, only call the handler for the profiles that
+                     match the filter, such as the profiles of one device.
         :return: A function to dispose of the subscription.
         """
-        subject = rx.subjects.Subject()
-        disposable = subject.subscribe(cb)
+        return self.dispatcher.subscribe(cb, spec)
 
-        self.subjects.append(subject)
+    def subscribe_batch(self, cb):
+        """Subscribe to the lists of changes published by devices.
 
-        def unsubscribe():
-            disposable.dispose()
-            self.subjects.remove(subject)
+        Each list has the envelopes of one publish of a device.
 
-        return unsubscribe
+        :param cb: The subscription handler, called with each list.
+        :return: A function to dispose of the subscription.
+        """
+        return self.dispatcher.subscribe_batch(cb)
+
+    @property
+    def scheduler(self):
+        """Get the scheduler that drives publishing for the devices."""
+        if self._scheduler is None:
+            self._scheduler = get_scheduler()
+        return self._scheduler
 
     @property
     def devices(self):
-        """Get the list of devices in the system."""
-        return self._devices
+        """Get a view of the devices in the system, in the order added."""
+        return self._devices.values()
+
+    def device(self, ied_mrid):
+        """Get the device for the IED.
+
+        :param ied_mrid: The MRID of the IED.
+        :return: The device, or none if there is no such device.
+        """
+        return self._devices.get(ied_mrid)
+
+    def device_for_equipment(self, device_mrid):
+        """Get the device for the conducting equipment.
+
+        :param device_mrid: The MRID of the conducting equipment.
+        :return: The device, or none if there is no such device.
+        """
+        return self._by_equipment.get(device_mrid)
+
+    def devices_of_type(self, model_type):
+        """Get a view of the devices with a type of model.
 
-    def add_model(self, model):
+        :param model_type: The class of the model, such as SinglePhaseMeter.
+        :return: The devices, in the order added.
+        """
+        return self._by_type.get(model_type, {}).values()
+
+    def rate_for(self, model) -> timedelta:
+        """Get the rate at which a model publishes unless told otherwise.
+
+        :param model: The model to get the rate for.
+        :return: The rate for the type of the model or the default rate.
+        """
+        return self.type_rates.get(type(model), self.rate)
+
+    def add_model(self, model, rate: timedelta = None,
+                  deadband: Deadband = None):
         """Add a new model into the system.
 
         :param model: The model to add into the system. This function
                       constructs the appropriate messaging scaffolding to
                       publish information from the model.
+        :param rate: The rate at which the model publishes. If none, then use
+                     the rate for the type of model.
+        :param deadband: The deadband of the readings of the model. If none,
+                         then use the deadband for the type of model.
 
         :return: The UUID of the device.
         """
+        device = self._add(model, rate, deadband)
+        LOGGER.info("Added device %s - total number of devices %d",
+                    device.id, len(self._devices))
+        return device.id
+
+    def add_models(self, models, rate: timedelta = None,
+                   deadband: Deadband = None) -> list:
+        """Add many new models into the system in one pass.
+
+        :param models: The models to add into the system.
+        :param rate: The rate at which the models publish. If none, then use
+                     the rate for the type of each model.
+        :param deadband: The deadband of the readings of the models. If
+                         none, then use the deadband for the type of each
+                         model.
+
+        :return: The UUIDs of the devices, in the order of the models.
+        """
+        ied_mrids = [self._add(model, rate, deadband).id for model in models]
+        LOGGER.info("Added %d devices - total number of devices %d",
+                    len(ied_mrids), len(self._devices))
+        return ied_mrids
+
+    def _add(self, model, rate: timedelta, deadband: Deadband = None):
+        """Create the device for a model and start publishing.
+
+        :param model: The model to add into the system.
+        :param rate: The rate at which the model publishes, or none.
+        :param deadband: The deadband of the readings of the model, or none.
+        :return: The device.
+        """
         ied_mrid = uuid.uuid4()
-        device = SimulatedDevice(ied_mrid, model)
 
-        def publish(profile):
-            self.publish(profile)
-        self.subscriptions[ied_mrid] = device.observable.subscribe(publish)
+        # Models that keep their state in a fleet are updated together once
+        # per tick rather than one at a time.
+        fleet = getattr(model, "fleet", None)
+        if isinstance(fleet, DeviceFleet):
+            if fleet not in self._fleets:
+                self.scheduler.add_tick_callback(fleet.update)
+                fleet.owners += 1
+            self._fleets[fleet] = self._fleets.get(fleet, 0) + 1
 
-        self._devices.append(device)
-        LOGGER.info("Added device %s - total number of devices %d",
-                    device.id, len(self._devices))
+        rate = rate if rate is not None else self.rate_for(model)
+        if deadband is None:
+            deadband = self.deadbands.get(type(model))
+        phase = (self.stagger.next_phase(rate)
+                 if self.stagger is not None else 0.0)
+        device = SimulatedDevice(ied_mrid, model, rate=rate,
+                                 scheduler=self.scheduler,
+                                 fixed_rate=self.fixed_rate,
+                                 catch_up=self.catch_up, phase=phase,
+                                 status_heartbeat=self.status_heartbeat,
+                                 deadband=deadband, integrity=self.integrity)
 
-        return ied_mrid
+        # The kind of model lets us route to subscribers that filter on it
+        self.subscriptions[ied_mrid] = device.subscribe_batch(
+            partial(self.dispatcher.publish_batch, kind=type(model)))
+
+        self._devices[ied_mrid] = device
+        self._by_equipment[device.device_mrid] = device
+        self._by_type.setdefault(type(model), {})[ied_mrid] = device
+        LOGGER.debug("Added device %s", device.id)
+        return device
 
     def publish(self, profile):
-        """Publish to profile to all subjects.
+        """Publish to profile to all subscribers.
 
         :param profile: The profile to publish.
         """
-        for subject in self.subjects:
-            subject.on_next(profile)
+        self.dispatcher.publish(profile)
+
+    def publish_batch(self, profiles: list):
+        """Publish profiles that were published together to all subscribers.
+
+        :param profiles: The list of profiles to publish.
+        """
+        self.dispatcher.publish_batch(profiles)
+
+    def add_remove_listener(self, listener):
+        """Add a function that is called when a device is removed.
+
+        This lets other parts of the application release what they hold for
+        the device.
+
+        :param listener: The function to call with the removed device.
+        :return: A function to stop calling the listener.
+        """
+        self.remove_listeners.append(listener)
+
+        def remove():
+            if listener in self.remove_listeners:
+                self.remove_listeners.remove(listener)
+        return remove
+
+    def add_stats_source(self, name: str, source):
+        """Add counters from another part of the application to the stats.
+
+        :param name: The name of the section for the counters.
+        :param source: The function, without arguments, that gets the
+                       counters as a dictionary.
+        """
+        self.stats_sources[name] = source
+
+    def stats(self, per_device: bool = False) -> dict:
+        """Get counters that describe whether the system keeps up.
+
+        :param per_device: If true, then include the counters of each device.
+        :return: The counters as a dictionary.
+        """
+        device_stats = [d.stats for d in self._devices.values()]
+        result = {
+            "scheduler": self.scheduler.stats(),
+            "publish": {
+                "fixedRate": self.fixed_rate,
+                "catchUp": self.catch_up.value,
+                "published": sum(s.published for s in device_stats),
+                "missedTicks": sum(s.missed_ticks for s in device_stats),
+                "suppressed": sum(s.suppressed for s in device_stats),
+                "maxLateness": max((s.max_lateness for s in device_stats),
+                                   default=0.0),
+            },
+        }
+        for name, source in self.stats_sources.items():
+            result[name] = source()
+        if per_device:
+            result["devices"] = {str(d.id): d.stats.as_dict()
+                                 for d in self._devices.values()}
+        return result
 
     def remove_model(self, mrid):
         """Remove an existing model from the system.
@@ -101,42 +321,91 @@ class SimulatedSystem(object):
 
         :return: True if a model was removed, otherwie false.
         """
-        found = False
-        device = next((d for d in self._devices if d.id == mrid), None)
-        if device is not None:
-            device.dispose()
-            self._devices.remove(device)
+        if self._remove(mrid):
             LOGGER.info("Removed device with ID %s", mrid)
-            found = True
-        else:
-            LOGGER.warning("Unable to find device with ID %s", mrid)
+            return True
 
-        # Try to remove the subscription
-        subscription = self.subscriptions.pop(mrid, None)
-        if subscription is not None:
-            subscription.dispose()
+        LOGGER.warning("Unable to find device with ID %s", mrid)
+        return False
+
+    def remove_models(self, mrids) -> list:
+        """Remove many existing models from the system in one pass.
+
+        :param mrids: The MRIDs of the IEDs to remove.
+
+        :return: The MRIDs of the IEDs that were removed. The others did not
+                 exist.
+        """
+        removed = [mrid for mrid in mrids if self._remove(mrid)]
+        LOGGER.info("Removed %d devices - total number of devices %d",
+                    len(removed), len(self._devices))
+        return removed
+
+    def _remove(self, mrid) -> bool:
+        """Stop a device publishing and release everything for it.
+
+        :param mrid: The MRID of the IED to remove.
+        :return: True if a model was removed, otherwise false.
+        """
+        device = self._devices.pop(mrid, None)
+        if device is None:
+            return False
+
+        self._unindex(device)
+        device.dispose()
+        for listener in self.remove_listeners:
+            listener(device)
+
+        unsubscribe = self.subscriptions.pop(mrid, None)
+        if unsubscribe is not None:
+            unsubscribe()
         else:
             LOGGER.warning("Unable to find subscription with ID %s", mrid)
+        return True
+
+    def _unindex(self, device):
+        """Remove the device from the secondary indexes.
+
+        :param device: The device that was removed.
+        """
+        if self._by_equipment.get(device.device_mrid) is device:
+            del self._by_equipment[device.device_mrid]
+
+        model_type = type(device.model)
+        of_type = self._by_type.get(model_type)
+        if of_type is not None:
+            of_type.pop(device.id, None)
+            if not of_type:
+                del self._by_type[model_type]
 
-        return found
+        fleet = getattr(device.model, "fleet", None)
+        count = self._fleets.get(fleet, 0)
+        if count == 1:
+            del self._fleets[fleet]
+            self.scheduler.remove_tick_callback(fleet.update)
+            fleet.owners -= 1
+        elif count > 1:
+            self._fleets[fleet] = count - 1
 
     def update_profile(self, device_mrid, profile):
         """Handle a control request encoded as a profile for a model.
 
         :param device_mrid: The MRID of the associated device.
         :param profile: The profile describing the control update.
+        :return: True if the profile was given to the device, otherwise
+                 false.
         """
         try:
             mrid = uuid.UUID(device_mrid)
         except ValueError:
             LOGGER.error("Profile MRID %s is not valid UUID.", device_mrid)
-            return
+            return False
 
-        # Find the device that that mrid
-        device = next((x for x in self._devices if x.device_mrid == mrid),
-                      None)
+        device = self._by_equipment.get(mrid)
 
         if device is not None:
             device.update_profile(profile)
-        else:
-            LOGGER.error("Device MRID %s does not exist.", device_mrid)
+            return True
+
+        LOGGER.error("Device MRID %s does not exist.", device_mrid)
+        return False
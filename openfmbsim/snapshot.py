@@ -0,0 +1,111 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""The last state that each device published, for reading without waiting."""
+
+
+class DeviceSnapshot(object):
+    """The last profiles that one device published.
+
+    We keep the envelope of each profile rather than an encoding of it, so
+    publishing does not encode anything for the snapshot. Devices only write
+    a profile when they publish it, so the profile in the last envelope of
+    each type still has what was published. Since devices publish on the
+    event loop, the snapshot must only be read from the event loop.
+    """
+
+    __slots__ = ("profiles", "version", "updated", "_view")
+
+    def __init__(self):
+        """Create the snapshot before the device has published."""
+        # The full name of each type of profile to its last envelope
+        self.profiles = {}
+        self.version = 0
+        self.updated = None
+        # The version and dict of the profiles when they were last decoded
+        self._view = None
+
+    def to_dict(self) -> dict:
+        """Get the profiles as dicts, by the full name of the type.
+
+        The profiles are converted the first time they are requested after
+        each publish, so reading does not slow down publishing. The dict of
+        an envelope is reused if a client already asked for it.
+        """
+        if self._view is None or self._view[0] != self.version:
+            profiles = {name: envelope.data
+                        for name, envelope in self.profiles.items()}
+            self._view = (self.version, profiles)
+        return self._view[1]
+
+
+class SnapshotCache(object):
+    """The last profiles that each device in the system published.
+
+    The cache subscribes to the system, and publishing only stores the
+    envelope of each profile, as described in DeviceSnapshot. Each change
+    increases the version of the device and of the cache, which readers use
+    to tell if anything changed.
+    """
+
+    def __init__(self, system):
+        """Create the cache and subscribe to the system.
+
+        :param system: The system with the devices.
+        """
+        self.system = system
+        self.version = 0
+        self._devices = {}
+        self._unsubscribe = system.subscribe_batch(self.update)
+        self._remove_listener = system.add_remove_listener(self.forget)
+
+    def __len__(self):
+        """Get the number of devices that have published."""
+        return len(self._devices)
+
+    def update(self, envelopes: list):
+        """Store the profiles of one publish of a device.
+
+        :param envelopes: The envelopes of the profiles.
+        """
+        for envelope in envelopes:
+            snapshot = self._devices.get(envelope.device_mrid)
+            if snapshot is None:
+                snapshot = DeviceSnapshot()
+                self._devices[envelope.device_mrid] = snapshot
+            full_name = envelope.profile.DESCRIPTOR.full_name
+            snapshot.profiles[full_name] = envelope
+            snapshot.updated = envelope.timestamp
+            snapshot.version += 1
+        self.version += 1
+
+    def forget(self, device):
+        """Release the snapshot of a device that was removed.
+
+        :param device: The device that was removed.
+        """
+        self._devices.pop(device.id, None)
+        self.version += 1
+
+    def get(self, ied_mrid) -> DeviceSnapshot:
+        """Get the snapshot of a device.
+
+        :param ied_mrid: The MRID of the IED.
+        :return: The snapshot, or none if the device has not published.
+        """
+        return self._devices.get(ied_mrid)
+
+    def dispose(self):
+        """Stop updating the cache."""
+        self._unsubscribe()
+        self._remove_listener()
@@ -0,0 +1,197 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Encoder that splices cached static bytes with freshly encoded fields."""
+
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# The wire type of length delimited fields, which includes messages.
+_LENGTH_DELIMITED = 2
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode an unsigned integer as a protobuf varint.
+
+    :param value: The value to encode.
+    :return: The encoded bytes.
+    """
+    if value < 0x80:
+        return bytes((value,))
+
+    data = bytearray()
+    while value >= 0x80:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def is_static_field(field) -> bool:
+    """Get if a top level field of a profile is the same for every publish.
+
+    These are the IED and the equipment, such as the meter or the breaker,
+    which only identify the device.
+
+    :param field: The field descriptor.
+    :return: True if the field is static, otherwise false.
+    """
+    message_type = field.message_type
+    if message_type is None or field.label == field.LABEL_REPEATED:
+        return False
+    if message_type.full_name == "commonmodule.IED":
+        return True
+    return "conductingEquipment" in message_type.fields_by_name
+
+
+def encode_field(tag: bytes, message) -> bytes:
+    """Encode a message as a length delimited field.
+
+    :param tag: The encoded tag of the field.
+    :param message: The message to encode.
+    :return: The encoded bytes.
+    """
+    data = message.SerializeToString()
+    return tag + encode_varint(len(data)) + data
+
+
+class SpliceEncoder(object):
+    """Encode profiles by reusing the bytes of the fields that never change.
+
+    A protobuf message is encoded as the concatenation of its fields, so we
+    encode the static fields of each profile once per device, and for every
+    publish only encode the fields that change and splice the two together.
+    The fields are kept in the order of their number, so the result is the
+    same as ``SerializeToString``.
+
+    The static fields must not change for the lifetime of a device. Call
+    ``forget`` when a device is removed so that we release the cached bytes.
+    """
+
+    def __init__(self, check: bool = False):
+        """Create a new encoder.
+
+        :param check: If true, then compare every result with the result of
+                      ``SerializeToString`` and fall back to that when they
+                      differ. This is slow, so is intended for testing.
+        """
+        self.check = check
+        # Maps the device to the layout of the fields of each profile type
+        self._layouts = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.mismatches = 0
+
+    def __len__(self):
+        """Get the number of cached layouts."""
+        return sum(len(layouts) for layouts in self._layouts.values())
+
+    def stats(self) -> dict:
+        """Get the counters that describe the use of the cache."""
+        return {
+            "layouts": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "mismatches": self.mismatches,
+        }
+
+    def encode(self, device_mrid: str, profile) -> bytes:
+        """Encode the profile for the device.
+
+        :param device_mrid: The MRID of the device that owns the profile.
+        :param profile: The profile encoded as an OpenFMB protobuf object.
+        :return: The encoded bytes.
+        """
+        full_name = profile.DESCRIPTOR.full_name
+        layouts = self._layouts.setdefault(device_mrid, {})
+        layout = layouts.get(full_name)
+        if layout is None:
+            self.misses += 1
+            layout = create_layout(profile)
+            layouts[full_name] = layout
+        else:
+            self.hits += 1
+
+        if not layout:
+            # The profile has fields that we cannot splice
+            return profile.SerializeToString()
+
+        data = b"".join(splice(layout, profile))
+
+        if self.check:
+            expected = profile.SerializeToString()
+            if data != expected:
+                LOGGER.warning("Spliced encoding of %s for %s differs",
+                               full_name, device_mrid)
+                self.mismatches += 1
+                del layouts[full_name]
+                return expected
+
+        return data
+
+    def forget(self, device_mrid: str):
+        """Release the cached layouts for a device.
+
+        :param device_mrid: The MRID of the device.
+        """
+        self._layouts.pop(device_mrid, None)
+
+
+def create_layout(profile) -> tuple:
+    """Create the layout of the fields of a profile.
+
+    :param profile: The profile to take the static fields from.
+    :return: A tuple with an item for each field. Each item is either the
+             bytes of a static field, or the name, tag and if the field is
+             repeated for a dynamic field. The tuple is empty if the profile
+             cannot be spliced.
+    """
+    layout = []
+    for field in sorted(profile.DESCRIPTOR.fields, key=lambda f: f.number):
+        if field.message_type is None:
+            return ()
+
+        tag = encode_varint((field.number << 3) | _LENGTH_DELIMITED)
+        if not is_static_field(field):
+            repeated = field.label == field.LABEL_REPEATED
+            layout.append((field.name, tag, repeated))
+        elif profile.HasField(field.name):
+            data = encode_field(tag, getattr(profile, field.name))
+            # Join neighbouring static fields into a single item
+            if layout and isinstance(layout[-1], bytes):
+                layout[-1] += data
+            else:
+                layout.append(data)
+
+    return tuple(layout)
+
+
+def splice(layout: tuple, profile):
+    """Generate the encoded parts of the profile.
+
+    :param layout: The layout from create_layout.
+    :param profile: The profile with the dynamic fields.
+    """
+    for item in layout:
+        if isinstance(item, bytes):
+            yield item
+            continue
+
+        name, tag, repeated = item
+        if repeated:
+            for message in getattr(profile, name):
+                yield encode_field(tag, message)
+        elif profile.HasField(name):
+            yield encode_field(tag, getattr(profile, name))
@@ -0,0 +1,152 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Profiles waiting to be sent to a browser as server sent events."""
+
+from datetime import timedelta
+import itertools
+import logging
+import sys
+from .dispatcher import Filter
+from .envelope import Envelope
+from .outbound import OutboundQueue, OverflowPolicy
+
+LOGGER = logging.getLogger(__name__)
+
+
+def json_data(envelope: Envelope) -> str:
+    """Get the data that we send for a profile to a browser, as JSON."""
+    return envelope.json
+
+
+class SseClient(object):
+    """The profiles waiting to be sent to one browser.
+
+    The client holds at most the latest profile for each device and type of
+    profile, so a new reading replaces a reading that has not been sent yet.
+    The memory of a client that is slow, such as a tab in the background, is
+    then bounded by the number of devices rather than by how long it is slow.
+
+    The client is behind while it has profiles waiting, and the lag is the
+    time since it last sent everything. Clients that are further behind than
+    the maximum lag are closed, so that the browser reconnects and starts
+    from the latest profiles.
+
+    The WebSocket stream uses the same client, sending binary frames rather
+    than JSON.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, event_loop=None, capacity: int = None,
+                 max_lag: timedelta = None, spec: Filter = None,
+                 encode=json_data, transport: str = "sse"):
+        """Create a new client.
+
+        :param event_loop: The event loop that sends to the client. If none,
+                           then use the current event loop.
+        :param capacity: If not none, the most profiles that may be waiting.
+                         Beyond this, the oldest waiting profile is dropped.
+        :param max_lag: If not none, close the client when it is further
+                        behind than this.
+        :param spec: If not none, the filter for the profiles that the client
+                     asked for.
+        :param encode: The function that gets the data to send for a profile
+                       from the envelope of the profile.
+        :param transport: The name of the transport, for the stats.
+        """
+        self.id = next(SseClient._ids)
+        self.capacity = capacity
+        self.queue = OutboundQueue(
+            capacity if capacity is not None else sys.maxsize, event_loop,
+            OverflowPolicy.CONFLATE)
+        self.event_loop = self.queue.event_loop
+        self.max_lag = (max_lag.total_seconds() if max_lag is not None
+                        else None)
+        self.spec = spec
+        self.encode = encode
+        self.transport = transport
+        self.sent = 0
+        # The loop time when the client last had nothing waiting
+        self._behind_since = None
+
+    def __len__(self):
+        """Get the number of profiles waiting to be sent."""
+        return len(self.queue)
+
+    @property
+    def closed(self) -> bool:
+        """Get if the client was closed, so no longer takes profiles."""
+        return self.queue.closed
+
+    @property
+    def lag(self) -> float:
+        """Get the number of seconds since the client last sent everything."""
+        if not self.queue or self._behind_since is None:
+            return 0.0
+        return self.event_loop.time() - self._behind_since
+
+    def put(self, envelope: Envelope) -> bool:
+        """Add the data of a profile to send to the client.
+
+        :param envelope: The envelope of the profile.
+        :return: True if the profile was added, or false if it replaced a
+                 waiting profile or the client is closed.
+        """
+        if self.queue.closed:
+            return False
+
+        now = self.event_loop.time()
+        if not self.queue:
+            self._behind_since = now
+        lag = now - self._behind_since
+        if self.max_lag is not None and lag > self.max_lag:
+            LOGGER.warning("Closing SSE client %d that is %.1fs behind",
+                           self.id, lag)
+            self.close()
+            return False
+
+        key = (envelope.device_mrid, envelope.profile.DESCRIPTOR.full_name)
+        return self.queue.put_nowait(self.encode(envelope), key)
+
+    async def get_batch(self, max_items: int) -> list:
+        """Wait for profiles and take those that have waited longest.
+
+        :param max_items: The maximum number of profiles to take.
+        :return: The data of the profiles, which is empty once the client is
+                 closed.
+        """
+        batch = await self.queue.get_batch(max_items)
+        self.sent += len(batch)
+        return batch
+
+    def close(self):
+        """Stop taking profiles, and wake the sender so that it stops."""
+        self.queue.close()
+
+    def stats(self) -> dict:
+        """Get the counters that describe how well the client keeps up."""
+        queue = self.queue
+        return {
+            "id": self.id,
+            "transport": self.transport,
+            "depth": len(queue),
+            "capacity": self.capacity,
+            "highWater": queue.high_water,
+            "enqueued": queue.enqueued,
+            "sent": self.sent,
+            "conflated": queue.conflated,
+            "dropped": queue.dropped,
+            "lag": self.lag,
+            "closed": self.closed,
+        }
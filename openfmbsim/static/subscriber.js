@@ -224,12 +224,59 @@ const addOrUpdate = (evtData) => {
     iedElem.replaceChild(newDlElem, oldDlElem);
 }
 
+/**
+ * Apply the fields that changed to the last version of a profile. A null
+ * field was removed, and nested objects only have the fields that changed.
+ * Lists that kept their length have an object from the index of each item
+ * that changed to its changes.
+ * @param {object} base The last version of the profile, which is updated.
+ * @param {object} changes The fields that changed.
+ */
+const applyChanges = (base, changes) => {
+    for (const [name, value] of Object.entries(changes)) {
+        const previous = base[name];
+        if (value === null) {
+            delete base[name];
+        } else if (isObject(value) && (isObject(previous) || Array.isArray(previous))) {
+            applyChanges(previous, value);
+        } else {
+            base[name] = value;
+        }
+    }
+    return base;
+}
+
+const isObject = (value) => {
+    return value !== null && typeof value === "object" && !Array.isArray(value);
+}
+
+// The latest version of each profile, by the IED and type of profile
+const profiles = {};
+
+/**
+ * Handle a message from the delta stream, which is either a full profile or
+ * the fields that changed since the last message for the profile.
+ * @param {object} message The message that was received.
+ */
+const handleDelta = (message) => {
+    const key = message.ied + "/" + message.profile;
+    if (message.mode === "full") {
+        profiles[key] = message.data;
+    } else if (profiles[key]) {
+        applyChanges(profiles[key], message.data);
+    } else {
+        return;
+    }
+    addOrUpdate(profiles[key]);
+}
+
 document.addEventListener("DOMContentLoaded", () => {
-    // Subscribe to server sent events
-    const evtSource = new EventSource("/sse");
+    // Subscribe to server sent events, with the events that arrive between
+    // updates sent to us together in one compressed chunk, and only the
+    // fields that changed in each profile
+    const evtSource = new EventSource("/sse?maxHz=5&gzip=1&mode=delta");
     evtSource.onmessage = (e) => {
-        const evtData = JSON.parse(e.data);
-        addOrUpdate(evtData);
+        handleDelta(JSON.parse(e.data));
     };
 
     // Connect the UI buttons for devices
@@ -0,0 +1,209 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tracing of the time from a control to the readings that reflect it."""
+
+from bisect import bisect_left
+import time
+import uuid
+
+# The upper bounds of the buckets of the histograms, in seconds. The last
+# bucket has everything above the last bound.
+LATENCY_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0,
+                  2.0, 5.0, 10.0)
+
+
+class Histogram(object):
+    """Counts of values in fixed buckets, to summarize a distribution."""
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        """Create an empty histogram.
+
+        :param bounds: The sorted upper bounds of the buckets.
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value: float):
+        """Count a value.
+
+        :param value: The value, such as the latency in seconds.
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, fraction: float) -> float:
+        """Get the upper bound of the bucket that has a percentile.
+
+        :param fraction: The percentile as a fraction, such as 0.99.
+        :return: The bound, which is the maximum for the last bucket, or
+                 none if nothing was recorded.
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> dict:
+        """Get the summary and the count in each bucket."""
+        buckets = {str(bound): count
+                   for bound, count in zip(self.bounds, self.counts)}
+        buckets["+Inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": buckets,
+        }
+
+
+class LatencyTracer(object):
+    """Measures the time from a control to the readings that reflect it.
+
+    Each control is timestamped when it is received, which marks the device
+    as dirty. The next publish of the device records the time since the
+    earliest control that it has not yet published, for each type of profile
+    that it publishes. The time until the control is applied is recorded
+    separately, so the delay from queueing in the simulator can be told
+    apart from the delay until the next publish.
+    """
+
+    def __init__(self, system, clock=time.monotonic):
+        """Create the tracer and subscribe to the system.
+
+        :param system: The system with the devices.
+        :param clock: The function that gets the time in seconds.
+        """
+        self.system = system
+        self.clock = clock
+        self.to_apply = Histogram()
+        self.to_publish = {}
+        # The IED MRID of each dirty device to the time of the earliest
+        # control that it has not yet published, and whether the control
+        # has been applied
+        self._pending = {}
+        self.untracked = 0
+
+        self._unsubscribe = system.subscribe_batch(self.published)
+        system.add_remove_listener(self.forget)
+        system.add_stats_source("latency", self.stats)
+
+    def stats(self) -> dict:
+        """Get the histograms of the latency in seconds."""
+        return {
+            "pending": len(self._pending),
+            "untracked": self.untracked,
+            "controlToApply": self.to_apply.as_dict(),
+            "controlToPublish": {name: histogram.as_dict()
+                                 for name, histogram
+                                 in sorted(self.to_publish.items())},
+        }
+
+    def received(self, device_mrid: str):
+        """Timestamp a control for a device when it is received.
+
+        :param device_mrid: The MRID of the conducting equipment, as in the
+                            subject of the control.
+        """
+        now = self.clock()
+        try:
+            device = self.system.device_for_equipment(uuid.UUID(device_mrid))
+        except ValueError:
+            device = None
+        if device is None:
+            self.untracked += 1
+            return
+
+        pending = self._pending.get(device.id)
+        if pending is None:
+            self._pending[device.id] = [now, False]
+        elif pending[1]:
+            # The earlier control was applied, but not yet published, so
+            # keep its time and wait for this one to be applied too.
+            pending[1] = False
+
+    def applied(self, device_mrid: str):
+        """Record the time until a control was applied to a device.
+
+        :param device_mrid: The MRID of the conducting equipment.
+        """
+        device = self.system.device_for_equipment(uuid.UUID(device_mrid))
+        pending = self._pending.get(device.id) if device is not None else None
+        if pending is not None and not pending[1]:
+            pending[1] = True
+            self.to_apply.record(self.clock() - pending[0])
+
+    def rejected(self, device_mrid: str):
+        """Stop waiting for a control that could not be applied.
+
+        :param device_mrid: The MRID of the conducting equipment.
+        """
+        try:
+            device = self.system.device_for_equipment(uuid.UUID(device_mrid))
+        except ValueError:
+            return
+        pending = self._pending.get(device.id) if device is not None else None
+        if pending is not None and not pending[1]:
+            del self._pending[device.id]
+
+    def published(self, envelopes: list):
+        """Record the latency when a dirty device publishes.
+
+        :param envelopes: The envelopes of one publish of a device.
+        """
+        if not self._pending or not envelopes:
+            return
+        pending = self._pending.get(envelopes[0].device_mrid)
+        # Readings published before the control was applied do not
+        # reflect it
+        if pending is None or not pending[1]:
+            return
+
+        del self._pending[envelopes[0].device_mrid]
+        latency = self.clock() - pending[0]
+        for envelope in envelopes:
+            name = envelope.profile.DESCRIPTOR.full_name
+            histogram = self.to_publish.get(name)
+            if histogram is None:
+                histogram = self.to_publish[name] = Histogram()
+            histogram.record(latency)
+
+    def forget(self, device):
+        """Stop tracing a device that was removed.
+
+        :param device: The device that was removed.
+        """
+        self._pending.pop(device.id, None)
+
+    def dispose(self):
+        """Stop tracing."""
+        self._unsubscribe()
+        self._pending.clear()
@@ -14,23 +14,61 @@
 """Web server to visualize the devices and system information."""
 
 import asyncio
+import functools
+import hashlib
+import itertools
+import json
 import logging
+from datetime import timedelta
+import struct
+import sys
 import threading
 import uuid
-from google.protobuf.json_format import MessageToJson
-from quart import Quart, render_template, make_response, request
-from .devices.single_phase_breaker import SinglePhaseBreaker
+import zlib
+from quart import Quart, jsonify, render_template, make_response, request
+from quart import copy_current_websocket_context, websocket
+from quart.datastructures import MultiDict
+from .devices.device_types import DEVICE_TYPES
 from .devices.single_phase_generator import SinglePhaseGenerator
-from .devices.single_phase_meter import SinglePhaseMeter
-from .devices.single_phase_recloser import SinglePhaseRecloser
-from .devices.single_phase_solar import SinglePhaseSolar
+from .deadband import Deadband
+from .delta import delta_item, DeltaEncoder
+from .dispatcher import Filter
+from .envelope import as_envelope
+from .nats_server import cached_subject
+from .snapshot import SnapshotCache
+from .sse_client import SseClient
 
 LOGGER = logging.getLogger(__name__)
 
 app = Quart(__name__)
 app.clients = set()
+# The most profiles waiting for each client, and how far behind a client
+# may be before we close it. If none, then there is no limit.
+app.sse_capacity = None
+app.sse_max_lag = timedelta(seconds=30)
 running = True
 
+# The most profiles that we write to a client at once
+SSE_BATCH_SIZE = 500
+
+# The most devices that can be created in one request
+MAX_BULK_COUNT = 100000
+
+# The set-points that can be given when creating devices in bulk
+BULK_PARAMS = ("ph_v", "w", "hz")
+
+# The number of devices in a page when listing them, unless asked otherwise,
+# and the most that can be asked for
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# The name of each type of device, as used to create devices
+TYPE_NAMES = {model_type: name for name, model_type in DEVICE_TYPES.items()}
+
+# The lengths of the subject and payload in the frames of the WebSocket
+SUBJECT_LENGTH = struct.Struct(">H")
+PAYLOAD_LENGTH = struct.Struct(">I")
+
 # A lock for accessing the list of clients that we send information to
 lock = threading.Lock()
 
@@ -63,30 +101,307 @@ async def index():
 async def create():
     """Route handler to create a new device.
 
-    We currently do not allow the caller to specify anything about the device.
+    The caller may specify the rate in seconds at which the device publishes,
+    otherwise the device publishes at the rate for the type of device. The
+    caller may also specify the 'deadband' of each measurement, such as
+    {"W": 1000}, so that the device only publishes readings that move.
     """
     data = await request.json
     device_type = data["type"]
 
-    types = {
-        "breaker": SinglePhaseBreaker,
-        "generator": SinglePhaseGenerator,
-        "meter": SinglePhaseMeter,
-        "recloser": SinglePhaseRecloser,
-        "solar": SinglePhaseSolar,
-    }
-
-    constructor = types.get(device_type, None)
+    constructor = DEVICE_TYPES.get(device_type, None)
 
     if constructor is None:
         return "Invalid type", 400
 
+    try:
+        rate = parse_rate(data.get("rate", None))
+        deadband = parse_deadband(data.get("deadband", None))
+    except ValueError as ex:
+        return str(ex), 400
+
     device = constructor()
     LOGGER.info("Create a new device.")
-    app.system.add_model(device)
+    app.system.add_model(device, rate=rate, deadband=deadband)
     return "Created", 204
 
 
+def parse_rate(value) -> timedelta:
+    """Get the rate at which a caller asked devices to publish.
+
+    :param value: The number of seconds between publishes, or none.
+    :return: The rate, or none to use the rate for the type of device.
+    :raises ValueError: If the rate is not a positive number.
+    """
+    if value is None:
+        return None
+    try:
+        rate = timedelta(seconds=float(value))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid rate")
+    if rate <= timedelta(0):
+        raise ValueError("Invalid rate")
+    return rate
+
+
+def parse_deadband(value) -> Deadband:
+    """Get the deadband that a caller asked devices to have.
+
+    :param value: The dict of the name of the measurement to the deadband,
+                  or none.
+    :return: The deadband, or none to use the deadband for the type of
+             device.
+    :raises ValueError: If the deadband is not valid.
+    """
+    if value is None:
+        return None
+    return Deadband.from_dict(value)
+
+
+def parse_params(params) -> dict:
+    """Get the set-points that a caller asked new devices to have.
+
+    :param params: The dict of the name of the set-point to the value, or
+                   none. The names are those in BULK_PARAMS.
+    :return: The dict of the set-points.
+    :raises ValueError: If a set-point is not known or not a number.
+    """
+    if params is None:
+        return {}
+    if not isinstance(params, dict):
+        raise ValueError("Invalid params")
+
+    result = {}
+    for name, value in params.items():
+        if name not in BULK_PARAMS:
+            raise ValueError("Invalid param {0}".format(name))
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("Invalid value for {0}".format(name))
+        result[name] = value
+    return result
+
+
+def create_models(data: dict) -> list:
+    """Create the models that a caller asked for in a bulk request.
+
+    :param data: The request with the 'type' and 'count' of devices, and
+                 optionally the 'name_prefix' for the names of the devices
+                 and the 'params' from parse_params.
+    :return: The new models.
+    :raises ValueError: If the request is not valid.
+    """
+    constructor = DEVICE_TYPES.get(data.get("type"))
+    if constructor is None:
+        raise ValueError("Invalid type")
+
+    count = data.get("count", 1)
+    if isinstance(count, bool) or not isinstance(count, int):
+        raise ValueError("Invalid count")
+    if not 0 < count <= MAX_BULK_COUNT:
+        raise ValueError("Invalid count")
+
+    params = parse_params(data.get("params"))
+    prefix = data.get("name_prefix")
+    models = []
+    for index in range(count):
+        name = "{0}{1}".format(prefix, index) if prefix is not None else None
+        model = constructor(cond_equip_name=name)
+        for param, value in params.items():
+            setattr(model, param, value)
+        models.append(model)
+    return models
+
+
+@app.route("/devices/bulk", methods=['POST'])
+async def create_bulk():
+    """Route handler to create many devices of a type in one request.
+
+    The body is the 'type' and 'count' of the devices, and optionally the
+    'rate' in seconds, the 'name_prefix' that is followed by the index of
+    each device in its name, the 'params', which are the initial
+    set-points in BULK_PARAMS, and the 'deadband' of the readings. The
+    response has the MRIDs of the IEDs and the conducting equipment of the
+    new devices, in the same order.
+    """
+    data = await request.get_json()
+    if not isinstance(data, dict):
+        return "Invalid request", 400
+    try:
+        rate = parse_rate(data.get("rate", None))
+        deadband = parse_deadband(data.get("deadband", None))
+        models = create_models(data)
+    except ValueError as ex:
+        return str(ex), 400
+
+    mrids = app.system.add_models(models, rate=rate, deadband=deadband)
+    return jsonify({
+        "mrids": [str(mrid) for mrid in mrids],
+        "equipmentMrids": [str(model.mrid) for model in models],
+    }), 201
+
+
+@app.route("/devices/bulk", methods=['DELETE'])
+async def delete_bulk():
+    """Route handler to delete many devices in one request.
+
+    The body is either the list of 'mrids' of the IEDs or the 'type' of the
+    devices to delete. The response has the MRIDs of the IEDs that were
+    deleted, since the others did not exist.
+    """
+    data = await request.get_json()
+    if not isinstance(data, dict):
+        return "Invalid request", 400
+
+    if "type" in data:
+        model_type = DEVICE_TYPES.get(data["type"])
+        if model_type is None:
+            return "Invalid type", 400
+        mrids = [d.id for d in app.system.devices_of_type(model_type)]
+    else:
+        try:
+            mrids = [uuid.UUID(mrid) for mrid in data.get("mrids", [])]
+        except (AttributeError, TypeError, ValueError):
+            return "Not MRID", 400
+
+    removed = app.system.remove_models(mrids)
+    return jsonify({"removed": [str(mrid) for mrid in removed]})
+
+
+@app.route("/devices", methods=['GET'])
+async def list_devices():
+    """Route handler to get the last published state of the devices.
+
+    The query parameter 'type' limits the devices to those of a type, and
+    'offset' and 'limit' select a page of the devices in the order added.
+    The state comes from the snapshot cache, and the ETag changes only when
+    the devices on the page change or one of them publishes.
+    """
+    try:
+        offset, limit = parse_page(request.args)
+    except ValueError as ex:
+        return str(ex), 400
+
+    device_type = request.args.get("type")
+    if device_type is None:
+        devices = app.system.devices
+    elif device_type in DEVICE_TYPES:
+        devices = app.system.devices_of_type(DEVICE_TYPES[device_type])
+    else:
+        return "Invalid type", 400
+
+    page = list(itertools.islice(devices, offset, offset + limit))
+    etag = page_etag(page, len(devices), request.query_string)
+    if not_modified(etag):
+        return "", 304, {"ETag": etag}
+
+    response = jsonify({
+        "total": len(devices),
+        "offset": offset,
+        "limit": limit,
+        "devices": [device_to_dict(device) for device in page],
+    })
+    response.headers["ETag"] = etag
+    return response
+
+
+@app.route("/devices/<mrid>", methods=['GET'])
+async def get_device(mrid):
+    """Route handler to get the last published state of a device.
+
+    The ETag changes whenever the device publishes.
+    """
+    try:
+        device = app.system.device(uuid.UUID(mrid))
+    except ValueError:
+        return "Not MRID", 400
+    if device is None:
+        return "Not found", 404
+
+    etag = '"{0}.{1}"'.format(device.id, snapshot_version(device))
+    if not_modified(etag):
+        return "", 304, {"ETag": etag}
+
+    response = jsonify(device_to_dict(device))
+    response.headers["ETag"] = etag
+    return response
+
+
+def snapshot_version(device) -> int:
+    """Get the version of the last published state of a device.
+
+    :param device: The device.
+    :return: The version, which is zero if the device has not published.
+    """
+    snapshot = app.snapshots.get(device.id)
+    return snapshot.version if snapshot is not None else 0
+
+
+def page_etag(page: list, total: int, query: bytes) -> str:
+    """Get the ETag of a page of devices.
+
+    :param page: The devices on the page.
+    :param total: The number of devices of the type, which is in the page.
+    :param query: The query string, which selects the type and the page.
+    :return: The ETag, which is a hash of the MRID and version of each
+             device on the page.
+    """
+    digest = hashlib.blake2b(query, digest_size=16)
+    digest.update(str(total).encode())
+    for device in page:
+        digest.update(device.id.bytes)
+        digest.update(struct.pack("!Q", snapshot_version(device)))
+    return '"{0}"'.format(digest.hexdigest())
+
+
+def parse_page(args) -> tuple:
+    """Get the page of devices that a client asked for.
+
+    :param args: The query parameters of the request.
+    :return: The tuple of the offset and limit.
+    :raises ValueError: If either is not a number or is out of range.
+    """
+    offset = int(args.get("offset", 0))
+    limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    if offset < 0:
+        raise ValueError("Offset must not be negative")
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise ValueError("Limit must be from 1 to {0}".format(MAX_PAGE_SIZE))
+    return offset, limit
+
+
+def not_modified(etag: str) -> bool:
+    """Get whether the client already has the version of the resource.
+
+    :param etag: The ETag of the current version of the resource.
+    :return: True if the If-None-Match header of the request matches.
+    """
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or "W/" + etag in tags
+
+
+def device_to_dict(device) -> dict:
+    """Get the description and last published state of a device.
+
+    :param device: The device.
+    :return: The dict with the profiles by the full name of their type,
+             which is empty if the device has not published.
+    """
+    snapshot = app.snapshots.get(device.id)
+    updated = snapshot.updated if snapshot is not None else None
+    return {
+        "mrid": str(device.id),
+        "equipmentMrid": str(device.device_mrid),
+        "type": TYPE_NAMES.get(type(device.model)),
+        "name": getattr(device.model, "name", None),
+        "rate": device.rate.total_seconds(),
+        "updated": updated.isoformat() + "Z" if updated is not None else None,
+        "profiles": snapshot.to_dict() if snapshot is not None else {},
+    }
+
+
 @app.route("/devices/<mrid>", methods=['DELETE'])
 async def delete(mrid):
     """Route handler to create a new device.
@@ -101,54 +416,395 @@ async def delete(mrid):
     return ("OK", 200) if app.system.remove_model(mrid_obj) else ("Gone", 410)
 
 
+@app.route("/stats")
+async def stats():
+    """Route handler for counters that describe the load on the system.
+
+    Add the query parameter 'devices' to include the counters for each device.
+    """
+    per_device = request.args.get("devices", "false").lower() == "true"
+    return jsonify(app.system.stats(per_device=per_device))
+
+
+def arg_list(args, name: str) -> list:
+    """Get the values of a query parameter that may have many values.
+
+    :param args: The query parameters of the request.
+    :param name: The name of the parameter, which may be repeated or have a
+                 comma separated list of values.
+    :return: The list of values, which is empty if there are none.
+    """
+    return [value for item in args.getlist(name)
+            for value in item.split(",") if value]
+
+
+def parse_filter(args) -> Filter:
+    """Get the filter for the profiles that a client asked for.
+
+    The query parameter 'device' is the MRID of a device, 'type' is the name
+    of a type of device, as used to create devices, and 'profile' is the full
+    name of a type of profile. Each may have many values.
+
+    :param args: The query parameters of the request.
+    :return: The filter, or none if the client wants all profiles.
+    :raises ValueError: If a device is not an MRID or a type is not known.
+    """
+    devices = arg_list(args, "device")
+    types = arg_list(args, "type")
+    profiles = arg_list(args, "profile")
+    if not devices and not types and not profiles:
+        return None
+
+    unknown = [t for t in types if t not in DEVICE_TYPES]
+    if unknown:
+        raise ValueError("Unknown types {0}".format(", ".join(unknown)))
+
+    return Filter(profile_types=profiles or None,
+                  devices=[uuid.UUID(d) for d in devices] or None,
+                  kinds=[DEVICE_TYPES[t] for t in types] or None)
+
+
+def add_client(client: SseClient, delta: DeltaEncoder = None):
+    """Start sending profiles to a client.
+
+    Clients that want all profiles share the JSON from publish_async, while
+    clients with a filter have their own subscription to the system.
+
+    :param client: The client, with the filter for the profiles to send.
+    :param delta: If not none, the encoder of the client, which forgets the
+                  profiles of devices that are removed.
+    :return: A function to stop sending profiles to the client. This does
+             not close the client.
+    """
+    unsubscribe = None
+    if client.spec is not None:
+        unsubscribe = app.system.subscribe(
+            lambda item: client.put(as_envelope(item)), client.spec)
+    remove_listener = None
+    if delta is not None:
+        remove_listener = app.system.add_remove_listener(
+            lambda device: delta.forget(device.id))
+
+    with lock:
+        app.clients.add(client)
+
+    def remove():
+        if unsubscribe is not None:
+            unsubscribe()
+        if remove_listener is not None:
+            remove_listener()
+        with lock:
+            app.clients.discard(client)
+    return remove
+
+
+def sse_stats() -> dict:
+    """Get the counters that describe how well each SSE client keeps up."""
+    with lock:
+        clients = sorted(app.clients, key=lambda c: c.id)
+    return {
+        "clients": len(clients),
+        "perClient": [c.stats() for c in clients],
+    }
+
+
 @app.route('/sse')
 async def sse():
     """Route handler for server sent events.
 
     This is how we stream data to the front end. This async function
     only returns when there is no more data or the client disconnects.
+
+    The query parameters 'device', 'type' and 'profile' limit the profiles
+    that we send, as described in parse_filter. Readings that have not been
+    sent yet are replaced by newer readings, and clients that fall too far
+    behind are disconnected.
+
+    The query parameter 'maxHz' caps how often we write to the client, and
+    'gzip=1' compresses the stream if the client accepts gzip. With
+    'mode=delta', we send each profile in full once, and after that only
+    the fields that changed, as described in DeltaEncoder.
     """
-    # We have just been called to create a new client, so lock the list.
-    with lock:
-        queue = asyncio.Queue()
-        app.clients.add(queue)
+    try:
+        client, interval, gzip, delta = create_sse_client(request)
+    except ValueError as ex:
+        return str(ex), 400
+    remove_client = add_client(client, delta)
 
     async def send_events():
-        global running
-        while running:
-            try:
-                data = await queue.get()
-                event = ServerSentEvent(data)
-                yield event.encode()
-            except asyncio.CancelledError as ex:
-                LOGGER.info("Sending events canceled")
-                with lock:
-                    app.clients.remove(queue)
-                raise ex
-            except ConnectionAbortedError:
-                LOGGER.info("Connection aborted sending events")
-                with lock:
-                    app.clients.remove(queue)
-
-    response = await make_response(
-        send_events(),
-        {
-            'Content-Type': 'text/event-stream',
-            'Cache-Control': 'no-cache',
-            'Transfer-Encoding': 'chunked',
-        },
-    )
+        try:
+            async for chunk in event_chunks(client, interval, gzip, delta):
+                if not running:
+                    break
+                yield chunk
+            LOGGER.info("SSE client %d closed", client.id)
+        except asyncio.CancelledError as ex:
+            LOGGER.info("Sending events canceled")
+            raise ex
+        except ConnectionAbortedError:
+            LOGGER.info("Connection aborted sending events")
+        finally:
+            remove_client()
+            client.close()
+
+    headers = {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Transfer-Encoding': 'chunked',
+    }
+    if gzip:
+        headers['Content-Encoding'] = 'gzip'
+    response = await make_response(send_events(), headers)
     return response
 
 
+def create_sse_client(req) -> tuple:
+    """Create the client for an SSE request from its query parameters.
+
+    :param req: The request.
+    :return: The tuple of the client, the seconds between chunks or none,
+             whether to compress the stream, and the DeltaEncoder or none.
+    :raises ValueError: If a query parameter is not valid.
+    """
+    spec = parse_filter(req.args)
+    interval = parse_interval(req.args)
+    delta = parse_mode(req.args)
+    gzip = wants_gzip(req)
+
+    client = SseClient(capacity=app.sse_capacity, max_lag=app.sse_max_lag,
+                       spec=spec)
+    if delta is not None:
+        client.encode = delta_item
+    return client, interval, gzip, delta
+
+
+def parse_interval(args) -> float:
+    """Get the shortest time between chunks that a client asked for.
+
+    :param args: The query parameters of the request. The parameter 'maxHz'
+                 is the most chunks per second.
+    :return: The number of seconds, or none to send events as they arrive.
+    :raises ValueError: If the rate is not a positive number.
+    """
+    max_hz = args.get("maxHz")
+    if max_hz is None:
+        return None
+    try:
+        value = float(max_hz)
+    except ValueError:
+        raise ValueError("Invalid maxHz")
+    if not 0 < value < float("inf"):
+        raise ValueError("Invalid maxHz")
+    return 1.0 / value
+
+
+def parse_mode(args) -> DeltaEncoder:
+    """Get how a client asked for profiles to be sent.
+
+    :param args: The query parameters of the request. The parameter 'mode'
+                 is 'full' to send each profile in full, or 'delta' to send
+                 the fields that changed.
+    :return: The delta encoder for the client, or none to send in full.
+    :raises ValueError: If the mode is not known.
+    """
+    mode = args.get("mode", "full")
+    if mode == "delta":
+        return DeltaEncoder()
+    if mode != "full":
+        raise ValueError("Invalid mode")
+    return None
+
+
+def wants_gzip(req) -> bool:
+    """Get if a client asked for a compressed stream and can decode it.
+
+    :param req: The request, with the query parameter 'gzip'.
+    :return: True to compress the stream, otherwise false.
+    """
+    asked = req.args.get("gzip", "false").lower() in ("1", "true")
+    return asked and "gzip" in req.headers.get("Accept-Encoding", "")
+
+
+def encode_events(batch: list, delta: DeltaEncoder = None) -> bytes:
+    """Encode the data for profiles as server sent events.
+
+    :param batch: The data for the profiles from the client.
+    :param delta: If not none, the data is from delta_item, and we encode
+                  the fields that changed. Profiles that did not change are
+                  left out.
+    :return: The events.
+    """
+    if delta is not None:
+        batch = [m for m in map(delta.encode, batch) if m is not None]
+    return b"".join(ServerSentEvent(item).encode() for item in batch)
+
+
+async def event_chunks(client: SseClient, interval: float = None,
+                       gzip: bool = False, delta: DeltaEncoder = None):
+    """Get the chunks of the event stream for a client.
+
+    Each chunk has all of the events that are waiting, so that we write
+    once for many profiles. With an interval, we wait at least that long
+    between chunks, and newer readings replace older readings in the mean
+    time.
+
+    :param client: The client to send to.
+    :param interval: If not none, the shortest time in seconds between
+                     chunks.
+    :param gzip: If true, then compress the stream. Each chunk is flushed,
+                 so that the browser can decode it when it arrives.
+    :param delta: If not none, send the fields that changed, as for
+                  encode_events.
+    :return: An async generator of the chunks, which ends when the client
+             is closed.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if gzip else None
+    max_items = sys.maxsize if interval is not None else SSE_BATCH_SIZE
+    loop = client.event_loop
+
+    while True:
+        batch = await client.get_batch(max_items)
+        if not batch:
+            break
+        flushed = loop.time()
+        data = encode_events(batch, delta)
+        if compressor is not None and data:
+            data = compressor.compress(data)
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+
+        if interval is not None:
+            await asyncio.sleep(max(0.0, flushed + interval - loop.time()))
+
+    if compressor is not None:
+        yield compressor.flush()
+
+
+@functools.lru_cache(maxsize=65536)
+def frame_header(device_mrid, full_name: str) -> bytes:
+    """Get the start of the frames for a type of profile from a device.
+
+    :param device_mrid: The MRID of the device, as a UUID or string.
+    :param full_name: The full name of the type of profile.
+    :return: The length of the subject followed by the subject.
+    """
+    subject = cached_subject(device_mrid, full_name).encode("utf-8")
+    return SUBJECT_LENGTH.pack(len(subject)) + subject
+
+
+def encode_frame(envelope) -> bytes:
+    """Encode a profile as a frame of the binary WebSocket stream.
+
+    A frame is the length of the subject as an unsigned 16 bit integer, the
+    subject in UTF-8, the length of the payload as an unsigned 32 bit
+    integer and the payload, all big endian. The subject and payload are the
+    same as we publish on NATS, and the payload is shared with NATS through
+    the envelope.
+
+    :param envelope: The envelope of the profile.
+    :return: The frame.
+    """
+    payload = envelope.binary
+    header = frame_header(envelope.device_mrid,
+                          envelope.profile.DESCRIPTOR.full_name)
+    return b"".join((header, PAYLOAD_LENGTH.pack(len(payload)), payload))
+
+
+def parse_filter_message(message) -> Filter:
+    """Get the filter that a WebSocket client sent.
+
+    :param message: The JSON of an object with the optional lists 'device',
+                    'type' and 'profile', as for the query of parse_filter.
+    :return: The filter, or none if the client wants all profiles.
+    :raises ValueError: If the message is not a valid filter.
+    """
+    data = json.loads(message)
+    if not isinstance(data, dict):
+        raise ValueError("Filter must be an object")
+
+    items = []
+    for name in ("device", "type", "profile"):
+        values = data.get(name, [])
+        if isinstance(values, str):
+            values = [values]
+        if not isinstance(values, list):
+            raise ValueError("Filter {0} must be a list".format(name))
+        items.extend((name, str(value)) for value in values)
+    return parse_filter(MultiDict(items))
+
+
+async def send_frames(client: SseClient):
+    """Send the frames for a WebSocket client until the client is closed.
+
+    Each message has all of the frames that are waiting.
+
+    :param client: The client to send to.
+    """
+    while True:
+        batch = await client.get_batch(SSE_BATCH_SIZE)
+        if not batch:
+            return
+        await websocket.send(b"".join(batch))
+
+
+@app.websocket('/ws')
+async def ws():
+    """Route handler for the binary stream of profiles.
+
+    Each binary message has one or more frames, as described in
+    encode_frame. The query parameters filter the profiles as for /sse. The
+    client changes the filter by sending the JSON described in
+    parse_filter_message, and we reply with a JSON error if it is invalid.
+    """
+    try:
+        spec = parse_filter(websocket.args)
+    except ValueError as ex:
+        await websocket.send(json.dumps({"error": str(ex)}))
+        return
+
+    client = SseClient(capacity=app.sse_capacity, max_lag=app.sse_max_lag,
+                       spec=spec, encode=encode_frame, transport="ws")
+    remove_client = add_client(client)
+    sender = asyncio.ensure_future(
+        copy_current_websocket_context(send_frames)(client))
+
+    try:
+        while True:
+            # Stop if the client is closed before it sends anything else
+            receiver = asyncio.ensure_future(websocket.receive())
+            done, _ = await asyncio.wait(
+                {receiver, sender}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver not in done:
+                receiver.cancel()
+                break
+
+            try:
+                spec = parse_filter_message(receiver.result())
+            except ValueError as ex:
+                await websocket.send(json.dumps({"error": str(ex)}))
+                continue
+            remove_client()
+            client.spec = spec
+            remove_client = add_client(client)
+    finally:
+        remove_client()
+        client.close()
+        sender.cancel()
+
+
 def publish_async(profile):
     """Handle subscriptions from the observable to send to the event loop.
 
-    This bridges the reactive and async worlds in this application.
+    This bridges the reactive and async worlds in this application. The JSON
+    is created once and shared by all clients. Clients with a filter get
+    their profiles from their own subscription.
     """
+    envelope = as_envelope(profile)
     with lock:
-        for queue in app.clients:
-            queue.put_nowait(MessageToJson(profile[2]))
+        for client in app.clients:
+            if client.spec is None:
+                client.put(envelope)
 
 
 @app.before_serving
@@ -157,16 +813,26 @@ def before_serving():
     app.system.add_model(SinglePhaseGenerator())
 
 
-def create_web_server(host: str, port: int, loop, system):
+def create_web_server(host: str, port: int, loop, system,
+                      sse_capacity: int = None,
+                      sse_max_lag: timedelta = timedelta(seconds=30)):
     """Create and start an instance of the web server.
 
     :param host: The host to listen on, usually 'localhost'
     :param port: The port to listen on.
     :param system: The system to subscribe to for events.
+    :param sse_capacity: If not none, the most profiles waiting to be sent
+                         to each SSE client.
+    :param sse_max_lag: If not none, how far behind an SSE client may be
+                        before we disconnect it.
     """
     LOGGER.info("Starting web server...")
     app.system = system
+    app.sse_capacity = sse_capacity
+    app.sse_max_lag = sse_max_lag
+    app.snapshots = SnapshotCache(system)
     system.subscribe(publish_async)
+    system.add_stats_source("sse", sse_stats)
 
     # This does not return until canceled
     app.run(host, port=port, loop=loop)
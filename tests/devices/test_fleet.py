@@ -0,0 +1,141 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the device fleet module."""
+
+from datetime import datetime, timedelta
+import gc
+import pytest
+from openfmbsim.devices.fleet import DeviceFleet, FleetEquipment
+from openfmbsim.devices.single_phase_meter import SinglePhaseMeter
+
+
+def make_equipment(fleet, ph_v=120, w=1000):
+    equipment = FleetEquipment(fleet=fleet)
+    equipment.ph_v = ph_v
+    equipment.w = w
+    return equipment
+
+
+def test_allocate_when_full_then_grows():
+    fleet = DeviceFleet(capacity=2)
+    items = [make_equipment(fleet, w=i) for i in range(5)]
+
+    assert len(fleet) == 5
+    assert fleet.capacity >= 5
+    assert [item.w for item in items] == [0, 1, 2, 3, 4]
+
+
+def test_release_when_disposed_then_reuses_row():
+    fleet = DeviceFleet()
+    first = make_equipment(fleet)
+    index = first.index
+    first.dispose()
+
+    assert len(fleet) == 0
+    assert make_equipment(fleet).index == index
+
+
+def test_release_when_dropped_then_reuses_row():
+    fleet = DeviceFleet()
+    make_equipment(fleet)
+    gc.collect()
+
+    assert len(fleet) == 0
+
+
+def test_update_integrates_all_devices():
+    fleet = DeviceFleet()
+    supply = make_equipment(fleet, w=-3600)
+    demand = make_equipment(fleet, w=7200)
+    start = datetime.utcnow()
+    supply.last_update = start
+    demand.last_update = start
+
+    fleet.update(start + timedelta(hours=1))
+
+    assert supply.sup_wh == pytest.approx(-3600)
+    assert supply.dmd_wh == 0
+    assert demand.dmd_wh == pytest.approx(7200)
+    assert demand.last_update == start + timedelta(hours=1)
+
+
+def test_update_matches_update_one():
+    fleet = DeviceFleet()
+    vectorized = make_equipment(fleet, w=1234)
+    scalar = make_equipment(fleet, w=1234)
+    start = datetime.utcnow()
+    vectorized.last_update = start
+    scalar.last_update = start
+    now = start + timedelta(seconds=17)
+
+    fleet.update(now)
+    scalar.last_update = start
+    scalar.dmd_wh = 0
+    scalar.update_mmtr(now)
+
+    assert vectorized.dmd_wh == pytest.approx(scalar.dmd_wh)
+
+
+def test_update_when_inactive_then_no_energy():
+    fleet = DeviceFleet()
+    equipment = make_equipment(fleet)
+    equipment.active = False
+    start = datetime.utcnow()
+    equipment.last_update = start
+
+    fleet.update(start + timedelta(hours=1))
+
+    assert equipment.dmd_wh == 0
+    assert equipment.last_update == start + timedelta(hours=1)
+
+
+def test_update_calculates_current_and_va():
+    fleet = DeviceFleet()
+    equipment = make_equipment(fleet, ph_v=240, w=-480)
+    dead = make_equipment(fleet, ph_v=0, w=100)
+
+    fleet.update()
+
+    assert equipment.i_mag == -2
+    assert equipment.va == 480
+    assert dead.i_mag == 0
+
+
+def test_to_profiles_publishes_energy_from_last_update():
+    fleet = DeviceFleet()
+    # As if a system updates the fleet on each tick
+    fleet.owners = 1
+    meter = SinglePhaseMeter(fleet=fleet)
+    start = datetime.utcnow() - timedelta(hours=1)
+    meter.last_update = start
+
+    # Publishing does not integrate, the fleet does on each tick
+    list(meter.to_profiles())
+    assert meter.dmd_wh == 0
+    assert meter.last_update == start
+
+    fleet.update(start + timedelta(hours=1))
+    mp, = meter.to_profiles()
+    assert mp.meterReading.readingMMTR.DmdWh.actVal == \
+        pytest.approx(1000000, rel=1e-3)
+
+
+def test_to_profiles_when_not_in_system_then_integrates_energy():
+    meter = SinglePhaseMeter(fleet=DeviceFleet())
+    meter.last_update = datetime.utcnow() - timedelta(hours=1)
+
+    mp, = meter.to_profiles()
+
+    assert mp.meterReading.readingMMTR.DmdWh.actVal == \
+        pytest.approx(1000000, rel=1e-3)
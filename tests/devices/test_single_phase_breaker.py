@@ -53,3 +53,33 @@ def test_to_breaker_reading_when_power_is_set_neg():
     gm = sph.to_reading()
 
     assert gm.readingMMXU.W.phsA.cVal.mag.f.value == -2000
+
+
+def test_to_profiles_when_opened_updates_template():
+    spb = SinglePhaseBreaker()
+    list(spb.to_profiles())
+    spb.position = SinglePhaseBreaker.OPEN
+    reading, status = spb.to_profiles()
+
+    assert reading.breakerReading[0].readingMMXU.W.phsA.cVal.mag.f.value == 0
+    assert status.breakerStatus.statusAndEventXCBR.Pos.stVal == 2
+
+
+def test_to_profiles_when_not_status_then_only_reading():
+    spb = SinglePhaseBreaker()
+    profiles = list(spb.to_profiles(status=False))
+
+    assert [type(p).__name__ for p in profiles] == ["BreakerReadingProfile"]
+    assert [type(p).__name__ for p in spb.to_status_profiles()] == \
+        ["BreakerStatusProfile"]
+
+
+def test_position_when_changed_then_calls_status_listener():
+    spb = SinglePhaseBreaker()
+    changes = []
+    spb.status_listener = lambda: changes.append(spb.position)
+
+    spb.position = SinglePhaseBreaker.CLOSED
+    spb.position = SinglePhaseBreaker.OPEN
+
+    assert changes == [SinglePhaseBreaker.OPEN]
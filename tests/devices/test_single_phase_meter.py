@@ -53,3 +53,14 @@ def test_to_meter_reading_when_power_is_set_neg():
     gm = sph.to_meter_reading()
 
     assert gm.readingMMXU.W.phsA.cVal.mag.f.value == -2000
+
+
+def test_to_profiles_when_called_again_reuses_template():
+    sph = SinglePhaseMeter()
+    first, = sph.to_profiles()
+    sph.w = 2000
+    second, = sph.to_profiles()
+
+    assert second is first
+    assert second.meterReading.readingMMXU.W.phsA.cVal.mag.f.value == 2000
+    assert second.meterReading.readingMMXU.W.phsA.units.SIUnit != 0
@@ -53,3 +53,16 @@ def test_to_reading_when_power_is_set_neg():
     gm = sph.to_reading()
 
     assert gm.readingMMXU.W.phsA.cVal.mag.f.value == -2000
+
+
+def test_connect_mode_when_changed_then_calls_status_listener():
+    sps = SinglePhaseSolar()
+    changes = []
+    sps.status_listener = lambda: changes.append(sps.connect_mode)
+    mode = sps.connect_mode
+
+    sps.connect_mode = mode
+    sps.connect_mode = 0
+
+    assert changes == [0]
+    assert len(list(sps.to_profiles(status=False))) == 1
@@ -0,0 +1,84 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the control module."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from openfmbsim.control import ControlPipeline, decode_batch
+from openfmbsim.devices.single_phase_recloser import SinglePhaseRecloser
+from openfmbsim.simulated_system import SimulatedSystem
+import reclosermodule_pb2 as rm
+
+
+def control(device_mrid, closed: bool) -> tuple:
+    """Create the class, subject and data of a recloser control."""
+    profile = rm.RecloserControlProfile()
+    point = profile.recloserControl.recloserControlFSCC \
+        .switchControlScheduleFSCH.ValDCSG.crvPts.add()
+    point.Pos.ctlVal = closed
+    subject = "openfmb.reclosermodule.RecloserControlProfile." + \
+        str(device_mrid)
+    return (rm.RecloserControlProfile, subject, profile.SerializeToString())
+
+
+def test_decode_batch_when_invalid_data():
+    model = rm.RecloserControlProfile
+    decoded = decode_batch([(model, "openfmb.x.1234", b"\xff\xff"),
+                            (model, "openfmb.x.5678", "")])
+    assert decoded == [("1234", None), ("5678", None)]
+
+
+async def close_pipeline(pipeline):
+    """Close the pipeline and let the drain task see the cancellation."""
+    pipeline.close()
+    await asyncio.sleep(0)
+
+
+def test_submit_when_same_device_then_coalesces():
+    system = SimulatedSystem()
+    loop = asyncio.new_event_loop()
+    pipeline = ControlPipeline(system, loop)
+    for closed in (True, False, True):
+        pipeline.submit(*control("1234", closed))
+    pipeline.submit(*control("5678", True))
+
+    stats = system.stats()["control"]
+    assert stats["received"] == 4
+    assert stats["coalesced"] == 2
+    assert stats["depth"] == 2
+    pipeline.close()
+    loop.close()
+
+
+@pytest.mark.asyncio
+async def test_when_started_then_applies_latest_control():
+    system = SimulatedSystem()
+    recloser = SinglePhaseRecloser()
+    system.add_model(recloser)
+    pipeline = ControlPipeline(system, asyncio.get_event_loop(),
+                               executor=ThreadPoolExecutor(max_workers=1))
+    pipeline.submit(*control(recloser.mrid, True))
+    pipeline.submit(*control(recloser.mrid, False))
+    pipeline.submit(*control("329c465c-635c-4709-9912-89f1b2eaa22d", True))
+
+    pipeline.start()
+    await asyncio.sleep(0.05)
+    await close_pipeline(pipeline)
+
+    assert recloser.position == SinglePhaseRecloser.OPEN
+    stats = pipeline.stats()
+    assert stats["applied"] == 1
+    assert stats["rejected"] == 1
+    assert stats["depth"] == 0
@@ -0,0 +1,57 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the deadband module."""
+
+import pytest
+from openfmbsim.deadband import Deadband, ExceptionReporter
+
+
+def values(w=1000.0, v=120.0, a=8.0, hz=60.0) -> dict:
+    return {"W": w, "V": v, "A": a, "Hz": hz, "PF": 1}
+
+
+def test_from_dict_when_valid():
+    deadband = Deadband.from_dict({"W": 100, "Hz": 0.05})
+    assert deadband == Deadband(w=100.0, hz=0.05)
+
+
+@pytest.mark.parametrize("data", [
+    [],
+    {"VAr": 1},
+    {"W": "100"},
+    {"W": True},
+    {"V": -1},
+])
+def test_from_dict_when_invalid(data):
+    with pytest.raises(ValueError):
+        Deadband.from_dict(data)
+
+
+def test_due_when_within_deadband_then_suppresses():
+    reporter = ExceptionReporter(Deadband(w=100.0))
+    assert reporter.due(values(), 0.0)
+    assert not reporter.due(values(w=1050.0), 1.0)
+    # The change is from the last published value, not the last reading
+    assert reporter.due(values(w=1101.0), 2.0)
+    assert not reporter.due(values(w=1101.0), 3.0)
+    # Measurements without a deadband publish any change
+    assert reporter.due(values(w=1101.0, v=121.0), 4.0)
+
+
+def test_due_when_integrity_period_expires():
+    reporter = ExceptionReporter(Deadband(), integrity=10.0)
+    assert reporter.due(values(), 0.0)
+    assert not reporter.due(values(), 9.0)
+    assert reporter.due(values(), 10.0)
+    assert not reporter.due(values(), 19.0)
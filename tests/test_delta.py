@@ -0,0 +1,132 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the delta module."""
+
+import json
+from openfmbsim.delta import apply, delta_item, diff, DeltaEncoder
+from openfmbsim.devices.single_phase_breaker import SinglePhaseBreaker
+from openfmbsim.devices.single_phase_generator import SinglePhaseGenerator
+from openfmbsim.envelope import Envelope
+
+
+def test_diff_when_same_then_empty():
+    data = {"a": 1, "b": {"c": [1, 2]}}
+    assert diff(data, json.loads(json.dumps(data))) == {}
+
+
+def test_diff_has_only_changed_fields():
+    old = {"name": "gen", "w": {"mag": 1.0, "units": "W"}, "list": [1],
+           "removed": {"x": 1}}
+    new = {"name": "gen", "w": {"mag": 2.0, "units": "W"}, "list": [1, 2],
+           "added": True}
+
+    changes = diff(old, new)
+
+    assert changes == {"w": {"mag": 2.0}, "list": [1, 2], "added": True,
+                       "removed": None}
+    assert apply(old, changes) == new
+
+
+def test_diff_when_list_keeps_length_then_only_changed_items():
+    old = {"list": [{"a": 1, "b": 1}, {"a": 2}, 3]}
+    new = {"list": [{"a": 1, "b": 2}, {"a": 2}, 4]}
+
+    changes = diff(old, new)
+
+    assert changes == {"list": {"0": {"b": 2}, "2": 4}}
+    assert apply(old, changes) == new
+    assert old["list"][0]["b"] == 1
+
+
+def test_diff_when_list_changes_length_then_replaces():
+    old = {"list": [{"a": 1}]}
+    new = {"list": [{"a": 1}, {"a": 2}]}
+
+    assert diff(old, new) == {"list": new["list"]}
+
+
+def test_apply_when_type_changes_then_replaces():
+    old = {"a": {"b": 1}, "c": 1}
+    new = {"a": 2, "c": {"d": 1}}
+    assert apply(old, diff(old, new)) == new
+
+
+def test_delta_encoder_sends_full_then_changes():
+    model = SinglePhaseGenerator()
+    encoder = DeltaEncoder()
+
+    messages = []
+    for w in (1000.0, 2000.0):
+        model.w = w
+        profile = next(iter(model.to_profiles()))
+        messages.append(json.loads(encoder.encode(delta_item(
+            Envelope("1234", None, profile)))))
+
+    full, changes = messages
+    assert full["mode"] == "full"
+    assert full["ied"] == "1234"
+    assert full["profile"] == profile.DESCRIPTOR.full_name
+    assert changes["mode"] == "diff"
+    assert apply(full["data"], changes["data"]) == \
+        Envelope("1234", None, profile).data
+    # The names and MRIDs of the equipment did not change
+    assert "generatingUnit" not in changes["data"]
+    assert len(json.dumps(changes)) < len(json.dumps(full))
+
+
+def test_delta_encoder_sends_changed_breaker_readings():
+    model = SinglePhaseBreaker()
+    encoder = DeltaEncoder()
+
+    messages = []
+    for w in (1000.0, 2000.0):
+        model.w = w
+        profile = next(p for p in model.to_profiles()
+                       if p.DESCRIPTOR.name == "BreakerReadingProfile")
+        messages.append(json.loads(encoder.encode(delta_item(
+            Envelope("1234", None, profile)))))
+
+    full, changes = messages
+    readings = changes["data"]["breakerReading"]
+    assert list(readings) == ["0"]
+    # The names and MRIDs of the equipment did not change
+    assert "conductingEquipment" not in readings["0"]
+    assert apply(full["data"], changes["data"]) == \
+        Envelope("1234", None, profile).data
+
+
+def test_delta_encoder_when_nothing_changed_then_none():
+    encoder = DeltaEncoder()
+    item = ("1234", "openfmb.Profile", {"a": 1})
+
+    assert encoder.encode(item) is not None
+    assert encoder.encode(item) is None
+    assert len(encoder) == 1
+
+
+def test_delta_encoder_forget_then_sends_full():
+    encoder = DeltaEncoder()
+    encoder.encode(("1234", "openfmb.Profile", {"a": 1}))
+    encoder.encode(("5678", "openfmb.Profile", {"a": 1}))
+    encoder.encode(("5678", "openfmb.OtherProfile", {"a": 1}))
+
+    encoder.forget("1234")
+
+    assert len(encoder) == 2
+    # The profiles of the other device were kept, so are not sent again
+    assert encoder.encode(("5678", "openfmb.Profile", {"a": 1})) is None
+    assert encoder.encode(("5678", "openfmb.OtherProfile", {"a": 1})) is None
+    message = json.loads(encoder.encode(("1234", "openfmb.Profile",
+                                         {"a": 1})))
+    assert message["mode"] == "full"
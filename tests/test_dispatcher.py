@@ -0,0 +1,147 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the dispatcher module."""
+
+from openfmbsim.dispatcher import Dispatcher, Filter
+from openfmbsim.envelope import Envelope
+
+
+def test_publish_when_no_sinks():
+    dispatcher = Dispatcher()
+    dispatcher.publish(1)
+    dispatcher.publish_batch([1, 2])
+    assert len(dispatcher) == 0
+
+
+def test_publish_calls_sinks_in_order():
+    dispatcher = Dispatcher()
+    calls = []
+    dispatcher.subscribe(lambda m: calls.append(("a", m)))
+    dispatcher.subscribe(lambda m: calls.append(("b", m)))
+
+    dispatcher.publish(1)
+
+    assert calls == [("a", 1), ("b", 1)]
+
+
+def test_publish_batch_calls_sinks_with_each_message():
+    dispatcher = Dispatcher()
+    single = []
+    batches = []
+    dispatcher.subscribe(single.append)
+    dispatcher.subscribe_batch(batches.append)
+
+    dispatcher.publish_batch([1, 2])
+    dispatcher.publish(3)
+    dispatcher.publish_batch([])
+
+    assert single == [1, 2, 3]
+    assert batches == [[1, 2], [3]]
+
+
+def test_unsubscribe_removes_only_that_sink():
+    dispatcher = Dispatcher()
+    calls = []
+    sink = calls.append
+    first = dispatcher.subscribe(sink)
+    dispatcher.subscribe(sink)
+    unsubscribe_batch = dispatcher.subscribe_batch(sink)
+
+    first()
+    unsubscribe_batch()
+    dispatcher.publish(1)
+
+    assert calls == [1]
+    assert len(dispatcher) == 1
+
+
+def test_when_sink_unsubscribes_while_publishing_then_others_called():
+    dispatcher = Dispatcher()
+    calls = []
+    unsubscribe = None
+
+    def once(message):
+        calls.append(("once", message))
+        unsubscribe()
+    unsubscribe = dispatcher.subscribe(once)
+    dispatcher.subscribe(lambda m: calls.append(("always", m)))
+
+    dispatcher.publish(1)
+    dispatcher.publish(2)
+
+    assert calls == [("once", 1), ("always", 1), ("always", 2)]
+
+
+def test_clear_removes_all_sinks():
+    dispatcher = Dispatcher()
+    dispatcher.subscribe(print)
+    dispatcher.subscribe_batch(print)
+    dispatcher.clear()
+    assert len(dispatcher) == 0
+
+
+class Profile():
+    """A profile with only the name of the type."""
+
+    class DESCRIPTOR():
+        """The descriptor of the type of profile."""
+
+        full_name = "openfmb.Profile"
+
+
+def test_filter_matches_all_parts():
+    spec = Filter(profile_types=["openfmb.Profile"], devices=[1],
+                  kinds=[int])
+
+    assert spec.matches("openfmb.Profile", "1", int)
+    assert not spec.matches("openfmb.Other", "1", int)
+    assert not spec.matches("openfmb.Profile", "2", int)
+    assert not spec.matches("openfmb.Profile", "1", bool)
+    assert not spec.matches("openfmb.Profile", "1", None)
+    assert Filter().matches("openfmb.Other", "2", None)
+
+
+def test_publish_when_filtered_then_only_matching_sinks():
+    dispatcher = Dispatcher()
+    everything = []
+    device_one = []
+    floats = []
+    dispatcher.subscribe(everything.append)
+    dispatcher.subscribe(device_one.append, Filter(devices=["one"]))
+    dispatcher.subscribe(floats.append, Filter(kinds=[float]))
+    first = Envelope("one", None, Profile())
+    second = Envelope("two", None, Profile())
+
+    dispatcher.publish_batch([first, second], kind=float)
+    dispatcher.publish(second, kind=int)
+
+    assert everything == [first, second, second]
+    assert device_one == [first]
+    assert floats == [first, second]
+
+
+def test_when_filtered_sink_unsubscribes_then_routes_updated():
+    dispatcher = Dispatcher()
+    calls = []
+    unsubscribe = dispatcher.subscribe(calls.append,
+                                       Filter(profile_types=[
+                                           "openfmb.Profile"]))
+    envelope = Envelope("one", None, Profile())
+
+    dispatcher.publish(envelope)
+    unsubscribe()
+    dispatcher.publish(envelope)
+
+    assert calls == [envelope]
+    assert len(dispatcher) == 0
@@ -0,0 +1,73 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the envelope module."""
+
+from datetime import datetime
+from google.protobuf.json_format import MessageToDict
+import openfmbsim.envelope
+from openfmbsim.envelope import Envelope, as_envelope
+import generationmodule_pb2 as gm
+
+
+def test_envelope_is_tuple():
+    profile = gm.GenerationReadingProfile()
+    now = datetime.utcnow()
+    envelope = Envelope("1234", now, profile)
+
+    device_mrid, timestamp, value = envelope
+    assert (device_mrid, timestamp, value) == ("1234", now, profile)
+    assert envelope[2] is profile
+
+
+def test_binary_is_memoized():
+    profile = gm.GenerationReadingProfile()
+    profile.generatingUnit.conductingEquipment.mRID = "1234"
+    envelope = Envelope("1234", datetime.utcnow(), profile)
+
+    assert envelope.binary == profile.SerializeToString()
+    assert envelope.binary is envelope.binary
+
+
+def test_json_is_memoized(monkeypatch):
+    calls = []
+
+    def message_to_json(message):
+        calls.append(message)
+        return "{}"
+    monkeypatch.setattr(openfmbsim.envelope, "message_to_json",
+                        message_to_json)
+    envelope = Envelope("1234", datetime.utcnow(),
+                        gm.GenerationReadingProfile())
+
+    assert envelope.json == "{}"
+    assert envelope.json == "{}"
+    assert len(calls) == 1
+
+
+def test_data_is_memoized():
+    profile = gm.GenerationReadingProfile()
+    profile.generatingUnit.conductingEquipment.mRID = "1234"
+    envelope = Envelope("1234", datetime.utcnow(), profile)
+
+    assert envelope.data == MessageToDict(profile)
+    assert envelope.data is envelope.data
+
+
+def test_as_envelope_when_tuple():
+    profile = gm.GenerationReadingProfile()
+    envelope = as_envelope(("1234", None, profile))
+
+    assert isinstance(envelope, Envelope)
+    assert envelope.profile is profile
+    assert as_envelope(envelope) is envelope
@@ -0,0 +1,104 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the JSON encoder module."""
+
+from datetime import datetime
+import uuid
+from google.protobuf.json_format import MessageToJson
+import pytest
+from openfmbsim.devices.device_types import DEVICE_TYPES
+from openfmbsim.json_encoder import JsonEncoder, message_to_json
+from openfmbsim.nats_server import SUBSCRIBE_PROFILES_TYPES
+from openfmbsim.simulated_device import write_ied_info, write_message_info
+import commonmodule_pb2 as cm
+import generationmodule_pb2 as gm
+import reclosermodule_pb2 as rm
+
+
+def device_profiles():
+    """Get the profiles of every type of device as they are published."""
+    profiles = []
+    for name, device_type in sorted(DEVICE_TYPES.items()):
+        for profile in device_type().to_profiles():
+            if hasattr(profile, "readingMessageInfo"):
+                write_message_info(profile.readingMessageInfo.messageInfo,
+                                   uuid.uuid4(), datetime.utcnow())
+                write_ied_info(profile.ied, uuid.uuid4())
+            profiles.append(profile)
+    return profiles
+
+
+def control_profiles():
+    """Get each of the profiles that we subscribe to, with some values."""
+    profiles = []
+    for profile_type in SUBSCRIBE_PROFILES_TYPES:
+        profile = profile_type()
+        message_info = profile.controlMessageInfo.messageInfo
+        write_message_info(message_info, uuid.uuid4(), datetime.utcnow())
+        profiles.append(profile)
+
+    point = profiles[0].recloserControl.recloserControlFSCC\
+        .switchControlScheduleFSCH.ValDCSG.crvPts.add()
+    point.Pos.ctlVal = True
+    profiles[1].generatingUnit.conductingEquipment.mRID = str(uuid.uuid4())
+    return profiles
+
+
+@pytest.mark.parametrize("profile", device_profiles() + control_profiles(),
+                         ids=lambda p: p.DESCRIPTOR.name)
+def test_encode_when_profile_then_same_as_message_to_json(profile):
+    encoder = JsonEncoder()
+
+    assert encoder.encode(profile, indent=2) == MessageToJson(profile)
+    assert encoder.encode(profile) == MessageToJson(profile, indent=None)
+
+
+@pytest.mark.parametrize("profile_type", SUBSCRIBE_PROFILES_TYPES)
+def test_encode_when_empty_then_same_as_message_to_json(profile_type):
+    profile = profile_type()
+    assert message_to_json(profile) == MessageToJson(profile, indent=None)
+
+
+@pytest.mark.parametrize("value", [float("inf"), float("-inf"), float("nan"),
+                                   0.1, -0.0, 1e-10, 123456.789])
+def test_encode_when_float_then_same_as_message_to_json(value):
+    av = cm.AnalogueValue()
+    av.f.value = value
+
+    assert message_to_json(av) == MessageToJson(av, indent=None)
+
+
+def test_encode_when_int64_and_enum_then_same_as_message_to_json():
+    bcr = cm.BCR(actVal=2 ** 40)
+    bcr.units.value = cm.UnitSymbolKind_Wh
+
+    assert message_to_json(bcr) == MessageToJson(bcr, indent=None)
+    assert '"actVal": "1099511627776"' in message_to_json(bcr)
+
+
+def test_encode_when_repeated_then_same_as_message_to_json():
+    profile = rm.RecloserReadingProfile()
+    for w in (1.5, 2.5):
+        reading = profile.recloserReading.add()
+        reading.readingMMXU.W.phsA.cVal.mag.f.value = w
+
+    assert message_to_json(profile) == MessageToJson(profile, indent=None)
+
+
+def test_converter_for_is_cached():
+    encoder = JsonEncoder()
+    descriptor = gm.GenerationReadingProfile.DESCRIPTOR
+
+    assert encoder.converter_for(descriptor) is \
+        encoder.converter_for(descriptor)
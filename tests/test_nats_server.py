@@ -15,17 +15,32 @@
 
 import asyncio
 import collections
+from datetime import timedelta
 import pytest
 import socket
+import uuid
 from contextlib import closing
+from openfmbsim.envelope import Envelope
 from openfmbsim.nats_server import create_server, NatsSubscriber, NatsPublisher
+from openfmbsim.nats_server import cached_subject, lane_for
+from openfmbsim.nats_server import profile_to_subject
+from openfmbsim.devices.single_phase_generator import SinglePhaseGenerator
+from openfmbsim.outbound import OverflowPolicy
 from openfmbsim.simulated_system import SimulatedSystem
+from openfmbsim.splice_encoder import SpliceEncoder
+from openfmbsim.tracing import LatencyTracer
 import generationmodule_pb2 as gm
+import reclosermodule_pb2 as rm
 
 
 class MockNats():
     """A mocked NATS client so we can test without a connection."""
 
+    def __init__(self):
+        """Create the client with nothing published."""
+        self.published = []
+        self.flushes = 0
+
     async def connect(self, servers, loop):
         """Connect to the server."""
         return asyncio.Future()
@@ -38,6 +53,14 @@ class MockNats():
         """Close the connection."""
         return asyncio.Future()
 
+    async def publish(self, subject, payload):
+        """Publish the payload on the subject."""
+        self.published.append((subject, payload))
+
+    async def flush(self):
+        """Flush the connection."""
+        self.flushes += 1
+
 
 def is_nats_available():
     with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
@@ -63,12 +86,17 @@ def test_create_server_returns_canceler():
                              event_loop=event_loop, nats=MockNats())
 
     canceler()
+    # Let the connections close and the drain tasks see they were canceled
+    tasks = asyncio.all_tasks(event_loop)
+    event_loop.run_until_complete(
+        asyncio.gather(*tasks, return_exceptions=True))
+    event_loop.close()
 
 
 @pytest.mark.asyncio
 async def test_nats_subscriber_event_handler():
     system = SimulatedSystem()
-    event_loop = asyncio.new_event_loop()
+    event_loop = asyncio.get_event_loop()
     mock_nats = MockNats()
     subscriber = NatsSubscriber([], system, event_loop, mock_nats)
 
@@ -81,12 +109,34 @@ async def test_nats_subscriber_event_handler():
     msg = Message(data=encoded_model, subject="")
 
     await subscriber.event_handler(model, msg)
+    # Let the drain task see that it was canceled
+    subscriber.pipeline.close()
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_nats_subscriber_event_handler_when_tracer_then_marks_device():
+    system = SimulatedSystem()
+    generator = SinglePhaseGenerator()
+    system.add_model(generator)
+    tracer = LatencyTracer(system)
+    subscriber = NatsSubscriber([], system, asyncio.new_event_loop(),
+                                MockNats(), tracer=tracer)
+
+    Message = collections.namedtuple("Message", "data subject")
+    subject = profile_to_subject(str(generator.mrid),
+                                 gm.GenerationControlProfile)
+    await subscriber.event_handler(gm.GenerationControlProfile,
+                                   Message(data=b"", subject=subject))
+
+    assert tracer.stats()["pending"] == 1
+    assert subscriber.pipeline.stats()["received"] == 1
 
 
 @pytest.mark.asyncio
 async def test_nats_subscriber_event_handler_invalid_data():
     system = SimulatedSystem()
-    event_loop = asyncio.new_event_loop()
+    event_loop = asyncio.get_event_loop()
     mock_nats = MockNats()
     subscriber = NatsSubscriber([], system, event_loop, mock_nats)
 
@@ -99,6 +149,9 @@ async def test_nats_subscriber_event_handler_invalid_data():
 
     # We don't have much to test other than we didn't raise
     await subscriber.event_handler(model, msg)
+    # Let the drain task see that it was canceled
+    subscriber.pipeline.close()
+    await asyncio.sleep(0)
 
 
 @pytest.mark.asyncio
@@ -112,3 +165,159 @@ async def test_nats_publisher_publish():
 
     profile = gm.GenerationReadingProfile()
     publisher.publish_async(profile)
+
+
+def test_nats_publisher_encode_when_splice_encoder():
+    system = SimulatedSystem()
+    encoder = SpliceEncoder()
+    publisher = NatsPublisher([], system, asyncio.new_event_loop(),
+                              MockNats(), encoder=encoder)
+
+    profile = gm.GenerationReadingProfile()
+    profile.generatingUnit.conductingEquipment.mRID = "1234"
+
+    assert publisher.encode("1234", profile) == profile.SerializeToString()
+    assert encoder.misses == 1
+
+
+def test_nats_publisher_when_device_removed_then_forgets_layout():
+    system = SimulatedSystem()
+    encoder = SpliceEncoder()
+    NatsPublisher([], system, asyncio.new_event_loop(), MockNats(),
+                  encoder=encoder)
+    mrid = system.add_model(SinglePhaseGenerator())
+    device = system.device(mrid)
+    for profile in device.model.to_profiles():
+        encoder.encode(str(mrid), profile)
+    assert len(encoder) > 0
+
+    system.remove_model(mrid)
+
+    assert len(encoder) == 0
+
+
+@pytest.mark.asyncio
+async def test_nats_publisher_when_published_then_drains_in_batch():
+    system = SimulatedSystem()
+    mock_nats = MockNats()
+    publisher = NatsPublisher([], system, asyncio.get_event_loop(), mock_nats,
+                              batch_size=2)
+    await publisher.start()
+
+    profile = gm.GenerationReadingProfile()
+    device_mrid = uuid.uuid4()
+    for _ in range(3):
+        publisher.publish_async(Envelope(device_mrid, None, profile))
+    await asyncio.sleep(0.01)
+
+    subject = "openfmb.generationmodule.GenerationReadingProfile." + \
+        str(device_mrid)
+    assert mock_nats.published == [(subject, b"")] * 3
+    assert publisher.stats()["batches"] == 2
+    assert publisher.stats()["published"] == 3
+    latency = publisher.stats()["lanes"]["reading"]["latency"]
+    assert latency["count"] == 3
+
+    await publisher.close()
+
+
+@pytest.mark.asyncio
+async def test_nats_publisher_when_flush_interval_then_flushes():
+    system = SimulatedSystem()
+    mock_nats = MockNats()
+    publisher = NatsPublisher([], system, asyncio.get_event_loop(), mock_nats,
+                              flush_interval=timedelta(0))
+    await publisher.start()
+
+    publisher.publish_async(Envelope(uuid.uuid4(), None,
+                                     gm.GenerationReadingProfile()))
+    await asyncio.sleep(0.01)
+
+    assert mock_nats.flushes == 1
+    await publisher.close()
+
+
+@pytest.mark.asyncio
+async def test_nats_publisher_close_publishes_queue():
+    system = SimulatedSystem()
+    mock_nats = MockNats()
+    publisher = NatsPublisher([], system, asyncio.get_event_loop(), mock_nats)
+
+    publisher.publish_async(Envelope(uuid.uuid4(), None,
+                                     gm.GenerationReadingProfile()))
+    await publisher.close()
+
+    assert len(mock_nats.published) == 1
+
+
+def test_cached_subject_same_as_profile_to_subject():
+    profile = gm.GenerationReadingProfile()
+    device_mrid = uuid.uuid4()
+
+    subject = cached_subject(device_mrid, profile.DESCRIPTOR.full_name)
+    assert subject == profile_to_subject(str(device_mrid), profile)
+    assert subject is cached_subject(device_mrid,
+                                     profile.DESCRIPTOR.full_name)
+
+
+@pytest.mark.asyncio
+async def test_nats_publisher_when_block_and_full_then_pauses_scheduler():
+    system = SimulatedSystem()
+    publisher = NatsPublisher([], system, asyncio.get_event_loop(),
+                              MockNats(), queue_size=2,
+                              overflow=OverflowPolicy.BLOCK)
+
+    for _ in range(3):
+        publisher.publish_async(Envelope(uuid.uuid4(), None,
+                                         gm.GenerationReadingProfile()))
+    assert system.scheduler.paused
+
+    await publisher.start()
+    await asyncio.sleep(0.01)
+
+    assert not system.scheduler.paused
+    assert publisher.stats()["pauses"] == 1
+    await publisher.close()
+
+
+def test_nats_publisher_when_conflate_then_keeps_latest():
+    system = SimulatedSystem()
+    publisher = NatsPublisher([], system, asyncio.new_event_loop(),
+                              MockNats(), overflow=OverflowPolicy.CONFLATE)
+
+    device_mrid = uuid.uuid4()
+    for w in (1, 2):
+        profile = gm.GenerationReadingProfile()
+        profile.generationReading.readingMMXU.W.net.cVal.mag.f.value = w
+        publisher.publish_async(Envelope(device_mrid, None, profile))
+
+    (_, data), = publisher.queue.get_batch_nowait(10)
+    assert data == profile.SerializeToString()
+    assert publisher.stats()["conflated"] == 1
+
+
+def test_lane_for_when_status_or_reading():
+    assert lane_for("reclosermodule.RecloserStatusProfile") == "status"
+    assert lane_for("reclosermodule.RecloserEventProfile") == "status"
+    assert lane_for("metermodule.MeterReadingProfile") == "reading"
+
+
+def test_nats_publisher_when_congested_then_status_first():
+    system = SimulatedSystem()
+    publisher = NatsPublisher([], system, asyncio.new_event_loop(),
+                              MockNats(), queue_size=100)
+
+    for _ in range(100):
+        publisher.publish_async(Envelope(uuid.uuid4(), None,
+                                         gm.GenerationReadingProfile()))
+    status = rm.RecloserStatusProfile()
+    status.recloserStatus.statusAndEventXCBR.Pos.stVal = 2
+    publisher.publish_async(Envelope(uuid.uuid4(), None, status))
+
+    (subject, data), = publisher.queue.get_batch_nowait(1)
+    assert ".RecloserStatusProfile." in subject
+    assert data == status.SerializeToString()
+
+    stats = publisher.stats()
+    assert stats["depth"] == 100
+    assert stats["lanes"]["reading"]["depth"] == 100
@@ -0,0 +1,146 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the outbound module."""
+
+import asyncio
+import pytest
+from openfmbsim.outbound import OutboundQueue, OverflowPolicy, PriorityLanes
+
+
+def test_put_nowait_when_full_then_drops_oldest():
+    queue = OutboundQueue(capacity=2, event_loop=asyncio.new_event_loop())
+
+    for i in range(3):
+        assert queue.put_nowait(i)
+
+    assert queue.get_batch_nowait(10) == [1, 2]
+    assert queue.stats()["dropped"] == 1
+    assert queue.stats()["highWater"] == 2
+
+
+def test_put_nowait_when_conflate_then_replaces_same_key():
+    queue = OutboundQueue(capacity=10, event_loop=asyncio.new_event_loop(),
+                          policy=OverflowPolicy.CONFLATE)
+
+    assert queue.put_nowait("a1", "a")
+    assert queue.put_nowait("b1", "b")
+    assert not queue.put_nowait("a2", "a")
+    assert queue.put_nowait("x")
+    assert queue.put_nowait("y")
+
+    assert queue.get_batch_nowait(10) == ["a2", "b1", "x", "y"]
+    assert queue.stats()["conflated"] == 1
+    assert queue.stats()["dropped"] == 0
+
+
+def test_put_nowait_when_conflate_and_full_then_drops_oldest():
+    queue = OutboundQueue(capacity=2, event_loop=asyncio.new_event_loop(),
+                          policy=OverflowPolicy.CONFLATE)
+
+    for key in "abc":
+        queue.put_nowait(key, key)
+
+    assert queue.get_batch_nowait(10) == ["b", "c"]
+    assert queue.stats()["dropped"] == 1
+
+
+def test_put_nowait_when_block_then_pauses_until_drained():
+    calls = []
+    queue = OutboundQueue(capacity=4, event_loop=asyncio.new_event_loop(),
+                          policy=OverflowPolicy.BLOCK,
+                          pause=lambda: calls.append("pause"),
+                          resume=lambda: calls.append("resume"))
+
+    for i in range(6):
+        queue.put_nowait(i)
+
+    # Nothing is lost, even past the capacity
+    assert calls == ["pause"]
+    assert len(queue) == 6
+    assert queue.stats()["highWater"] == 6
+
+    queue.get_batch_nowait(3)
+    assert calls == ["pause"]
+    queue.get_batch_nowait(1)
+    assert calls == ["pause", "resume"]
+    assert queue.stats()["pauses"] == 1
+    assert queue.stats()["dropped"] == 0
+
+
+def test_get_batch_nowait_limits_batch():
+    queue = OutboundQueue(event_loop=asyncio.new_event_loop())
+    for i in range(5):
+        queue.put_nowait(i)
+
+    assert queue.get_batch_nowait(3) == [0, 1, 2]
+    assert queue.get_batch_nowait(3) == [3, 4]
+    assert queue.get_batch_nowait(3) == []
+
+
+@pytest.mark.asyncio
+async def test_get_batch_when_empty_then_waits():
+    queue = OutboundQueue()
+    getter = asyncio.ensure_future(queue.get_batch(10))
+    await asyncio.sleep(0)
+    assert not getter.done()
+
+    queue.put_nowait("a")
+    queue.put_nowait("b")
+
+    assert await asyncio.wait_for(getter, 1) == ["a", "b"]
+
+
+def create_lanes(loop, capacity=10) -> PriorityLanes:
+    return PriorityLanes([
+        ("high", OutboundQueue(capacity, loop, OverflowPolicy.CONFLATE)),
+        ("low", OutboundQueue(capacity, loop)),
+    ], loop)
+
+
+def test_priority_lanes_drain_high_priority_first():
+    lanes = create_lanes(asyncio.new_event_loop(), capacity=3)
+    for i in range(5):
+        lanes.put_nowait("low", i)
+    lanes.put_nowait("high", "a1", "a")
+    lanes.put_nowait("high", "a2", "a")
+
+    assert lanes.get_batch_nowait(2) == ["a2", 2]
+    assert lanes.get_batch_nowait(10) == [3, 4]
+    assert len(lanes) == 0
+    # The latency is recorded when the messages were published
+    assert lanes.stats()["lanes"]["low"]["latency"]["count"] == 0
+    lanes.task_done()
+
+    stats = lanes.stats()
+    assert stats["enqueued"] == 7
+    assert stats["dropped"] == 2
+    assert stats["conflated"] == 1
+    assert stats["lanes"]["high"]["latency"]["count"] == 1
+    assert stats["lanes"]["low"]["latency"]["count"] == 3
+
+
+@pytest.mark.asyncio
+async def test_priority_lanes_get_batch_when_empty_then_waits():
+    lanes = create_lanes(asyncio.get_event_loop())
+    getter = asyncio.ensure_future(lanes.get_batch(10))
+    await asyncio.sleep(0)
+    assert not getter.done()
+
+    lanes.put_nowait("low", "b")
+    lanes.put_nowait("high", "a")
+
+    assert await asyncio.wait_for(getter, 1) == ["a", "b"]
+
+    lanes.close()
+    assert await asyncio.wait_for(lanes.get_batch(10), 1) == []
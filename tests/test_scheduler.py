@@ -0,0 +1,166 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the scheduler module."""
+
+import asyncio
+from datetime import timedelta
+import pytest
+from openfmbsim.scheduler import PhaseStagger, TickScheduler, get_scheduler
+
+
+class CountingDevice():
+    """A device that counts how often it is published."""
+
+    def __init__(self, scheduler, rate=0.02):
+        """Create the device and reschedule at the rate."""
+        self.scheduler = scheduler
+        self.rate = rate
+        self.count = 0
+
+    def publish_profiles(self):
+        """Count and reschedule."""
+        self.count += 1
+        self.scheduler.call_later(self.rate, self)
+
+
+@pytest.mark.asyncio
+async def test_when_devices_added_then_publishes_in_batches():
+    scheduler = TickScheduler(tick=timedelta(milliseconds=10))
+    devices = [CountingDevice(scheduler) for _ in range(100)]
+    for device in devices:
+        scheduler.call_soon(device)
+
+    await asyncio.sleep(0.1)
+
+    assert all(d.count >= 2 for d in devices)
+    # All devices were added together, so they publish together
+    assert scheduler.max_batch == 100
+    assert scheduler.wakeups < sum(d.count for d in devices)
+
+
+@pytest.mark.asyncio
+async def test_when_devices_added_then_single_timer():
+    loop = asyncio.get_event_loop()
+    scheduler = TickScheduler(tick=timedelta(milliseconds=10))
+    before = len(loop._scheduled)
+    for _ in range(100):
+        scheduler.call_soon(CountingDevice(scheduler))
+
+    assert len(loop._scheduled) == before + 1
+
+
+@pytest.mark.asyncio
+async def test_when_removed_then_does_not_publish():
+    scheduler = TickScheduler(tick=timedelta(milliseconds=10))
+    device = CountingDevice(scheduler)
+    scheduler.call_soon(device)
+
+    assert scheduler.remove(device)
+    await asyncio.sleep(0.05)
+
+    assert device.count == 0
+    assert len(scheduler) == 0
+    assert scheduler._handle is None
+
+
+def test_remove_when_not_scheduled():
+    scheduler = TickScheduler(asyncio.new_event_loop())
+    assert scheduler.remove(object()) is False
+
+
+@pytest.mark.asyncio
+async def test_call_at_when_beyond_one_rotation():
+    scheduler = TickScheduler(tick=timedelta(milliseconds=5), slots=4)
+    device = CountingDevice(scheduler, rate=1)
+    scheduler.call_later(0.05, device)
+
+    await asyncio.sleep(0.03)
+    assert device.count == 0
+
+    await asyncio.sleep(0.05)
+    assert device.count == 1
+
+
+def test_call_at_publishes_in_first_tick_at_or_after_time():
+    loop = asyncio.new_event_loop()
+    scheduler = TickScheduler(loop, tick=timedelta(milliseconds=100))
+    device = object()
+    start = loop.time()
+
+    scheduler.call_at(start + 0.14, device)
+    assert scheduler._slot_of[device] == 2
+
+    # One tick, even though (1000.1 - 1000) / 0.1 is a little more than 1
+    scheduler._cursor_time = 1000.0
+    scheduler.call_at(1000.1, device)
+    assert scheduler._slot_of[device] == 1
+
+    scheduler.remove(device)
+    loop.close()
+
+
+def test_get_scheduler_when_same_loop():
+    loop = asyncio.new_event_loop()
+    assert get_scheduler(loop) is get_scheduler(loop)
+    assert get_scheduler(loop).event_loop is loop
+
+
+def test_phase_stagger_spreads_over_period():
+    stagger = PhaseStagger()
+    rate = timedelta(seconds=1)
+    phases = sorted(stagger.next_phase(rate) for _ in range(10))
+
+    assert phases[0] == 0
+    assert all(0 <= p < 1 for p in phases)
+    # No two of the phases are close together
+    gaps = [b - a for a, b in zip(phases, phases[1:])]
+    assert min(gaps) > 0.05
+
+
+@pytest.mark.asyncio
+async def test_tick_callback_runs_before_devices():
+    scheduler = TickScheduler(tick=timedelta(milliseconds=10))
+    calls = []
+    device = CountingDevice(scheduler)
+    device.publish_profiles = lambda: calls.append("device")
+    scheduler.add_tick_callback(lambda: calls.append("tick"))
+    scheduler.call_soon(device)
+
+    await asyncio.sleep(0.03)
+
+    assert calls[:2] == ["tick", "device"]
+
+
+@pytest.mark.asyncio
+async def test_when_paused_then_does_not_publish_until_resumed():
+    scheduler = TickScheduler(tick=timedelta(milliseconds=10))
+    device = CountingDevice(scheduler)
+    scheduler.call_soon(device)
+
+    scheduler.pause()
+    await asyncio.sleep(0.05)
+    assert device.count == 0
+    assert scheduler.stats()["paused"]
+
+    scheduler.resume()
+    await asyncio.sleep(0.03)
+    assert device.count >= 1
+    # Resuming does not publish every missed slot at once
+    assert scheduler.wakeups <= 4
+
+
+def test_resume_when_not_paused_does_nothing():
+    scheduler = TickScheduler(asyncio.new_event_loop())
+    scheduler.resume()
+    assert not scheduler.paused
@@ -15,6 +15,8 @@
 
 import os
 import pytest
+from openfmbsim.deadband import Deadband
+from openfmbsim.devices.single_phase_meter import SinglePhaseMeter
 from openfmbsim.server import main, parse_arguments
 
 
@@ -41,3 +43,74 @@ def test_parse_arguments_when_env_set_listen():
         assert args.listen == ("127.0.0.1", 8080)
     finally:
         os.environ["ODS_LISTEN"] = arg
+
+
+def test_parse_arguments_when_type_rate():
+    args = parse_arguments(["--listen", "localhost:5000",
+                            "--type-rate", "meter=0.5", "--rate", "2"])
+    assert args.rate.total_seconds() == 2
+    assert [r.total_seconds() for _, r in args.type_rate] == [0.5]
+
+
+def test_main_when_invalid_type_rate():
+    with pytest.raises(SystemExit):
+        main(["--type-rate", "unknown=1"])
+
+
+def test_parse_arguments_when_overflow():
+    args = parse_arguments(["--listen", "localhost:5000",
+                            "--overflow", "conflate", "--queue-size", "5"])
+    assert args.overflow == "conflate"
+    assert args.queue_size == 5
+
+
+def test_parse_arguments_when_sse_limits():
+    args = parse_arguments(["--listen", "localhost:5000",
+                            "--sse-queue-size", "100", "--sse-max-lag", "5"])
+    assert args.sse_queue_size == 100
+    assert args.sse_max_lag.total_seconds() == 5
+
+
+def test_parse_arguments_when_control_options():
+    args = parse_arguments(["--listen", "localhost:5000",
+                            "--control-queue-size", "50",
+                            "--control-threads", "2"])
+    assert args.control_queue_size == 50
+    assert args.control_threads == 2
+
+
+def test_parse_arguments_when_status_heartbeat():
+    args = parse_arguments(["--listen", "localhost:5000",
+                            "--status-heartbeat", "10"])
+    assert args.status_heartbeat.total_seconds() == 10
+
+
+def test_parse_arguments_when_no_status_heartbeat_then_off():
+    args = parse_arguments(["--listen", "localhost:5000"])
+    assert args.status_heartbeat is None
+
+
+def test_parse_arguments_when_deadband():
+    args = parse_arguments(["--listen", "localhost:5000",
+                            "--deadband", "meter:W=1000,V=1",
+                            "--integrity-period", "30"])
+    assert args.deadband == [(SinglePhaseMeter, Deadband(w=1000.0, v=1.0))]
+    assert args.integrity_period.total_seconds() == 30
+
+
+def test_parse_arguments_when_status_lane():
+    args = parse_arguments(["--listen", "localhost:5000",
+                            "--status-queue-size", "20",
+                            "--status-overflow", "drop-oldest"])
+    assert args.status_queue_size == 20
+    assert args.status_overflow == "drop-oldest"
+
+
+def test_main_when_invalid_deadband():
+    with pytest.raises(SystemExit):
+        main(["--deadband", "meter:VAr=1"])
+
+
+def test_main_when_invalid_queue_size():
+    with pytest.raises(SystemExit):
+        main(["--queue-size", "0"])
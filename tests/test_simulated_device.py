@@ -16,8 +16,11 @@
 import datetime
 import pytest
 import rx
-from openfmbsim.simulated_device import SimulatedDevice
+from openfmbsim.deadband import Deadband
+from openfmbsim.simulated_device import CatchUpPolicy, SimulatedDevice
+from openfmbsim.devices.single_phase_breaker import SinglePhaseBreaker
 from openfmbsim.devices.single_phase_generator import SinglePhaseGenerator
+from openfmbsim.devices.single_phase_meter import SinglePhaseMeter
 from openfmbsim.devices.single_phase_recloser import SinglePhaseRecloser
 import commonmodule_pb2 as cm
 import reclosermodule_pb2 as rm
@@ -71,3 +74,206 @@ def test_when_update_device_then_generates_status():
     dev.update_profile(rp)
 
     assert model.position == SinglePhaseRecloser.OPEN
+
+
+class EmptyModel():
+    """A model that does not generate any profiles."""
+
+    def __init__(self):
+        """Create the model, which is not yet disposed."""
+        self.disposed = False
+
+    def to_profiles(self):
+        """Get all of the profiles that this generates."""
+        return []
+
+    def dispose(self):
+        """Record that the model was disposed."""
+        self.disposed = True
+
+
+class ManualLoop():
+    """An event loop where we control the time."""
+
+    def __init__(self):
+        """Start the time at zero."""
+        self.now = 0.0
+        self.callbacks = []
+
+    def time(self):
+        """Get the present time."""
+        return self.now
+
+    def call_soon(self, callback):
+        """Record the callback so that the test can run it."""
+        self.callbacks.append(callback)
+
+
+class ManualScheduler():
+    """A scheduler that records the time each device is scheduled."""
+
+    def __init__(self):
+        """Create the scheduler with a manual loop."""
+        self.event_loop = ManualLoop()
+        self.scheduled = None
+
+    def call_later(self, delay, device):
+        """Record when the device should publish."""
+        self.scheduled = self.event_loop.time() + delay
+
+    def call_at(self, when, device):
+        """Record when the device should publish."""
+        self.scheduled = when
+
+    def remove(self, device):
+        """Forget when the device should publish."""
+        self.scheduled = None
+
+
+def test_when_fixed_rate_then_schedules_on_cadence():
+    scheduler = ManualScheduler()
+    dev = SimulatedDevice("ID", EmptyModel(), scheduler=scheduler,
+                          fixed_rate=True)
+
+    dev.publish_profiles()
+    assert scheduler.scheduled == 1.0
+
+    # We are late by a fraction, so the next publish is sooner
+    scheduler.event_loop.now = 1.25
+    dev.publish_profiles()
+    assert scheduler.scheduled == 2.0
+    assert dev.stats.last_lateness == 0.25
+    assert dev.stats.missed_ticks == 0
+
+
+def test_when_not_fixed_rate_then_drifts():
+    scheduler = ManualScheduler()
+    dev = SimulatedDevice("ID", EmptyModel(), scheduler=scheduler)
+
+    dev.publish_profiles()
+    scheduler.event_loop.now = 1.25
+    dev.publish_profiles()
+
+    assert scheduler.scheduled == 2.25
+    assert dev.stats.last_lateness == 0.25
+
+
+def test_when_fixed_rate_skip_then_counts_missed():
+    scheduler = ManualScheduler()
+    dev = SimulatedDevice("ID", EmptyModel(), scheduler=scheduler,
+                          fixed_rate=True, catch_up=CatchUpPolicy.SKIP)
+
+    dev.publish_profiles()
+    scheduler.event_loop.now = 3.5
+    dev.publish_profiles()
+
+    assert scheduler.scheduled == 4.0
+    assert dev.stats.missed_ticks == 2
+    assert dev.stats.max_lateness == 2.5
+
+
+def test_when_fixed_rate_burst_then_catches_up():
+    scheduler = ManualScheduler()
+    dev = SimulatedDevice("ID", EmptyModel(), scheduler=scheduler,
+                          fixed_rate=True, catch_up=CatchUpPolicy.BURST)
+
+    dev.publish_profiles()
+    scheduler.event_loop.now = 3.5
+    dev.publish_profiles()
+
+    # We are due again right away, and nothing was missed
+    assert scheduler.scheduled == 2.0
+    assert dev.stats.missed_ticks == 0
+
+
+def test_dispose_releases_device():
+    scheduler = ManualScheduler()
+    model = EmptyModel()
+    dev = SimulatedDevice("ID", model, scheduler=scheduler)
+    completed = []
+    dev.observable.subscribe(on_completed=lambda: completed.append(True))
+
+    dev.dispose()
+    dev.dispose()
+
+    assert scheduler.scheduled is None
+    assert model.disposed
+    assert completed == [True]
+
+
+def test_when_status_heartbeat_then_publishes_status_on_change():
+    scheduler = ManualScheduler()
+    model = SinglePhaseBreaker()
+    dev = SimulatedDevice("ID", model, scheduler=scheduler,
+                          status_heartbeat=datetime.timedelta(seconds=30))
+    published = []
+    dev.subscribe_batch(lambda envelopes: published.append(
+        [type(e.profile).__name__ for e in envelopes]))
+
+    dev.publish_profiles()
+    scheduler.event_loop.now = 1.0
+    dev.publish_profiles()
+
+    # Setting the same position is not a change
+    model.position = SinglePhaseBreaker.OPEN
+    model.position = SinglePhaseBreaker.OPEN
+    assert len(scheduler.event_loop.callbacks) == 1
+    scheduler.event_loop.callbacks.pop()()
+
+    # The change restarts the heartbeat
+    scheduler.event_loop.now = 30.5
+    dev.publish_profiles()
+    scheduler.event_loop.now = 31.0
+    dev.publish_profiles()
+
+    reading = "BreakerReadingProfile"
+    status = "BreakerStatusProfile"
+    assert published == [[reading, status], [reading], [status], [reading],
+                         [reading, status]]
+
+    dev.dispose()
+    assert model.status_listener is None
+
+
+def test_when_deadband_then_publishes_readings_that_move():
+    scheduler = ManualScheduler()
+    model = SinglePhaseMeter()
+    dev = SimulatedDevice("ID", model, scheduler=scheduler,
+                          deadband=Deadband(w=100.0),
+                          integrity=datetime.timedelta(seconds=60))
+    published = []
+    dev.subscribe_batch(published.append)
+
+    dev.publish_profiles()
+    scheduler.event_loop.now = 1.0
+    dev.publish_profiles()
+    model.w += 500
+    scheduler.event_loop.now = 2.0
+    dev.publish_profiles()
+    scheduler.event_loop.now = 62.0
+    dev.publish_profiles()
+
+    assert len(published) == 3
+    assert dev.stats.suppressed == 1
+    # We keep to the schedule while suppressed
+    assert scheduler.scheduled == 63.0
+
+
+def test_when_deadband_and_status_heartbeat_then_publishes_status_alone():
+    scheduler = ManualScheduler()
+    dev = SimulatedDevice("ID", SinglePhaseBreaker(), scheduler=scheduler,
+                          status_heartbeat=datetime.timedelta(seconds=30),
+                          deadband=Deadband())
+    published = []
+    dev.subscribe_batch(lambda envelopes: published.append(
+        [type(e.profile).__name__ for e in envelopes]))
+
+    dev.publish_profiles()
+    scheduler.event_loop.now = 1.0
+    dev.publish_profiles()
+    scheduler.event_loop.now = 30.0
+    dev.publish_profiles()
+
+    assert published == [["BreakerReadingProfile", "BreakerStatusProfile"],
+                         ["BreakerStatusProfile"]]
+    assert dev.stats.as_dict()["suppressed"] == 2
@@ -13,10 +13,15 @@
 # limitations under the License.
 """Tests of the simulated system module."""
 
+import asyncio
+from datetime import timedelta
 import uuid
 from unittest.mock import Mock
+from openfmbsim.dispatcher import Filter
+from openfmbsim.scheduler import TickScheduler
 from openfmbsim.simulated_system import SimulatedSystem
 from openfmbsim.devices.single_phase_generator import SinglePhaseGenerator
+from openfmbsim.devices.single_phase_meter import SinglePhaseMeter
 import generationmodule_pb2 as gm
 
 
@@ -69,12 +74,142 @@ def test_update_profile_when_mrid_matches_device():
 def test_subscribe_returns_disposable():
     system = SimulatedSystem()
 
-    # Adding a subscriber adds it to the list of subjects
+    # Adding a subscriber adds it to the sinks of the dispatcher
     def subscriber(profile):
         pass
     disposable = system.subscribe(cb=subscriber)
-    assert len(system.subjects) == 1
+    assert len(system.dispatcher) == 1
 
     # Disposing of it removes the item
     disposable()
-    assert len(system.subjects) == 0
+    assert len(system.dispatcher) == 0
+
+
+def test_when_device_publishes_then_delivers_to_sinks_and_batch_sinks():
+    # The loop never runs, so we publish the device ourselves
+    scheduler = TickScheduler(asyncio.new_event_loop())
+    system = SimulatedSystem(scheduler=scheduler)
+    received = []
+    batches = []
+    system.subscribe(received.append)
+    system.subscribe_batch(batches.append)
+    mrid = system.add_model(SinglePhaseGenerator())
+
+    system.device(mrid).publish_profiles()
+
+    assert len(batches) == 1
+    assert received == batches[0]
+    assert all(e.device_mrid == mrid for e in received)
+
+
+def test_add_model_when_rate_specified():
+    system = SimulatedSystem()
+    mrid = system.add_model(SinglePhaseGenerator(), timedelta(seconds=5))
+
+    device = next(d for d in system.devices if d.id == mrid)
+    assert device.rate == timedelta(seconds=5)
+
+
+def test_add_model_when_type_rate_specified():
+    rates = {SinglePhaseMeter: timedelta(seconds=2)}
+    system = SimulatedSystem(type_rates=rates)
+    system.add_model(SinglePhaseMeter())
+    system.add_model(SinglePhaseGenerator())
+
+    assert [d.rate.total_seconds() for d in system.devices] == [2, 1]
+
+
+def test_indexes_when_added_and_removed():
+    system = SimulatedSystem()
+    meter = SinglePhaseMeter()
+    meter_id = system.add_model(meter)
+    generator_id = system.add_model(SinglePhaseGenerator())
+
+    assert system.device(meter_id).model is meter
+    assert system.device_for_equipment(meter.mrid).id == meter_id
+    assert [d.id for d in system.devices_of_type(SinglePhaseMeter)] == \
+        [meter_id]
+
+    assert system.remove_model(meter_id)
+
+    assert system.device(meter_id) is None
+    assert system.device_for_equipment(meter.mrid) is None
+    assert list(system.devices_of_type(SinglePhaseMeter)) == []
+    assert [d.id for d in system.devices] == [generator_id]
+
+
+def test_remove_model_releases_fleet_tick_callback():
+    scheduler = Mock()
+    system = SimulatedSystem(scheduler=scheduler)
+    first = system.add_model(SinglePhaseMeter())
+    second = system.add_model(SinglePhaseMeter())
+    fleet = system.device(first).model.fleet
+    owners = fleet.owners
+    assert scheduler.add_tick_callback.call_count == 1
+
+    system.remove_model(first)
+    scheduler.remove_tick_callback.assert_not_called()
+
+    system.remove_model(second)
+    scheduler.remove_tick_callback.assert_called_once_with(fleet.update)
+    assert fleet.owners == owners - 1
+
+
+def test_remove_model_calls_remove_listeners():
+    system = SimulatedSystem()
+    removed = []
+    system.add_remove_listener(lambda device: removed.append(device.id))
+    mrid = system.add_model(SinglePhaseGenerator())
+
+    system.remove_model(mrid)
+
+    assert removed == [mrid]
+
+
+def test_dispose_releases_all_devices():
+    system = SimulatedSystem()
+    generator = SinglePhaseGenerator()
+    mrid = system.add_model(generator)
+    fleet = generator.fleet
+    in_use = len(fleet)
+
+    removed = []
+    system.add_remove_listener(lambda device: removed.append(device.id))
+
+    system.dispose()
+
+    assert len(system.devices) == 0
+    assert len(system.subscriptions) == 0
+    assert len(fleet) == in_use - 1
+    assert removed == [mrid]
+    assert fleet.update not in system.scheduler._tick_callbacks
+
+
+def test_subscribe_when_filtered_by_kind():
+    scheduler = TickScheduler(asyncio.new_event_loop())
+    system = SimulatedSystem(scheduler=scheduler)
+    received = []
+    system.subscribe(received.append, Filter(kinds=[SinglePhaseMeter]))
+    meter_id = system.add_model(SinglePhaseMeter())
+    generator_id = system.add_model(SinglePhaseGenerator())
+
+    system.device(meter_id).publish_profiles()
+    system.device(generator_id).publish_profiles()
+
+    assert received
+    assert all(e.device_mrid == meter_id for e in received)
+
+
+def test_add_models_and_remove_models():
+    system = SimulatedSystem()
+    meters = [SinglePhaseMeter() for _ in range(3)]
+    mrids = system.add_models(meters, rate=timedelta(seconds=2))
+
+    assert [system.device(m).model for m in mrids] == meters
+    assert all(d.rate.total_seconds() == 2 for d in system.devices)
+
+    removed = system.remove_models([mrids[0], uuid.uuid4(), mrids[2]])
+
+    assert removed == [mrids[0], mrids[2]]
+    assert [d.id for d in system.devices] == [mrids[1]]
+    assert len(system.subscriptions) == 1
@@ -0,0 +1,94 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the snapshot module."""
+
+import asyncio
+from openfmbsim.devices.single_phase_generator import SinglePhaseGenerator
+from openfmbsim.scheduler import TickScheduler
+from openfmbsim.simulated_system import SimulatedSystem
+from openfmbsim.snapshot import SnapshotCache
+
+
+def create_system():
+    # The loop never runs, so we publish the devices ourselves
+    return SimulatedSystem(scheduler=TickScheduler(asyncio.new_event_loop()))
+
+
+def test_when_device_publishes_then_stores_profiles():
+    system = create_system()
+    cache = SnapshotCache(system)
+    mrid = system.add_model(SinglePhaseGenerator())
+    assert cache.get(mrid) is None
+
+    system.device(mrid).publish_profiles()
+
+    snapshot = cache.get(mrid)
+    profiles = snapshot.to_dict()
+    assert "generationmodule.GenerationReadingProfile" in profiles
+    assert snapshot.updated is not None
+    assert cache.version == 1
+
+
+def test_publish_does_not_encode_profiles():
+    system = create_system()
+    cache = SnapshotCache(system)
+    mrid = system.add_model(SinglePhaseGenerator())
+
+    system.device(mrid).publish_profiles()
+
+    snapshot = cache.get(mrid)
+    envelope, = snapshot.profiles.values()
+    assert envelope._binary is None
+    assert envelope._data is None
+    assert snapshot.to_dict() == {
+        envelope.profile.DESCRIPTOR.full_name: envelope.data}
+
+
+def test_to_dict_when_not_published_again_then_reuses_dict():
+    system = create_system()
+    cache = SnapshotCache(system)
+    mrid = system.add_model(SinglePhaseGenerator())
+    device = system.device(mrid)
+    device.publish_profiles()
+
+    snapshot = cache.get(mrid)
+    first = snapshot.to_dict()
+    assert snapshot.to_dict() is first
+
+    device.publish_profiles()
+    assert snapshot.to_dict() is not first
+
+
+def test_when_device_removed_then_forgets_snapshot():
+    system = create_system()
+    cache = SnapshotCache(system)
+    mrid = system.add_model(SinglePhaseGenerator())
+    system.device(mrid).publish_profiles()
+    version = cache.version
+
+    system.remove_model(mrid)
+
+    assert len(cache) == 0
+    assert cache.version > version
+
+
+def test_dispose_stops_updating():
+    system = create_system()
+    cache = SnapshotCache(system)
+    cache.dispose()
+    mrid = system.add_model(SinglePhaseGenerator())
+
+    system.device(mrid).publish_profiles()
+
+    assert cache.get(mrid) is None
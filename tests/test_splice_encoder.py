@@ -0,0 +1,96 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the splice encoder module."""
+
+from datetime import datetime
+import uuid
+import pytest
+from openfmbsim.devices.device_types import DEVICE_TYPES
+from openfmbsim.simulated_device import write_ied_info, write_message_info
+from openfmbsim.splice_encoder import SpliceEncoder, encode_varint
+import commonmodule_pb2 as cm
+
+
+def profiles_for(device_type, device_mrid):
+    """Get the profiles of a new device as they would be published."""
+    profiles = list(device_type().to_profiles())
+    for profile in profiles:
+        if hasattr(profile, "readingMessageInfo"):
+            write_message_info(profile.readingMessageInfo.messageInfo,
+                               uuid.uuid4(), datetime.utcnow())
+            write_ied_info(profile.ied, device_mrid)
+    return profiles
+
+
+@pytest.mark.parametrize("value", [1, 127, 128, 300, 2 ** 32])
+def test_encode_varint(value):
+    ts = cm.Timestamp(seconds=value)
+    # The field tag is the first byte, the rest is the varint
+    assert encode_varint(value) == ts.SerializeToString()[1:]
+
+
+@pytest.mark.parametrize("name", sorted(DEVICE_TYPES))
+def test_encode_when_cached_then_same_as_serialize(name):
+    device_mrid = str(uuid.uuid4())
+    encoder = SpliceEncoder()
+    profiles = profiles_for(DEVICE_TYPES[name], device_mrid)
+
+    for _ in range(2):
+        for profile in profiles:
+            data = encoder.encode(device_mrid, profile)
+            assert data == profile.SerializeToString()
+
+            decoded = type(profile)()
+            decoded.ParseFromString(data)
+            assert decoded == profile
+
+    assert encoder.hits == len(profiles)
+    assert encoder.misses == len(profiles)
+
+
+def test_encode_when_static_field_changes_and_check_then_falls_back():
+    device_mrid = str(uuid.uuid4())
+    encoder = SpliceEncoder(check=True)
+    profile, = profiles_for(DEVICE_TYPES["meter"], device_mrid)
+    encoder.encode(device_mrid, profile)
+
+    profile.meter.conductingEquipment.namedObject.name.value = "renamed"
+
+    assert encoder.encode(device_mrid, profile) == profile.SerializeToString()
+    assert encoder.mismatches == 1
+    assert len(encoder) == 0
+
+
+def test_encode_when_scalar_fields_then_serializes():
+    encoder = SpliceEncoder()
+    ts = cm.Timestamp(seconds=10, fraction=20)
+
+    assert encoder.encode("device", ts) == ts.SerializeToString()
+
+
+def test_forget_releases_device():
+    encoder = SpliceEncoder()
+    for device_mrid in ("a", "b"):
+        for profile in profiles_for(DEVICE_TYPES["breaker"], device_mrid):
+            encoder.encode(device_mrid, profile)
+
+    encoder.forget("a")
+
+    assert len(encoder) == 2
+    assert encoder.stats()["layouts"] == 2
+    # The layouts of the other device were kept
+    misses = encoder.misses
+    for profile in profiles_for(DEVICE_TYPES["breaker"], "b"):
+        encoder.encode("b", profile)
+    assert encoder.misses == misses
@@ -0,0 +1,105 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the SSE client module."""
+
+from datetime import timedelta
+import pytest
+from openfmbsim.envelope import Envelope
+from openfmbsim.sse_client import SseClient
+import generationmodule_pb2 as gm
+import metermodule_pb2 as mm
+
+
+class ManualLoop():
+    """An event loop where we control the time."""
+
+    def __init__(self):
+        """Start the time at zero."""
+        self.now = 0.0
+
+    def time(self):
+        """Get the present time."""
+        return self.now
+
+
+def reading(device_mrid, value: str, profile_type=gm.GenerationReadingProfile):
+    """Get the envelope of a reading that is identified by the value."""
+    profile = profile_type()
+    profile.readingMessageInfo.messageInfo.identifiedObject.mRID.value = value
+    return Envelope(device_mrid, None, profile)
+
+
+def test_put_when_same_device_and_type_then_replaces(event_loop):
+    client = SseClient(event_loop)
+
+    assert client.put(reading("a", "1"))
+    assert not client.put(reading("a", "2"))
+    assert client.put(reading("b", "3"))
+    assert client.put(reading("a", "4", mm.MeterReadingProfile))
+
+    batch = client.queue.get_batch_nowait(10)
+    assert len(batch) == 3
+    # The latest reading keeps the place of the reading it replaced
+    assert '"2"' in batch[0] and '"3"' in batch[1] and '"4"' in batch[2]
+    assert client.stats()["conflated"] == 1
+
+
+def test_put_when_capacity_then_drops_oldest(event_loop):
+    client = SseClient(event_loop, capacity=2)
+    for device in ("a", "b", "c"):
+        client.put(reading(device, device))
+
+    assert len(client) == 2
+    assert client.stats()["dropped"] == 1
+
+
+def test_put_when_too_far_behind_then_closes():
+    loop = ManualLoop()
+    client = SseClient(loop, max_lag=timedelta(seconds=5))
+    client.put(reading("a", "1"))
+
+    loop.now = 4.0
+    assert client.lag == 4.0
+    assert client.put(reading("b", "2"))
+
+    loop.now = 6.0
+    assert not client.put(reading("c", "3"))
+    assert client.closed
+    assert client.stats()["closed"]
+
+
+def test_lag_when_sent_everything_then_zero():
+    loop = ManualLoop()
+    client = SseClient(loop, max_lag=timedelta(seconds=5))
+    client.put(reading("a", "1"))
+    loop.now = 4.0
+    client.queue.get_batch_nowait(10)
+
+    assert client.lag == 0.0
+    # We caught up, so we are only behind from now
+    loop.now = 8.0
+    assert client.put(reading("a", "2"))
+    loop.now = 12.0
+    assert client.put(reading("b", "3"))
+
+
+@pytest.mark.asyncio
+async def test_get_batch_when_closed_then_empty(event_loop):
+    client = SseClient(event_loop)
+    client.put(reading("a", "1"))
+
+    assert len(await client.get_batch(10)) == 1
+    client.close()
+    assert await client.get_batch(10) == []
+    assert client.stats()["sent"] == 1
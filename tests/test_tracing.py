@@ -0,0 +1,106 @@
+# Copyright 2019 Smarter Grid Solutions
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the tracing module."""
+
+import asyncio
+from openfmbsim.devices.single_phase_recloser import SinglePhaseRecloser
+from openfmbsim.scheduler import TickScheduler
+from openfmbsim.simulated_system import SimulatedSystem
+from openfmbsim.tracing import Histogram, LatencyTracer
+
+
+class FakeClock():
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        """Start the clock at zero."""
+        self.now = 0.0
+
+    def __call__(self):
+        """Get the time."""
+        return self.now
+
+
+def test_histogram_summarizes_values():
+    histogram = Histogram(bounds=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 3.0):
+        histogram.record(value)
+
+    summary = histogram.as_dict()
+    assert summary["count"] == 4
+    assert summary["min"] == 0.05
+    assert summary["max"] == 3.0
+    assert summary["p50"] == 0.1
+    assert summary["p99"] == 3.0
+    assert summary["buckets"] == {"0.1": 2, "1.0": 1, "+Inf": 1}
+
+
+def test_histogram_when_empty():
+    summary = Histogram().as_dict()
+    assert summary["count"] == 0
+    assert summary["mean"] is None
+    assert summary["p50"] is None
+
+
+def test_when_control_applied_then_records_until_next_publish():
+    # The loop never runs, so we publish the device ourselves
+    system = SimulatedSystem(scheduler=TickScheduler(asyncio.new_event_loop()))
+    clock = FakeClock()
+    tracer = LatencyTracer(system, clock=clock)
+    recloser = SinglePhaseRecloser()
+    device = system.device(system.add_model(recloser))
+
+    tracer.received(str(recloser.mrid))
+    clock.now = 0.01
+    # Readings published before the control is applied do not count
+    device.publish_profiles()
+    tracer.applied(str(recloser.mrid))
+    clock.now = 0.3
+    device.publish_profiles()
+    device.publish_profiles()
+
+    stats = system.stats()["latency"]
+    assert stats["pending"] == 0
+    assert stats["controlToApply"]["max"] == 0.01
+    to_publish = stats["controlToPublish"]
+    assert set(to_publish) == {"reclosermodule.RecloserReadingProfile",
+                               "reclosermodule.RecloserStatusProfile"}
+    assert all(h["count"] == 1 and h["max"] == 0.3
+               for h in to_publish.values())
+
+
+def test_received_when_unknown_device_then_untracked():
+    system = SimulatedSystem()
+    tracer = LatencyTracer(system)
+
+    tracer.received("329c465c-635c-4709-9912-89f1b2eaa22d")
+    tracer.received("not-a-mrid")
+
+    assert tracer.stats()["untracked"] == 2
+    assert tracer.stats()["pending"] == 0
+
+
+def test_when_rejected_or_removed_then_stops_waiting():
+    system = SimulatedSystem()
+    tracer = LatencyTracer(system)
+    recloser = SinglePhaseRecloser()
+    mrid = system.add_model(recloser)
+
+    tracer.received(str(recloser.mrid))
+    tracer.rejected(str(recloser.mrid))
+    assert tracer.stats()["pending"] == 0
+
+    tracer.received(str(recloser.mrid))
+    system.remove_model(mrid)
+    assert tracer.stats()["pending"] == 0
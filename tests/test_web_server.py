@@ -14,9 +14,22 @@
 """Tests of the web server module."""
 
 import asyncio
+import json
+import struct
+import zlib
 import pytest
+from quart.datastructures import MultiDict
+from openfmbsim.delta import delta_item, DeltaEncoder
+from openfmbsim.devices.single_phase_generator import SinglePhaseGenerator
+from openfmbsim.devices.single_phase_meter import SinglePhaseMeter
+from openfmbsim.envelope import Envelope
+from openfmbsim.scheduler import TickScheduler
 from openfmbsim.simulated_system import SimulatedSystem
-from openfmbsim.web_server import app, publish_async, ServerSentEvent
+from openfmbsim.snapshot import SnapshotCache
+from openfmbsim.sse_client import SseClient
+from openfmbsim.web_server import add_client, app, encode_frame, event_chunks
+from openfmbsim.web_server import parse_filter, parse_filter_message
+from openfmbsim.web_server import publish_async, ServerSentEvent, sse_stats
 import generationmodule_pb2 as gm
 
 
@@ -29,15 +42,44 @@ def test_server_send_event_encodes():
 @pytest.fixture(name='test_app')
 def _test_app(tmpdir):
     app.system = SimulatedSystem()
+    app.snapshots = SnapshotCache(app.system)
     return app
 
 
 def test_publish_async(test_app):
-    client_queue = asyncio.Queue()
-    test_app.clients.add(client_queue)
+    client = SseClient()
+    test_app.clients.add(client)
     profile = gm.GenerationReadingProfile()
     publish_async((None, None, profile))
-    assert client_queue.empty() is False
+    assert len(client) == 1
+    test_app.clients.discard(client)
+
+
+def test_publish_async_when_many_clients_then_shares_json(test_app):
+    clients = [SseClient() for _ in range(3)]
+    test_app.clients.update(clients)
+    profile = gm.GenerationReadingProfile()
+    profile.generatingUnit.conductingEquipment.mRID = "1234"
+    publish_async(Envelope("1234", None, profile))
+
+    messages = [c.queue.get_batch_nowait(1)[0] for c in clients]
+    assert all(m is messages[0] for m in messages)
+    test_app.clients.difference_update(clients)
+
+
+def test_publish_async_when_client_slow_then_keeps_latest(test_app):
+    client = SseClient()
+    test_app.clients.add(client)
+    profile = gm.GenerationReadingProfile()
+    info = profile.readingMessageInfo.messageInfo.identifiedObject
+    for value in (1.0, 2.0, 3.0):
+        info.mRID.value = str(value)
+        publish_async(Envelope("1234", None, profile))
+
+    assert len(client) == 1
+    assert "3.0" in client.queue.get_batch_nowait(1)[0]
+    assert sse_stats()["perClient"][0]["conflated"] == 2
+    test_app.clients.discard(client)
 
 
 @pytest.mark.asyncio
@@ -58,6 +100,23 @@ async def test_create_returns_204(test_app):
     assert len(test_app.system.devices) == 1
 
 
+@pytest.mark.asyncio
+async def test_create_with_rate_returns_204(test_app):
+    test_client = test_app.test_client()
+    data = {"type": "meter", "rate": 0.5}
+    response = await test_client.post("/devices", json=data)
+    assert response.status_code == 204
+    assert list(test_app.system.devices)[-1].rate.total_seconds() == 0.5
+
+
+@pytest.mark.asyncio
+async def test_create_with_invalid_rate_returns_400(test_app):
+    test_client = test_app.test_client()
+    data = {"type": "meter", "rate": -1}
+    response = await test_client.post("/devices", json=data)
+    assert response.status_code == 400
+
+
 @pytest.mark.asyncio
 async def test_delete_when_doesnt_exist_returns_410(test_app):
     test_client = test_app.test_client()
@@ -79,3 +138,363 @@ async def test_sse_returns_stream(test_app):
     test_client = test_app.test_client()
     response = await test_client.get("/sse")
     assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_sse_when_unknown_type_returns_400(test_app):
+    test_client = test_app.test_client()
+    response = await test_client.get("/sse?type=unknown")
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_sse_when_invalid_device_returns_400(test_app):
+    test_client = test_app.test_client()
+    response = await test_client.get("/sse?device=not-a-mrid")
+    assert response.status_code == 400
+
+
+def test_add_client_when_filtered_then_only_device():
+    scheduler = TickScheduler(asyncio.new_event_loop())
+    app.system = SimulatedSystem(scheduler=scheduler)
+    first = app.system.add_model(SinglePhaseGenerator())
+    second = app.system.add_model(SinglePhaseGenerator())
+    client = SseClient(spec=parse_filter(MultiDict(
+        [("device", str(first)), ("type", "generator,meter")])))
+    remove = add_client(client)
+
+    app.system.device(first).publish_profiles()
+    app.system.device(second).publish_profiles()
+    remove()
+    app.system.device(first).publish_profiles()
+
+    messages = client.queue.get_batch_nowait(len(client))
+    assert messages
+    assert all(str(first) in m for m in messages)
+    assert len(app.system.dispatcher) == 0
+    assert client not in app.clients
+
+
+def test_add_client_when_delta_then_forgets_removed_devices():
+    scheduler = TickScheduler(asyncio.new_event_loop())
+    app.system = SimulatedSystem(scheduler=scheduler)
+    mrid = app.system.add_model(SinglePhaseGenerator())
+    client = SseClient()
+    delta = DeltaEncoder()
+    remove = add_client(client, delta)
+    delta.encode((mrid, "openfmb.Profile", {"a": 1}))
+
+    app.system.remove_model(mrid)
+    remove()
+
+    assert len(delta) == 0
+    assert app.system.remove_listeners == []
+
+
+def reading(device_mrid: str) -> Envelope:
+    """Get the envelope of a reading from the device."""
+    profile = gm.GenerationReadingProfile()
+    profile.generatingUnit.conductingEquipment.mRID = device_mrid
+    return Envelope(device_mrid, None, profile)
+
+
+@pytest.mark.asyncio
+async def test_event_chunks_when_interval_then_one_chunk_per_flush(
+        event_loop):
+    client = SseClient(event_loop)
+    chunks = event_chunks(client, interval=0.05)
+    for device in ("a", "b", "c"):
+        client.put(reading(device))
+
+    first = await chunks.__anext__()
+    assert first.count(b"data: ") == 3
+
+    # Readings in the interval replace each other and are sent together
+    client.put(reading("a"))
+    client.put(reading("a"))
+    client.put(reading("b"))
+    started = event_loop.time()
+    second = await chunks.__anext__()
+    assert second.count(b"data: ") == 2
+    assert event_loop.time() - started >= 0.04
+    client.close()
+
+
+@pytest.mark.asyncio
+async def test_event_chunks_when_gzip_then_decodes_to_events(event_loop):
+    client = SseClient(event_loop)
+    client.put(reading("a"))
+    client.put(reading("b"))
+    client.close()
+
+    chunks = [c async for c in event_chunks(client, gzip=True)]
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # Each chunk can be decoded as soon as it arrives
+    first = decoder.decompress(chunks[0])
+    assert first.count(b"data: ") == 2
+    assert first.endswith(b"\r\n\r\n")
+    assert decoder.decompress(b"".join(chunks[1:])) == b""
+    assert decoder.eof
+
+
+@pytest.mark.asyncio
+async def test_sse_when_invalid_max_hz_returns_400(test_app):
+    test_client = test_app.test_client()
+    response = await test_client.get("/sse?maxHz=0")
+    assert response.status_code == 400
+
+
+def decode_frames(data: bytes) -> list:
+    """Get the subject and payload of each frame in a binary message."""
+    frames = []
+    while data:
+        (subject_length,) = struct.unpack_from(">H", data)
+        subject = data[2:2 + subject_length].decode("utf-8")
+        data = data[2 + subject_length:]
+        (payload_length,) = struct.unpack_from(">I", data)
+        frames.append((subject, data[4:4 + payload_length]))
+        data = data[4 + payload_length:]
+    return frames
+
+
+def test_encode_frame_has_nats_subject_and_payload():
+    envelope = reading("1234")
+    frames = decode_frames(encode_frame(envelope) + encode_frame(envelope))
+
+    subject = "openfmb.generationmodule.GenerationReadingProfile.1234"
+    assert frames == [(subject, envelope.binary)] * 2
+
+
+def test_parse_filter_message():
+    spec = parse_filter_message(json.dumps(
+        {"type": "meter", "profile": ["a", "b"]}))
+    assert spec.profile_types == {"a", "b"}
+    assert spec.devices is None
+    assert parse_filter_message("{}") is None
+
+    for message in ("not json", "[]", '{"device": 1}',
+                    '{"device": ["not-a-mrid"]}'):
+        with pytest.raises(ValueError):
+            parse_filter_message(message)
+
+
+@pytest.mark.asyncio
+async def test_ws_streams_frames_for_filter(event_loop):
+    app.system = SimulatedSystem(scheduler=TickScheduler(event_loop))
+    first = app.system.add_model(SinglePhaseGenerator())
+    second = app.system.add_model(SinglePhaseGenerator())
+    test_client = app.test_client()
+
+    async with test_client.websocket("/ws?device={0}".format(first)) as ws:
+        await asyncio.sleep(0.01)
+        app.system.device(second).publish_profiles()
+        app.system.device(first).publish_profiles()
+        frames = decode_frames(await ws.receive())
+        assert frames
+        assert all(s.endswith(str(first)) for s, _ in frames)
+
+        # Change the filter to the other device
+        await ws.send(json.dumps({"device": [str(second)]}))
+        await asyncio.sleep(0.01)
+        app.system.device(first).publish_profiles()
+        app.system.device(second).publish_profiles()
+        frames = decode_frames(await ws.receive())
+        assert all(s.endswith(str(second)) for s, _ in frames)
+
+        await ws.send("not json")
+        assert "error" in json.loads(await ws.receive())
+
+    # Closing the connection cancels the handler, which unsubscribes
+    await asyncio.sleep(0.01)
+    assert len(app.system.dispatcher) == 0
+
+
+@pytest.mark.asyncio
+async def test_event_chunks_when_delta_then_sends_changes(event_loop):
+    client = SseClient(event_loop, encode=delta_item)
+    client.put(reading("a"))
+    client.put(reading("b"))
+    client.close()
+    delta = DeltaEncoder()
+    # We already sent device a, and it has not changed
+    delta.encode(delta_item(reading("a")))
+
+    chunks = [c async for c in event_chunks(client, delta=delta)]
+
+    assert len(chunks) == 1
+    message = json.loads(chunks[0][len(b"data: "):])
+    assert message["mode"] == "full" and message["ied"] == "b"
+
+
+@pytest.mark.asyncio
+async def test_sse_when_invalid_mode_returns_400(test_app):
+    test_client = test_app.test_client()
+    response = await test_client.get("/sse?mode=unknown")
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_create_bulk_returns_mrids(test_app):
+    test_client = test_app.test_client()
+    data = {"type": "meter", "count": 3, "rate": 2, "name_prefix": "m-",
+            "params": {"w": 500}}
+    response = await test_client.post("/devices/bulk", json=data)
+    assert response.status_code == 201
+    body = await response.get_json()
+
+    devices = list(test_app.system.devices)
+    assert body["mrids"] == [str(d.id) for d in devices]
+    assert body["equipmentMrids"] == [str(d.device_mrid) for d in devices]
+    assert [d.model.name for d in devices] == ["m-0", "m-1", "m-2"]
+    assert all(d.model.w == 500 for d in devices)
+    assert all(d.rate.total_seconds() == 2 for d in devices)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data", [
+    {"type": "unknown", "count": 1},
+    {"type": "meter", "count": 0},
+    {"type": "meter", "count": "10"},
+    {"type": "meter", "count": 1, "rate": 0},
+    {"type": "meter", "count": 1, "params": {"name": "x"}},
+    {"type": "meter", "count": 1, "params": {"w": "x"}},
+])
+async def test_create_bulk_when_invalid_returns_400(test_app, data):
+    test_client = test_app.test_client()
+    response = await test_client.post("/devices/bulk", json=data)
+    assert response.status_code == 400
+    assert len(test_app.system.devices) == 0
+
+
+@pytest.mark.asyncio
+async def test_delete_bulk_by_mrids_and_type(test_app):
+    test_client = test_app.test_client()
+    meters = test_app.system.add_models([SinglePhaseMeter() for _ in range(3)])
+    generator = test_app.system.add_model(SinglePhaseGenerator())
+
+    data = {"mrids": [str(meters[0]), "329c465c-635c-4709-9912-89f1b2eaa22d"]}
+    response = await test_client.delete("/devices/bulk", json=data)
+    assert response.status_code == 200
+    assert (await response.get_json())["removed"] == [str(meters[0])]
+
+    response = await test_client.delete("/devices/bulk",
+                                        json={"type": "meter"})
+    body = await response.get_json()
+    assert body["removed"] == [str(m) for m in meters[1:]]
+    assert [d.id for d in test_app.system.devices] == [generator]
+
+
+@pytest.mark.asyncio
+async def test_delete_bulk_when_invalid_mrid_returns_400(test_app):
+    test_client = test_app.test_client()
+    response = await test_client.delete("/devices/bulk",
+                                        json={"mrids": ["not-a-mrid"]})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_device_returns_last_published_state(test_app):
+    test_client = test_app.test_client()
+    mrid = test_app.system.add_model(SinglePhaseMeter())
+    test_app.system.device(mrid).publish_profiles()
+
+    response = await test_client.get("/devices/" + str(mrid))
+    assert response.status_code == 200
+    body = await response.get_json()
+    assert body["mrid"] == str(mrid)
+    assert body["type"] == "meter"
+    assert list(body["profiles"]) == ["metermodule.MeterReadingProfile"]
+    assert body["updated"].endswith("Z")
+
+    etag = response.headers["ETag"]
+    response = await test_client.get("/devices/" + str(mrid),
+                                     headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    test_app.system.device(mrid).publish_profiles()
+    response = await test_client.get("/devices/" + str(mrid),
+                                     headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_get_device_when_doesnt_exist_returns_404(test_app):
+    test_client = test_app.test_client()
+    response = await test_client.get(
+        "/devices/329c465c-635c-4709-9912-89f1b2eaa22d"
+    )
+    assert response.status_code == 404
+
+    response = await test_client.get("/devices/not-a-mrid")
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_list_devices_by_type_and_page(test_app):
+    test_client = test_app.test_client()
+    meters = test_app.system.add_models([SinglePhaseMeter() for _ in range(3)])
+    test_app.system.add_model(SinglePhaseGenerator())
+
+    response = await test_client.get("/devices?type=meter&offset=1&limit=5")
+    assert response.status_code == 200
+    body = await response.get_json()
+    assert body["total"] == 3
+    assert [d["mrid"] for d in body["devices"]] == [str(m) for m in meters[1:]]
+    assert body["devices"][0]["profiles"] == {}
+
+    etag = response.headers["ETag"]
+    response = await test_client.get("/devices?type=meter&offset=1&limit=5",
+                                     headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    test_app.system.remove_model(meters[0])
+    response = await test_client.get("/devices",
+                                     headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert (await response.get_json())["total"] == 3
+
+
+@pytest.mark.asyncio
+async def test_list_devices_etag_only_changes_with_page(test_app):
+    test_client = test_app.test_client()
+    first, second = test_app.system.add_models(
+        [SinglePhaseMeter() for _ in range(2)])
+    url = "/devices?limit=1"
+
+    response = await test_client.get(url)
+    etag = response.headers["ETag"]
+    test_app.system.device(second).publish_profiles()
+    response = await test_client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = await test_client.get("/devices?limit=2",
+                                     headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    test_app.system.device(first).publish_profiles()
+    response = await test_client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_list_devices_when_invalid_query_returns_400(test_app):
+    test_client = test_app.test_client()
+    for query in ("type=unknown", "limit=0", "offset=-1", "limit=x"):
+        response = await test_client.get("/devices?" + query)
+        assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_create_bulk_with_deadband(test_app):
+    test_client = test_app.test_client()
+    data = {"type": "meter", "count": 2, "deadband": {"W": 500}}
+    response = await test_client.post("/devices/bulk", json=data)
+    assert response.status_code == 201
+    assert all(d.reporter.deadband.w == 500
+               for d in test_app.system.devices)
+
+    data["deadband"] = {"VAr": 1}
+    response = await test_client.post("/devices/bulk", json=data)
+    assert response.status_code == 400